@@ -3,28 +3,23 @@ from langchain_core.prompts import PromptTemplate
 from langchain_groq import ChatGroq
 from utils.types import State, BookingRecord
 from langchain_core.messages import AIMessage
-from utils.user_manager import UserManager
-from utils.booking_manager import BookingManager
+from utils.registry import get_user_manager, get_booking_manager
 from utils.input_handlers import get_booking_input
 from datetime import datetime
-import random
 
 def booking_node(state: State):
     # Get booking inputs with validation
     pickup, drop = get_booking_input()
     
     # Initialize managers
-    user_manager = UserManager()
-    booking_manager = BookingManager()
+    user_manager = get_user_manager()
+    booking_manager = get_booking_manager()
     
-    # Get all available drivers
-    available_drivers = list(user_manager.drivers.values())
-    if not available_drivers:
+    # Randomly select one of the available drivers
+    selected_driver = user_manager.random_driver()
+    if selected_driver is None:
         state["messages"].append(AIMessage(content="Sorry, no drivers are available at the moment. Please try again later."))
         return state
-    
-    # Randomly select a driver
-    selected_driver = random.choice(available_drivers)
     print(f"\nAssigning driver... Driver {selected_driver.driver_id} has been assigned to your ride.")
     
     # Create booking record
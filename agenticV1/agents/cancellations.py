@@ -3,15 +3,16 @@ from utils.types import State, DriverCancels, RiderCancels, CancellationEvent
 from langchain_core.messages import AIMessage
 from cancelation_models.driver_function import predict_driver_cancellation_decision
 from cancelation_models.rider_function import predict_rider_cancellation_decision
-from utils.user_manager import UserManager
-from utils.booking_manager import BookingManager
-from utils.cancellation_manager import CancellationManager
+from utils.registry import get_user_manager, get_booking_manager, get_cancellation_manager, get_rolling_features
+from utils.unit_of_work import UnitOfWork
+from utils.booking_manager import BookingNotActive
 from utils.input_handlers import get_cancellation_inputs, get_wait_time, get_cancellation_time
 
 def cancel_node(state: State) -> State:
-    user_manager = UserManager()
-    booking_manager = BookingManager()
-    cancellation_manager = CancellationManager()
+    user_manager = get_user_manager()
+    booking_manager = get_booking_manager()
+    cancellation_manager = get_cancellation_manager()
+    rolling_features = get_rolling_features()
     
     # Get active bookings for the rider
     active_bookings = booking_manager.get_rider_bookings(state["rider"].rider_id)
@@ -80,12 +81,6 @@ def cancel_node(state: State) -> State:
             rider_rating=rider.rider_rating
         )
         decision = predict_driver_cancellation_decision(cancel)
-        
-        # Update driver's cancellation stats
-        updated_driver = user_manager.update_driver_stats(driver_id, add_cancellation=True)
-        if not updated_driver:
-            state["messages"].append(AIMessage(content=f"Warning: Could not update driver statistics for ID {driver_id}."))
-
     else:  # rider cancelled
         # Create RiderCancels object for ML model
         cancel = RiderCancels(
@@ -97,35 +92,51 @@ def cancel_node(state: State) -> State:
             wait_time=wait_time,
             rider_rating=rider.rider_rating,
             rider_cancelation_rate=rider_cancellation_rate,
+            **rolling_features.rider_cancelation_rates(rider.rider_id),
             cancelation_time=cancellation_time
         )
         decision = predict_rider_cancellation_decision(cancel)
-        
-        # Update rider's cancellation stats
-        updated_rider = user_manager.update_rider_stats(rider.rider_id, add_cancellation=True)
-        if not updated_rider:
-            state["messages"].append(AIMessage(content=f"Warning: Could not update rider statistics for ID {rider.rider_id}."))
 
     # Save decision to cancellation event
     cancellation_event.decision = decision
-    
-    # Create cancellation record
-    cancellation_record = cancellation_manager.create_cancellation(
-        booking_id=booking_id,
-        rider_id=rider.rider_id,
-        driver_id=driver_id,
-        cancelled_by=who_cancelled,
-        arrived=arrived,
-        distance_from_pin=distance_from_pin,
-        wait_time=wait_time,
-        rider_rating=rider.rider_rating,
-        rider_cancellation_rate=rider_cancellation_rate,
-        cancellation_time=cancellation_time,
-        decision=decision
-    )
-    
-    # Cancel the booking in the booking manager
-    booking_manager.cancel_booking(booking_id)
+
+    # The prediction is made first, so the managers' locks are held only for the writes
+    try:
+        with UnitOfWork(user_manager, booking_manager, cancellation_manager):
+            # Another session may have cancelled the booking since it was read
+            booking_manager.require_active(booking_id)
+
+            if who_cancelled == "driver":
+                # Update driver's cancellation stats
+                updated_driver = user_manager.update_driver_stats(driver_id, add_cancellation=True)
+                if not updated_driver:
+                    state["messages"].append(AIMessage(content=f"Warning: Could not update driver statistics for ID {driver_id}."))
+            else:
+                # Update rider's cancellation stats
+                updated_rider = user_manager.update_rider_stats(rider.rider_id, add_cancellation=True)
+                if not updated_rider:
+                    state["messages"].append(AIMessage(content=f"Warning: Could not update rider statistics for ID {rider.rider_id}."))
+
+            # Create cancellation record
+            cancellation_record = cancellation_manager.create_cancellation(
+                booking_id=booking_id,
+                rider_id=rider.rider_id,
+                driver_id=driver_id,
+                cancelled_by=who_cancelled,
+                arrived=arrived,
+                distance_from_pin=distance_from_pin,
+                wait_time=wait_time,
+                rider_rating=rider.rider_rating,
+                rider_cancellation_rate=rider_cancellation_rate,
+                cancellation_time=cancellation_time,
+                decision=decision
+            )
+
+            # Cancel the booking in the booking manager
+            booking_manager.cancel_booking(booking_id)
+    except BookingNotActive:
+        state["messages"].append(AIMessage(content=f"Booking {booking_id} is no longer active."))
+        return state
     
     # Update state and provide detailed response
     state["cancellation_event"] = cancellation_event
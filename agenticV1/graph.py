@@ -3,6 +3,7 @@ from dotenv import load_dotenv
 from langchain_core.messages import BaseMessage, ToolMessage, SystemMessage, HumanMessage
 from langchain_groq import ChatGroq
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph.message import add_messages
 from langgraph.graph import StateGraph, END, START
 from langgraph.prebuilt import ToolNode
@@ -11,9 +12,10 @@ from tools.cancellation_tool import cancel_ride
 from tools.chatbot_tool import answer_query
 from tools.list_booking_tool import list_bookings
 from utils.types import Rider, AgentState, BookingRecord, CancellationEvent
-from utils.booking_manager import BookingManager
+from utils.registry import get_booking_manager
+from utils.graph_cache import get_graph
+from utils.history import HistoryPolicy
 from utils.input_handlers import get_wait_time, get_cancellation_time
-# from langgraph.checkpoint.filesystem import FileSystemSaver
 
 import json
 
@@ -21,13 +23,17 @@ load_dotenv()
 
 # Initialize tools and managers
 tools = [book_ride, cancel_ride, list_bookings, answer_query]
-booking_manager = BookingManager()
+booking_manager = get_booking_manager()
 
 # Initialize the model with Groq
-model = ChatGroq(
+llm = ChatGroq(
     model_name="gemma2-9b-it",
     temperature=0.7
-).bind_tools(tools)
+)
+model = llm.bind_tools(tools)
+
+# Recent turns verbatim, older ones summarized, so the prompt stays bounded
+history = HistoryPolicy()
 
 
 system_prompt = SystemMessage(content="""
@@ -49,7 +55,12 @@ If the user wants to logout, do not call any tools. Just end the session.
 """)
 
 def chatbot_with_tools(state: AgentState)->AgentState:
-    response = model.invoke([system_prompt] + state["messages"])
+    response = model.invoke([system_prompt] + history.messages(state, llm))
+    state["messages"].append(response)
+    return state
+
+async def achatbot_with_tools(state: AgentState)->AgentState:
+    response = await model.ainvoke([system_prompt] + await history.amessages(state, llm))
     state["messages"].append(response)
     return state
 
@@ -60,21 +71,25 @@ def router(state: AgentState) -> Literal["tools", "__end__"]:
 
     return "__end__"
 
-def build_graph():
+def build_graph(checkpointer=None):
     builder = StateGraph(AgentState)
     
     tool_node = ToolNode(tools)
-    builder.add_node("chatbot_with_tools",chatbot_with_tools)
+    # Sync and async implementations, so one compiled graph serves both invoke and ainvoke
+    builder.add_node("chatbot_with_tools", RunnableLambda(chatbot_with_tools, afunc=achatbot_with_tools, name="chatbot_with_tools"))
     builder.add_node("tools", tool_node)
 
     builder.add_edge(START, "chatbot_with_tools")
     builder.add_conditional_edges("chatbot_with_tools", router)
     builder.add_edge("tools", "chatbot_with_tools")
 
-    # memory = FileSystemSaver("chatbot_memory_dir")  # Directory to store state files
-    graph = builder.compile()
+    # With a checkpointer, each thread's state is kept between invocations
+    graph = builder.compile(checkpointer=checkpointer)
     return graph
 
+# Compiled once per process; main.py and LangGraph Studio share this instance
+agent = get_graph(build_graph)
+
 
 
 
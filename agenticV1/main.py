@@ -1,13 +1,14 @@
 from utils.langsmith_env import setup_env
-from utils.user_manager import UserManager
+from utils.registry import get_user_manager, get_checkpointer
 from graph import build_graph
-from langchain_core.messages import SystemMessage, HumanMessage
+from utils.graph_cache import get_graph
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessageChunk, ToolMessage
 from utils.handleRegistrations import handle_user_registration
 
 setup_env() ##Set langsmith environment if api key available
 
 # Initialize user manager
-user_manager = UserManager()
+user_manager = get_user_manager()
 
 def main():
     while True:
@@ -28,19 +29,18 @@ def main():
                 print("Invalid credentials. Please try again or register.")
                 continue
 
+            graph = get_graph(build_graph, checkpointer=get_checkpointer())
+            # One thread per rider, so a conversation picks up where it left off, even after a restart
+            config = {"configurable": {"thread_id": rider.rider_id}}
+
             # Start a new session
             while True:
-                state = {
-                    "rider": rider,
-                    "intent": None,
-                    "booking_info": None,
-                    "cancellation_event": None,
-                    "messages": [
-                        SystemMessage(content="Welcome to Uber Chatbot! How can I assist you today?")
-                    ]
-                }
+                seen = len(graph.get_state(config).values.get("messages", []))
 
-                print("\nAssistant: Welcome to Uber Chatbot! How can I assist you today?")
+                if seen:
+                    print("\nAssistant: Welcome back! How can I assist you today?")
+                else:
+                    print("\nAssistant: Welcome to Uber Chatbot! How can I assist you today?")
 
                 while True:
                     # Get user input
@@ -52,30 +52,55 @@ def main():
                         
                     if not user_input:
                         continue
-                    
-                    # Add user message to state
-                    state["messages"].append(HumanMessage(content=user_input))
 
-                    # Process through graph
-                    graph = build_graph()
-                    response = graph.invoke(state)
-                    
-                    # Print all new messages from the response
-                    if response["messages"]:
-                        new_messages = response["messages"][len(state["messages"]):]
-                        for msg in new_messages:
-                            if isinstance(msg, (HumanMessage, SystemMessage)):
-                                print(f"\nAssistant: {msg.content}")
-                            elif hasattr(msg, 'content'):
-                                print(f"\nAssistant: {msg.content}")
+                    # Only this turn's input is sent; the rest of the state comes from the checkpoint
+                    turn = {
+                        "rider": rider,
+                        "intent": None,
+                        "messages": [HumanMessage(content=user_input)]
+                    }
+                    if not seen:
+                        turn["booking_info"] = None
+                        turn["cancellation_event"] = None
+                        turn["messages"].insert(0, SystemMessage(content="Welcome to Uber Chatbot! How can I assist you today?"))
+
+                    # Process through graph, printing replies and RAG answers token by token
+                    # and other tool results as each tool finishes
+                    response = None
+                    streaming = None  # ID of the reply being printed
+                    answered = False  # answer_query's text has already streamed from the tools node
+                    for mode, chunk in graph.stream(turn, config, stream_mode=["messages", "values"]):
+                        if mode == "values":
+                            response = chunk
+                            continue
+                        message, metadata = chunk
+                        if isinstance(message, AIMessageChunk):
+                            if metadata.get("langgraph_node") not in ("chatbot_with_tools", "tools") or not message.content:
+                                continue
+                            if message.id != streaming:
+                                if streaming:
+                                    print()
+                                streaming = message.id
+                                print("\nAssistant: ", end="")
+                            print(message.content, end="", flush=True)
+                            answered = answered or metadata["langgraph_node"] == "tools"
+                        elif isinstance(message, ToolMessage):
+                            if streaming:
+                                print()
+                                streaming = None
+                            if message.name == "answer_query" and answered:
+                                answered = False
+                                continue
+                            print(f"\nAssistant: {message.content}")
+                    if streaming:
+                        print()
                     
                     # Check if user logged out
                     if response.get("intent") == "Logout":
                         print("\nLogged out successfully. Returning to main menu.")
                         break
                     
-                    # Update state for next iteration
-                    state = response
+                    seen = len(response["messages"])
                 
                 # Break out of the outer loop if we're logging out
                 break
@@ -0,0 +1,70 @@
+import asyncio
+from typing import Optional
+from langchain_core.messages import SystemMessage, HumanMessage
+from graph import build_graph
+from utils.graph_cache import get_graph
+from utils.registry import aget_user_manager, get_checkpointer
+from utils.types import Rider
+
+class ChatSession:
+    """One rider's conversation, driven from asyncio code.
+
+    A turn awaits the graph, the model and the tools, and storage calls run on
+    the storage executor, so one event loop can carry many sessions while each
+    waits on the model. State is kept by the shared checkpointer under the
+    rider's ID, so a session resumes where the rider left off.
+    """
+
+    def __init__(self, rider: Rider, graph=None):
+        self.rider = rider
+        self.graph = graph or get_graph(build_graph, checkpointer=get_checkpointer())
+        self.config = {"configurable": {"thread_id": rider.rider_id}}
+        self.seen: Optional[int] = None
+
+    async def send(self, user_input: str) -> Optional[str]:
+        """Run one turn and return the assistant's replies and tool results; None once the rider logs out."""
+        if self.seen is None:
+            self.seen = len((await self.graph.aget_state(self.config)).values.get("messages", []))
+
+        # Only this turn's input is sent; the rest of the state comes from the checkpoint
+        turn = {
+            "rider": self.rider,
+            "intent": None,
+            "messages": [HumanMessage(content=user_input)]
+        }
+        if not self.seen:
+            turn["booking_info"] = None
+            turn["cancellation_event"] = None
+            turn["messages"].insert(0, SystemMessage(content="Welcome to Uber Chatbot! How can I assist you today?"))
+
+        response = await self.graph.ainvoke(turn, self.config)
+        new_messages = response["messages"][self.seen + len(turn["messages"]):]
+        self.seen = len(response["messages"])
+        if response.get("intent") == "Logout":
+            return None
+        return "\n\n".join(msg.content for msg in new_messages if getattr(msg, 'content', None))
+
+async def main():
+    """Console chat over ChatSession; the same loop can serve many riders on one event loop."""
+    user_manager = await aget_user_manager()
+    rider_id = (await asyncio.to_thread(input, "Enter User ID: ")).strip()
+    rider_password = (await asyncio.to_thread(input, "Enter password: ")).strip()
+    rider = await user_manager.aauthenticate_rider(rider_id, rider_password)
+    if not rider:
+        print("Invalid credentials.")
+        return
+
+    session = ChatSession(rider)
+    print("\nAssistant: Welcome to Uber Chatbot! How can I assist you today?")
+    while True:
+        user_input = (await asyncio.to_thread(input, "\nYou: ")).strip()
+        if not user_input:
+            continue
+        reply = await session.send(user_input)
+        if reply is None:
+            print("\nLogged out successfully.")
+            return
+        print(f"\nAssistant: {reply}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,3 +1,4 @@
+from typing import Iterator
 from langchain.tools import tool
 from RAG.RAG import chain
 
@@ -11,10 +12,28 @@ def answer_query(query: str) -> str:
     Returns:
         Brief answer to the question (max 3 sentences)
     """
+    # Streamed, so a graph run with stream_mode="messages" shows the answer token by token
+    return "".join(stream_answer(query))
+
+async def aanswer_query(query: str) -> str:
+    """Awaitable `answer_query`; the retrieval and the completion are awaited on the RAG chain."""
     try:
-        result = chain.invoke(query)
+        result = await chain.ainvoke(query)
         return result.content
-    except:
-        return "I don't know the answer to that question. Please try asking something else." 
+    except Exception:
+        return "I don't know the answer to that question. Please try asking something else."
+
+# Run by `answer_query.ainvoke`, so async graphs and sessions await it natively
+answer_query.coroutine = aanswer_query
 
- 
\ No newline at end of file
+def stream_answer(query: str) -> Iterator[str]:
+    """Answer a question about Uber like `answer_query`, yielding the text as the model writes it."""
+    answered = False
+    try:
+        for chunk in chain.stream(query):
+            if chunk.content:
+                answered = True
+                yield chunk.content
+    except Exception:
+        if not answered:
+            yield "I don't know the answer to that question. Please try asking something else."
@@ -0,0 +1,157 @@
+import os
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from utils import codec
+from utils.storage import file_lock, file_signature
+
+class AppendOnlyLog:
+    """JSON-lines log of record upserts that is periodically folded into a snapshot file.
+
+    Every line holds the full state of one record, so replaying the log on top of
+    the snapshot is idempotent and the last line for a key always wins. Appends and
+    compactions hold the snapshot's file lock, so several processes can share a log.
+    """
+
+    def __init__(self, snapshot_file: str, compact_threshold: int = 1000,
+                 on_compacted: Optional[Callable[[Tuple, Tuple], None]] = None):
+        self.snapshot_file = snapshot_file
+        self.log_file = os.path.splitext(snapshot_file)[0] + ".log"
+        self.compacting_file = self.log_file + ".compacting"
+        self.compact_threshold = compact_threshold
+        # Called with signature() from just before and just after each compaction step that
+        # moves records between files: rotating the log aside and swapping the snapshot in.
+        # It runs under the log's locks and must not block.
+        self.on_compacted = on_compacted
+        self.entries = 0
+        self._lock = threading.Lock()
+        self._compactor: Optional[threading.Thread] = None
+
+    def signature(self) -> Tuple:
+        """Signature of the snapshot file and both log files."""
+        return file_signature([self.snapshot_file, self.log_file, self.compacting_file])
+
+    def exists(self) -> bool:
+        """Check whether there are log entries not yet folded into the snapshot."""
+        return os.path.exists(self.log_file) or os.path.exists(self.compacting_file)
+
+    def replay(self) -> Iterator[Dict]:
+        """Yield logged records in write order, including a log left mid-compaction."""
+        self.entries = 0
+        for path in (self.compacting_file, self.log_file):
+            try:
+                with open(path, 'rb') as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            record = codec.loads(line)
+                        except ValueError:
+                            # Torn write from a crash; everything before it is intact
+                            continue
+                        if path == self.log_file:
+                            self.entries += 1
+                        yield record
+            except FileNotFoundError:
+                continue
+
+    def append(self, record: Dict) -> None:
+        """Append one record to the log."""
+        self.append_many([record])
+
+    def lock(self, shared: bool = False):
+        """Cross-process lock covering the snapshot and both log files."""
+        return file_lock(self.snapshot_file, shared=shared)
+
+    def append_many(self, records: List[Dict]) -> None:
+        """Append several records with a single write."""
+        if not records:
+            return
+        lines = b"".join(codec.dumps(record) + b"\n" for record in records)
+        with self.lock(), self._lock:
+            with open(self.log_file, 'ab') as f:
+                f.write(lines)
+                f.flush()
+            self.entries += len(records)
+
+    def needs_compaction(self) -> bool:
+        """Check whether the log has grown past the compaction threshold."""
+        return self.entries >= self.compact_threshold and not self.compacting()
+
+    def compacting(self) -> bool:
+        """Check whether a background compaction is still running."""
+        return self._compactor is not None and self._compactor.is_alive()
+
+    def compact(self, snapshot: Callable[[], List[Dict]], background: bool = True) -> None:
+        """Fold the log into the snapshot file.
+
+        The current log is rotated aside and `snapshot` is called while appends are
+        blocked, so the rotated log is fully covered by the records it returns. The
+        new snapshot is written with appends flowing again and swapped in under the
+        lock. The whole compaction runs off the caller's thread when `background` is set.
+        """
+        if self.compacting():
+            return
+
+        if background:
+            self._compactor = threading.Thread(target=self._compact, args=(snapshot,))
+            self._compactor.start()
+        else:
+            self._compact(snapshot)
+
+    def clear(self) -> None:
+        """Drop all log files once their records are persisted elsewhere."""
+        with self.lock(), self._lock:
+            for path in (self.log_file, self.compacting_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.entries = 0
+
+    def wait(self) -> None:
+        """Block until a running background compaction has finished."""
+        if self._compactor is not None:
+            self._compactor.join()
+
+    def _rotate(self) -> None:
+        if os.path.exists(self.compacting_file):
+            # Holding the compaction lock, a leftover rotated log can only come from
+            # a compaction that died; its records are still covered by the snapshot
+            # we are about to write.
+            if os.path.exists(self.log_file):
+                with open(self.log_file, 'rb') as src, open(self.compacting_file, 'ab') as dst:
+                    dst.write(src.read())
+                os.remove(self.log_file)
+        elif os.path.exists(self.log_file):
+            os.replace(self.log_file, self.compacting_file)
+
+    def _compact(self, snapshot: Callable[[], List[Dict]]) -> None:
+        # One compaction at a time across processes; appends never wait on this lock
+        with file_lock(self.compacting_file):
+            with self.lock(), self._lock:
+                before = self.signature()
+                self._rotate()
+                records = snapshot()
+                self.entries = 0
+                seen = file_signature([self.snapshot_file])
+                self._compacted(before, self.signature())
+
+            temp_file = self.snapshot_file + '.compacting.tmp'
+            with open(temp_file, 'wb') as f:
+                f.write(codec.dumps(records))
+
+            with self.lock(), self._lock:
+                if file_signature([self.snapshot_file]) != seen:
+                    # A whole-file save rewrote the snapshot meanwhile; fold again to keep its records
+                    with open(temp_file, 'wb') as f:
+                        f.write(codec.dumps(snapshot()))
+                before = self.signature()
+                os.replace(temp_file, self.snapshot_file)
+                if os.path.exists(self.compacting_file):
+                    os.remove(self.compacting_file)
+                self._compacted(before, self.signature())
+
+    def _compacted(self, before: Tuple, after: Tuple) -> None:
+        # Called under the locks so no writer sees the files between the step and the
+        # listener; the listener must not take locks of its own
+        if self.on_compacted is not None and before != after:
+            self.on_compacted(before, after)
@@ -0,0 +1,22 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Dedicated pool for manager calls made from asyncio code, so disk I/O never runs
+# on the event loop and does not compete with the loop's default executor
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("STORAGE_WORKERS", "4")),
+                               thread_name_prefix="storage")
+
+async def run_storage(fn, *args, **kwargs):
+    """Run a blocking storage call on the storage executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+def async_variant(name: str):
+    """Build the awaitable `a<name>` counterpart of a manager method."""
+    async def method(self, *args, **kwargs):
+        return await run_storage(getattr(self, name), *args, **kwargs)
+    method.__name__ = method.__qualname__ = f"a{name}"
+    method.__doc__ = f"Awaitable `{name}`, run on the storage executor."
+    return method
@@ -1,42 +1,218 @@
-import json
 import os
-from datetime import datetime
-from typing import Optional, Dict, List
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Dict, List, Set
 from utils.types import BookingRecord
+from utils.append_log import AppendOnlyLog
+from utils.storage import JsonRecordStore, open_store, file_signature, synchronized, mutation
+from utils.indexes import SortedIndex
+from utils.write_batcher import BatchedWritesMixin
+from utils.async_storage import async_variant
+from utils.unit_of_work import pending_journal, complete_journal
+from utils.codec import load_records, rows_of, validate_records
+from utils.ids import booking_ids, id_date
+from utils.archive import RecordArchive
 
-class BookingManager:
-    def __init__(self, storage_dir: str = "data"):
+# Bookings in these states never change again and can move to the cold archive
+TERMINAL_STATUSES = ("completed", "cancelled")
+
+class BookingNotActive(Exception):
+    """The booking was cancelled or completed before the change could be applied."""
+
+class BookingManager(BatchedWritesMixin):
+    _stores = ("store",)
+
+    def __init__(self, storage_dir: str = "data", append_only: bool = False, compact_threshold: int = 1000,
+                 backend: Optional[str] = None, batch_writes: bool = False, batch_size: int = 100,
+                 batch_interval: float = 1.0):
         self.storage_dir = storage_dir
         self.bookings_file = os.path.join(storage_dir, "bookings.json")
+        self.store = open_store("bookings", storage_dir, backend)
         self.bookings: Dict[str, BookingRecord] = {}
+        # Bookings per (rider_id, status), oldest first
+        self.rider_index = SortedIndex(lambda booking: (booking.rider_id, booking.status),
+                                       lambda booking: booking.created_at)
+        # In append-only mode each mutation writes one log line instead of the whole file.
+        # Other backends already write single rows or shards, so the log only applies to JSON.
+        self.append_only = append_only and isinstance(self.store, JsonRecordStore)
+        self.log = AppendOnlyLog(self.bookings_file, compact_threshold=compact_threshold,
+                                 on_compacted=self._compacted)
+        # Terminal bookings moved out of the hot store by archive_bookings()
+        self.archive = RecordArchive(storage_dir, "bookings", "booking_id")
+        self._lock = threading.RLock()
+        self._signature = None
+        # Bookings changed in memory but not yet written
+        self._dirty: Set[str] = set()
+        # Called with every booking put in memory, see subscribe()
+        self._listeners: List[Callable[[BookingRecord], None]] = []
+        self._init_writes(batch_writes, batch_size, batch_interval)
         self._load_bookings()
         
     def _load_bookings(self) -> None:
         """Load bookings from storage file."""
         os.makedirs(self.storage_dir, exist_ok=True)
         
-        try:
-            with open(self.bookings_file, 'r') as f:
-                bookings_data = json.load(f)
-                for booking_data in bookings_data:
-                    booking = BookingRecord.model_validate(booking_data)
-                    self.bookings[booking.booking_id] = booking
-        except (json.JSONDecodeError, FileNotFoundError):
-            pass
+        if self.store.indexed:
+            for booking in load_records(BookingRecord, self.store.load()):
+                self._put(booking)
+            self._recover_journal()
+            self._signature = self._file_signature()
+            return
+
+        # Read the snapshot and the log it is paired with as one consistent view
+        with self.log.lock(shared=True):
+            signature = self._file_signature()
+            rows = self.store.load()
+            logged = list(self.log.replay()) if self.log.exists() else []
+        for booking in load_records(BookingRecord, rows + logged):
+            self._put(booking)
+        self._signature = signature
+
+        if logged and not self.append_only:
+            # Fold a log left behind by append-only mode into the snapshot
+            self.log.compact(self._snapshot, background=False)
+            self._signature = self._file_signature()
+        self._recover_journal()
+
+    def _recover_journal(self) -> None:
+        """Finish writing bookings from a unit of work that was interrupted mid-commit."""
+        with self.store.lock():
+            for booking_data in pending_journal(self.storage_dir, "bookings"):
+                booking = BookingRecord.model_validate(booking_data)
+                self._put(booking)
+                self._dirty.add(booking.booking_id)
+            if self._dirty:
+                self.flush()
+                complete_journal(self.storage_dir, "bookings")
             
-    def _save_bookings(self) -> None:
-        """Save bookings to storage file."""
+    def _save_bookings(self, booking: Optional[BookingRecord] = None) -> None:
+        """Queue `booking` for saving, or rewrite every booking when none is given."""
+        if booking is not None:
+            self._dirty.add(booking.booking_id)
+            self._request_flush()
+            return
+
         os.makedirs(self.storage_dir, exist_ok=True)
-        
-        with open(self.bookings_file, 'w') as f:
-            json.dump([booking.model_dump() for booking in self.bookings.values()], f)
+        self.store.save(self.bookings)
+        self._dirty.clear()
+        self._signature = self._file_signature()
+
+    @synchronized
+    def flush(self) -> None:
+        """Write the bookings changed since the last flush."""
+        if not self._dirty:
+            return
+        os.makedirs(self.storage_dir, exist_ok=True)
+
+        stale = self.is_stale()
+        merged = False
+        if self.append_only:
+            self.log.append_many([self.bookings[booking_id].model_dump() for booking_id in self._dirty])
+            if self.log.needs_compaction():
+                self.log.compact(self._snapshot)
+        else:
+            merged = self.store.save(self.bookings, changed=list(self._dirty))
+        self._dirty.clear()
+        self._signature = self._file_signature()
+        if stale or merged:
+            # Another process wrote too; pick up its bookings alongside ours
+            self._reload()
+
+    def _file_signature(self) -> tuple:
+        if self.store.indexed:
+            return self.store.signature()
+        return self.store.signature() + file_signature([self.log.log_file, self.log.compacting_file])
+
+    def _compacted(self, before: tuple, after: tuple) -> None:
+        """Keep our view current across a compaction, which changes no records, if it was current before."""
+        # No lock: this runs on the compactor under the log's locks, and compact() waits
+        # for the compactor while holding ours. A racing flush can at worst leave the
+        # signature stale and cause one extra reload.
+        if self._signature == before:
+            self._signature = after
+
+    def is_stale(self) -> bool:
+        """Check whether another writer changed the storage files since we last read or wrote them."""
+        return self._file_signature() != self._signature
+
+    @synchronized
+    def refresh(self) -> bool:
+        """Reload bookings if the storage files changed on disk; returns whether it reloaded."""
+        self.flush()
+        if not self.is_stale():
+            return False
+        self._reload()
+        return True
+
+    @synchronized
+    def staged(self) -> Dict[str, List[dict]]:
+        """Bookings changed but not yet written."""
+        return {"bookings": [self.bookings[booking_id].model_dump() for booking_id in self._dirty]}
+
+    @synchronized
+    def discard(self) -> None:
+        """Drop unwritten booking changes and reload from storage."""
+        self._dirty.clear()
+        self._reload()
+
+    def _reload(self) -> None:
+        pending = [self.bookings[booking_id] for booking_id in self._dirty]
+        self._dirty.clear()
+        self.bookings = {}
+        self.rider_index.clear()
+        self._load_bookings()
+        # Unwritten changes are newer than anything on disk
+        for booking in pending:
+            self._put(booking)
+            self._dirty.add(booking.booking_id)
+
+    def _cache(self, booking_data: Optional[dict]) -> Optional[BookingRecord]:
+        """Validate a record read from an indexed store and refresh the in-memory copy."""
+        if booking_data is None:
+            return None
+        if booking_data["booking_id"] in self._dirty:
+            # Our unflushed copy is newer than what the store holds
+            return self.bookings[booking_data["booking_id"]]
+        booking = BookingRecord.model_validate(booking_data)
+        self._put(booking)
+        return booking
+
+    def _put(self, booking: BookingRecord) -> None:
+        """Store a booking in memory and keep the secondary index current."""
+        self.bookings[booking.booking_id] = booking
+        self.rider_index.add(booking.booking_id, booking)
+        for listener in self._listeners:
+            listener(booking)
+
+    @synchronized
+    def subscribe(self, listener: Callable[[BookingRecord], None]) -> None:
+        """Call `listener` with every booking held now and each one stored or reloaded from here on.
+
+        The same booking can be passed more than once, so listeners must be idempotent.
+        """
+        self._listeners.append(listener)
+        for booking in list(self.bookings.values()):
+            listener(booking)
+
+    def _snapshot(self) -> List[dict]:
+        """Fold the snapshot file and the log into one list, as other processes wrote them too."""
+        bookings = {row["booking_id"]: row for row in self.store.load()}
+        for row in self.log.replay():
+            bookings[row["booking_id"]] = row
+        return list(bookings.values())
+
+    @synchronized
+    def compact(self) -> None:
+        """Fold the append-only log into bookings.json and wait for it to finish."""
+        self.flush()
+        self.log.wait()
+        self.log.compact(self._snapshot, background=False)
             
     def generate_booking_id(self) -> str:
         """Generate a unique booking ID."""
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        count = len(self.bookings) + 1
-        return f"B{timestamp}{count:04d}"
+        return booking_ids()
         
+    @mutation("store")
     def create_booking(self, rider_id: str, driver_id: str, pickup: str, drop: str) -> BookingRecord:
         """Create a new booking record."""
         booking_id = self.generate_booking_id()
@@ -49,33 +225,139 @@ class BookingManager:
             drop=drop
         )
         
-        self.bookings[booking_id] = booking
-        self._save_bookings()
+        self._put(booking)
+        self._save_bookings(booking)
         return booking
         
+    @mutation("store")
+    def bulk_upsert_bookings(self, bookings) -> int:
+        """Insert or replace many bookings from dicts or a DataFrame with a single save.
+
+        All rows are validated in one pass before anything changes; a bad row
+        raises and nothing is written.
+        """
+        records = validate_records(BookingRecord, rows_of(bookings))
+        for booking in records:
+            self._put(booking)
+            self._dirty.add(booking.booking_id)
+        self._request_flush()
+        return len(records)
+
+    @synchronized
     def get_booking(self, booking_id: str) -> Optional[BookingRecord]:
-        """Get a booking by ID."""
-        return self.bookings.get(booking_id)
+        """Get a booking by ID, falling back to the archive for old finished bookings."""
+        if self.store.indexed and booking_id not in self._dirty:
+            booking = self._cache(self.store.get(booking_id))
+        else:
+            booking = self.bookings.get(booking_id)
+        if booking is None:
+            booking_data = self.archive.get(booking_id, days=self._archive_days(booking_id))
+            if booking_data is not None:
+                booking = BookingRecord.model_validate(booking_data)
+        return booking
+
+    def _archive_days(self, booking_id: str) -> Optional[List[str]]:
+        created = id_date(booking_id)
+        if created is None:
+            return None
+        # created_at is stamped just after the ID, possibly across midnight
+        return [created.isoformat(), (created + timedelta(days=1)).isoformat()]
+
+    @synchronized
+    def get_archived_bookings(self, rider_id: Optional[str] = None, start: Optional[str] = None,
+                              end: Optional[str] = None) -> List[BookingRecord]:
+        """Get archived bookings created between the `start` and `end` days (YYYY-MM-DD), oldest first."""
+        filters = {} if rider_id is None else {"rider_id": rider_id}
+        return load_records(BookingRecord, self.archive.scan(start=start, end=end, **filters))
+
+    @mutation("store")
+    def archive_bookings(self, older_than_days: int = 0) -> int:
+        """Move completed and cancelled bookings created at least `older_than_days` ago
+        into the cold archive; returns how many moved."""
+        self.flush()
+        if self.append_only:
+            self.log.wait()
+            self.log.compact(self._snapshot, background=False)
+
+        cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat()
+        finished = [booking for booking in self.bookings.values()
+                    if booking.status in TERMINAL_STATUSES and booking.created_at <= cutoff]
+        if not finished:
+            return 0
+
+        # Archive first: a crash in between leaves a duplicate, never a lost booking
+        self.archive.add(booking.model_dump() for booking in finished)
+        self.store.delete(booking.booking_id for booking in finished)
+        self._reload()
+        return len(finished)
         
-    def get_rider_bookings(self, rider_id: str) -> List[BookingRecord]:
-        """Get all bookings for a rider."""
-        return [booking for booking in self.bookings.values() 
-                if booking.rider_id == rider_id and booking.status == "active"]
+    def get_rider_bookings(self, rider_id: str, status: str = "active") -> List[BookingRecord]:
+        """Get all bookings for a rider with the given status, oldest first."""
+        return self.get_rider_bookings_page(rider_id, status=status, limit=None, newest_first=False)
+
+    @synchronized
+    def get_rider_bookings_page(self, rider_id: str, status: str = "active", offset: int = 0,
+                                limit: Optional[int] = 10, newest_first: bool = True) -> List[BookingRecord]:
+        """Get one page of a rider's bookings with the given status, ordered by creation time."""
+        if self.store.indexed:
+            self.flush()
+            return [self._cache(data) for data in self.store.find(
+                order_by="created_at", descending=newest_first, limit=limit, offset=offset,
+                rider_id=rider_id, status=status
+            )]
+        booking_ids = self.rider_index.ids((rider_id, status), offset=offset, limit=limit, reverse=newest_first)
+        return [self.bookings[booking_id] for booking_id in booking_ids]
+
+    @synchronized
+    def count_rider_bookings(self, rider_id: str, status: str = "active") -> int:
+        """Count a rider's bookings with the given status."""
+        if self.store.indexed:
+            self.flush()
+            return self.store.count(rider_id=rider_id, status=status)
+        return self.rider_index.count((rider_id, status))
         
+    @mutation("store")
     def cancel_booking(self, booking_id: str) -> Optional[BookingRecord]:
         """Cancel a booking by ID."""
         booking = self.get_booking(booking_id)
         if booking and booking.status == "active":
             booking.status = "cancelled"
-            self._save_bookings()
+            self.rider_index.add(booking_id, booking)
+            self._save_bookings(booking)
             return booking
         return None
         
+    @synchronized
+    def require_active(self, booking_id: str) -> BookingRecord:
+        """The booking if it is still active, otherwise raise BookingNotActive.
+
+        Called inside a UnitOfWork it reads under the unit's locks, so a concurrent
+        cancel that won the race rolls the unit back instead of recording twice.
+        """
+        booking = self.get_booking(booking_id)
+        if not booking or booking.status != "active":
+            raise BookingNotActive(booking_id)
+        return booking
+
+    @mutation("store")
     def complete_booking(self, booking_id: str) -> Optional[BookingRecord]:
         """Mark a booking as completed."""
         booking = self.get_booking(booking_id)
         if booking and booking.status == "active":
             booking.status = "completed"
-            self._save_bookings()
+            self.rider_index.add(booking_id, booking)
+            self._save_bookings(booking)
             return booking
-        return None 
\ No newline at end of file
+        return None 
+
+    # Awaitable variants for asyncio callers; disk work runs on the storage executor
+    acreate_booking = async_variant("create_booking")
+    abulk_upsert_bookings = async_variant("bulk_upsert_bookings")
+    aget_booking = async_variant("get_booking")
+    aget_archived_bookings = async_variant("get_archived_bookings")
+    aarchive_bookings = async_variant("archive_bookings")
+    aget_rider_bookings = async_variant("get_rider_bookings")
+    aget_rider_bookings_page = async_variant("get_rider_bookings_page")
+    acount_rider_bookings = async_variant("count_rider_bookings")
+    acancel_booking = async_variant("cancel_booking")
+    acomplete_booking = async_variant("complete_booking")
@@ -0,0 +1,129 @@
+import os
+from typing import Any, List, Optional, Tuple
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from utils.registry import get_booking_manager, aget_booking_manager
+
+SUMMARY_PROMPT = """You keep a running summary of a conversation between an Uber rider and the Uber assistant.
+Extend the summary with the new messages. Keep what the rider asked for, locations, booking IDs,
+outcomes and anything still unresolved; drop greetings and small talk.
+Reply with the updated summary only, in at most 150 words."""
+
+def _turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """Messages grouped into turns, each starting at a rider message; tool calls stay with their turn."""
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+def _transcript(messages: List[BaseMessage]) -> str:
+    lines = []
+    for message in messages:
+        if message.content:
+            lines.append(f"{message.type}: {message.content}")
+        for call in getattr(message, "tool_calls", None) or []:
+            lines.append(f"{message.type}: called {call['name']} with {call['args']}")
+    return "\n".join(lines)
+
+def _facts(rider, bookings) -> List[str]:
+    facts = [f"Rider ID: {rider.rider_id}"]
+    if bookings:
+        facts.append("Active bookings: " + "; ".join(
+            f"{booking.booking_id} ({booking.pickup} to {booking.drop})" for booking in bookings))
+    else:
+        facts.append("Active bookings: none")
+    return facts
+
+def pinned_facts(state) -> List[str]:
+    """Facts the model must always see however old the turn that produced them."""
+    rider = state.get("rider")
+    if rider is None:
+        return []
+    return _facts(rider, get_booking_manager().get_rider_bookings(rider.rider_id))
+
+async def apinned_facts(state) -> List[str]:
+    """Awaitable `pinned_facts`, with the booking lookup on the storage executor."""
+    rider = state.get("rider")
+    if rider is None:
+        return []
+    booking_manager = await aget_booking_manager()
+    return _facts(rider, await booking_manager.aget_rider_bookings(rider.rider_id))
+
+class HistoryPolicy:
+    """Which part of the conversation is sent to the model each turn.
+
+    The last `max_turns` turns are sent verbatim, fewer if they exceed
+    `max_tokens`. Older turns are folded into a running summary kept in the
+    state's `memory`, `fold_turns` at a time so the summarizing call is made
+    only every few turns. The summary and the pinned facts (rider ID, active
+    bookings) go in one system message ahead of the verbatim turns, so the
+    prompt stays the same size however long the session runs. Messages are
+    never removed from the state; `memory["summarized"]` counts those folded.
+    """
+
+    def __init__(self, max_turns: Optional[int] = None, max_tokens: Optional[int] = None,
+                 fold_turns: Optional[int] = None):
+        self.max_turns = max_turns if max_turns is not None else int(os.getenv("HISTORY_TURNS", "6"))
+        self.max_tokens = max_tokens if max_tokens is not None else int(os.getenv("HISTORY_TOKENS", "3000"))
+        self.fold_turns = fold_turns if fold_turns is not None else int(os.getenv("HISTORY_FOLD_TURNS", "4"))
+
+    def _request(self, summary: Optional[str], messages: List[BaseMessage]) -> List[BaseMessage]:
+        return [
+            SystemMessage(content=SUMMARY_PROMPT),
+            HumanMessage(content=f"Summary so far:\n{summary or 'None'}\n\nNew messages:\n{_transcript(messages)}"),
+        ]
+
+    def summarize(self, model, summary: Optional[str], messages: List[BaseMessage]) -> str:
+        """`summary` extended with `messages`."""
+        # Kept out of the graph's token stream
+        response = model.invoke(self._request(summary, messages), config={"tags": ["nostream"]})
+        return response.content.strip()
+
+    async def asummarize(self, model, summary: Optional[str], messages: List[BaseMessage]) -> str:
+        """Awaitable `summarize`."""
+        response = await model.ainvoke(self._request(summary, messages), config={"tags": ["nostream"]})
+        return response.content.strip()
+
+    def _window(self, state) -> Tuple[dict, List[BaseMessage], List[BaseMessage]]:
+        """The state's memory, the messages to fold into the summary and the ones to send verbatim."""
+        memory = state.get("memory") or {}
+        state["memory"] = memory
+        turns = _turns(state["messages"][memory.get("summarized", 0):])
+
+        folded = turns[:-self.max_turns] if len(turns) >= self.max_turns + self.fold_turns else []
+        recent = turns[len(folded):]
+        sizes = [count_tokens_approximately(turn) for turn in recent]
+        # The current turn is always sent whole
+        while len(recent) > 1 and sum(sizes) > self.max_tokens:
+            folded.append(recent.pop(0))
+            sizes.pop(0)
+        return memory, [message for turn in folded for message in turn], [message for turn in recent for message in turn]
+
+    @staticmethod
+    def _prompt(memory: dict, facts: List[str], recent: List[BaseMessage]) -> List[BaseMessage]:
+        context = []
+        if memory.get("summary"):
+            context.append(f"Summary of the earlier conversation:\n{memory['summary']}")
+        if facts:
+            context.append("Pinned facts:\n" + "\n".join(f"- {fact}" for fact in facts))
+        history: List[Any] = [SystemMessage(content="\n\n".join(context))] if context else []
+        return history + recent
+
+    def messages(self, state, model) -> List[BaseMessage]:
+        """The history to send for this turn; folds overflowing turns into the summary
+        with `model`, recording it in `state["memory"]`."""
+        memory, folded, recent = self._window(state)
+        if folded:
+            memory["summary"] = self.summarize(model, memory.get("summary"), folded)
+            memory["summarized"] = memory.get("summarized", 0) + len(folded)
+        return self._prompt(memory, pinned_facts(state), recent)
+
+    async def amessages(self, state, model) -> List[BaseMessage]:
+        """Awaitable `messages`."""
+        memory, folded, recent = self._window(state)
+        if folded:
+            memory["summary"] = await self.asummarize(model, memory.get("summary"), folded)
+            memory["summarized"] = memory.get("summarized", 0) + len(folded)
+        return self._prompt(memory, await apinned_facts(state), recent)
@@ -0,0 +1,75 @@
+import heapq
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+class Leaderboard:
+    """Records ranked by a score, kept current in O(log n) per change.
+
+    Entries live in a heap with lazy deletion. A changed score pushes a new
+    entry, and the outdated one is dropped when it reaches the top. Reading the
+    top k pops the k best live entries and pushes them back, O(k log n). The
+    heap is rebuilt from the live scores once outdated entries outnumber them.
+    Records scored None are left off the board.
+    """
+
+    def __init__(self, score: Callable[[dict], Optional[float]], descending: bool = True):
+        self.score = score
+        self.descending = descending
+        self._heap: List[Tuple[float, str]] = []
+        self._scores: Dict[str, float] = {}
+
+    def _entry(self, record_id: str, value: float) -> Tuple[float, str]:
+        return (-value if self.descending else value, record_id)
+
+    def _is_live(self, entry: Tuple[float, str]) -> bool:
+        value = self._scores.get(entry[1])
+        return value is not None and self._entry(entry[1], value) == entry
+
+    def add(self, record_id: str, row: dict) -> None:
+        """Rank a record, or move it if its score changed."""
+        value = self.score(row)
+        if value is None:
+            self.discard(record_id)
+            return
+        if self._scores.get(record_id) == value:
+            return
+        self._scores[record_id] = value
+        heapq.heappush(self._heap, self._entry(record_id, value))
+        self._compact()
+
+    def discard(self, record_id: str) -> None:
+        """Take a record off the board if it is on it."""
+        if self._scores.pop(record_id, None) is not None:
+            self._compact()
+
+    def rebuild(self, rows: Iterable[Tuple[str, dict]]) -> None:
+        """Replace the board with `rows` in one O(n) heapify."""
+        self._scores = {}
+        for record_id, row in rows:
+            value = self.score(row)
+            if value is not None:
+                self._scores[record_id] = value
+        self._heap = [self._entry(record_id, value) for record_id, value in self._scores.items()]
+        heapq.heapify(self._heap)
+
+    def _compact(self) -> None:
+        if len(self._heap) > 2 * len(self._scores) + 64:
+            self._heap = [self._entry(record_id, value) for record_id, value in self._scores.items()]
+            heapq.heapify(self._heap)
+
+    def top(self, k: int) -> List[str]:
+        """IDs of the `k` best-ranked records, best first; ties go to the lower ID."""
+        taken: List[Tuple[float, str]] = []
+        seen = set()
+        while self._heap and len(taken) < k:
+            entry = heapq.heappop(self._heap)
+            # A score that changed and changed back leaves two identical live entries
+            if entry[1] in seen or not self._is_live(entry):
+                continue
+            seen.add(entry[1])
+            taken.append(entry)
+        for entry in taken:
+            heapq.heappush(self._heap, entry)
+        return [record_id for _, record_id in taken]
+
+    def __len__(self) -> int:
+        return len(self._scores)
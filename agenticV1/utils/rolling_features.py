@@ -0,0 +1,156 @@
+import threading
+from array import array
+from datetime import date, timedelta
+from typing import Dict, Optional, Set
+
+# Trailing windows, in days, that counts and rates are kept for
+WINDOWS = (7, 30, 90)
+HORIZON = max(WINDOWS)
+RIDES, CANCELLATIONS = 0, 1
+
+def _day(timestamp: str) -> int:
+    return date.fromisoformat(timestamp[:10]).toordinal()
+
+def _today() -> int:
+    return date.today().toordinal()
+
+class _Window:
+    """Ride and cancellation counts for one rider or driver over the last HORIZON days.
+
+    Daily buckets form a ring indexed by day number, and each window keeps a running
+    total. Moving to a new day subtracts the buckets that fall out of each window, so
+    reads never sum buckets.
+    """
+
+    __slots__ = ("day", "buckets", "totals")
+
+    def __init__(self, day: int):
+        self.day = day
+        self.buckets = (array('I', bytes(4 * HORIZON)), array('I', bytes(4 * HORIZON)))
+        self.totals = [[0, 0] for _ in WINDOWS]
+
+    def advance(self, day: int) -> None:
+        if day <= self.day:
+            return
+        if day - self.day >= HORIZON:
+            for buckets in self.buckets:
+                buckets[:] = array('I', bytes(4 * HORIZON))
+            self.totals = [[0, 0] for _ in WINDOWS]
+            self.day = day
+            return
+        for new_day in range(self.day + 1, day + 1):
+            for totals, window in zip(self.totals, WINDOWS):
+                leaving = (new_day - window) % HORIZON
+                totals[RIDES] -= self.buckets[RIDES][leaving]
+                totals[CANCELLATIONS] -= self.buckets[CANCELLATIONS][leaving]
+            self.buckets[RIDES][new_day % HORIZON] = 0
+            self.buckets[CANCELLATIONS][new_day % HORIZON] = 0
+        self.day = day
+
+    def add(self, day: int, field: int) -> None:
+        self.advance(day)
+        age = self.day - day
+        if age >= HORIZON:
+            return
+        self.buckets[field][day % HORIZON] += 1
+        for totals, window in zip(self.totals, WINDOWS):
+            if age < window:
+                totals[field] += 1
+
+class RollingFeatures:
+    """Rolling 7/30/90-day ride and cancellation counts and rates per rider and driver.
+
+    Subscribes to a BookingManager and a CancellationManager and counts every record
+    they hold, whether created here or loaded after another process wrote it. Each
+    record is counted once; the IDs remembered for that are dropped a day at a
+    time as they leave the horizon. Reads only move an entity's ring forward to
+    today, which is constant work.
+    """
+
+    def __init__(self, booking_manager, cancellation_manager):
+        self._lock = threading.Lock()
+        self.riders: Dict[str, _Window] = {}
+        self.drivers: Dict[str, _Window] = {}
+        # IDs counted per day, so a record passed again is not counted twice
+        self._bookings: Dict[int, Set[str]] = {}
+        self._cancellations: Dict[int, Set[str]] = {}
+        self._today = _today()
+
+        # Bookings archived within the horizon still count
+        start = (date.today() - timedelta(days=HORIZON)).isoformat()
+        for row in booking_manager.archive.scan(start=start):
+            self._count_booking(row["booking_id"], row["rider_id"], row["driver_id"], row["created_at"])
+        booking_manager.subscribe(self.record_booking)
+        cancellation_manager.subscribe(self.record_cancellation)
+
+    def _add(self, entities: Dict[str, _Window], entity_id: str, day: int, field: int) -> None:
+        window = entities.get(entity_id)
+        if window is None:
+            window = entities[entity_id] = _Window(day)
+        window.add(day, field)
+
+    def _unseen(self, seen: Dict[int, Set[str]], record_id: str, day: int) -> bool:
+        """Whether a record from `day` is within the horizon and not counted yet; remembers it if so."""
+        today = _today()
+        if today != self._today:
+            self._today = today
+            for ids in (self._bookings, self._cancellations):
+                for old_day in [old_day for old_day in ids if today - old_day >= HORIZON]:
+                    del ids[old_day]
+        if today - day >= HORIZON:
+            # Outside every window, so it would not count anyway
+            return False
+        ids = seen.setdefault(day, set())
+        if record_id in ids:
+            return False
+        ids.add(record_id)
+        return True
+
+    def _count_booking(self, booking_id: str, rider_id: str, driver_id: str, created_at: str) -> None:
+        day = _day(created_at)
+        with self._lock:
+            if not self._unseen(self._bookings, booking_id, day):
+                return
+            self._add(self.riders, rider_id, day, RIDES)
+            self._add(self.drivers, driver_id, day, RIDES)
+
+    def record_booking(self, booking) -> None:
+        """Count a booking as a ride for its rider and driver."""
+        self._count_booking(booking.booking_id, booking.rider_id, booking.driver_id, booking.created_at)
+
+    def record_cancellation(self, cancellation) -> None:
+        """Count a cancellation against whoever cancelled."""
+        day = _day(cancellation.created_at)
+        with self._lock:
+            if not self._unseen(self._cancellations, cancellation.cancellation_id, day):
+                return
+            entities, entity_id = ((self.drivers, cancellation.driver_id) if cancellation.cancelled_by == "driver"
+                                   else (self.riders, cancellation.rider_id))
+            self._add(entities, entity_id, day, CANCELLATIONS)
+
+    def _features(self, entities: Dict[str, _Window], entity_id: str) -> Dict[str, Optional[float]]:
+        features: Dict[str, Optional[float]] = {}
+        with self._lock:
+            window = entities.get(entity_id)
+            if window is not None:
+                window.advance(_today())
+            for index, days in enumerate(WINDOWS):
+                rides, cancellations = window.totals[index] if window is not None else (0, 0)
+                features[f"rides_{days}d"] = rides
+                features[f"cancellations_{days}d"] = cancellations
+                # No rides in the window means no evidence either way
+                features[f"cancelation_rate_{days}d"] = min(cancellations / rides * 100, 100.0) if rides else None
+        return features
+
+    def rider(self, rider_id: str) -> Dict[str, Optional[float]]:
+        """Rides booked, cancellations and cancellation rate per window for a rider."""
+        return self._features(self.riders, rider_id)
+
+    def driver(self, driver_id: str) -> Dict[str, Optional[float]]:
+        """Rides accepted, cancellations and cancellation rate per window for a driver."""
+        return self._features(self.drivers, driver_id)
+
+    def rider_cancelation_rates(self, rider_id: str) -> Dict[str, Optional[float]]:
+        """The rider's windowed rates as `RiderCancels` fields."""
+        features = self.rider(rider_id)
+        return {f"rider_cancelation_rate_{days}d": features[f"cancelation_rate_{days}d"] for days in WINDOWS}
@@ -0,0 +1,279 @@
+import argparse
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import pandas as pd
+from utils import codec
+from utils.append_log import AppendOnlyLog
+from utils.archive import RecordArchive
+from utils.storage import JsonRecordStore, file_lock, open_store
+
+def _tally() -> dict:
+    return {"rides": 0, "cancellations": 0, "decisions": {}}
+
+class StatsProjector:
+    """Per-rider and per-driver statistics projected from booking and cancellation records.
+
+    Every booking is one ride booked by its rider and accepted by its driver. Every
+    cancellation counts against whoever cancelled and adds to both parties' fee
+    decision tallies. `update()` folds in records created since the checkpoint and
+    moves cancellations whose decision changed since they were folded in;
+    `rebuild()` recomputes everything, archived bookings included. Both are grouped
+    pandas aggregations, so a full rebuild over hundreds of thousands of records
+    takes seconds.
+
+    Stored counters can include history no record covers, such as seeded accounts.
+    `init_baselines()` keeps the part of each rider's and driver's counters not
+    backed by records as its baseline, and the counters it should hold from then
+    on are the baseline plus the projection. It is an explicit step because it
+    accepts whatever drift exists at that moment; riders and drivers without a
+    baseline are left out of `audit()` and `apply()`.
+    """
+
+    def __init__(self, storage_dir: str = "data", backend: Optional[str] = None, settle_seconds: float = 5.0):
+        self.storage_dir = storage_dir
+        self.backend = backend
+        self.projection_file = os.path.join(storage_dir, "stats.json")
+        # Records younger than this may still sit in another process's write batch
+        self.settle_seconds = settle_seconds
+        self.riders: Dict[str, dict] = {}
+        self.drivers: Dict[str, dict] = {}
+        # Last (created_at, id) folded in per table
+        self.checkpoint: Dict[str, Optional[List[str]]] = {"bookings": None, "cancellations": None}
+        # Decision each folded-in cancellation was tallied under
+        self.decisions: Dict[str, str] = {}
+        # Counts not backed by records, per rider and driver
+        self.baselines: Dict[str, Dict[str, dict]] = {"riders": {}, "drivers": {}}
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.projection_file, 'rb') as f:
+                projection = codec.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return
+        self.riders = projection["riders"]
+        self.drivers = projection["drivers"]
+        self.checkpoint = projection["checkpoint"]
+        self.decisions = projection.get("decisions", {})
+        self.baselines = projection.get("baselines", self.baselines)
+
+    def _save(self) -> None:
+        projection = {"checkpoint": self.checkpoint, "riders": self.riders, "drivers": self.drivers,
+                      "decisions": self.decisions, "baselines": self.baselines}
+        with file_lock(self.projection_file):
+            temp_file = self.projection_file + '.tmp'
+            with open(temp_file, 'wb') as f:
+                f.write(codec.dumps(projection))
+            os.replace(temp_file, self.projection_file)
+
+    def _rows(self, table: str) -> List[dict]:
+        store = open_store(table, self.storage_dir, self.backend)
+        rows = {}
+        if table == "bookings":
+            since = self.checkpoint["bookings"][0][:10] if self.checkpoint["bookings"] else None
+            for row in RecordArchive(self.storage_dir, "bookings", "booking_id").scan(start=since):
+                rows[row["booking_id"]] = row
+        for row in store.load():
+            rows[row[store.key]] = row
+        if isinstance(store, JsonRecordStore):
+            for row in AppendOnlyLog(store.path).replay():
+                rows[row[store.key]] = row
+        return list(rows.values())
+
+    def _pending(self, table: str, key: str, cutoff: Optional[str], frame: Optional[pd.DataFrame] = None,
+                 advance: bool = True) -> pd.DataFrame:
+        """Records of `table` after the checkpoint and no younger than `cutoff`, as a frame.
+
+        With `advance` the checkpoint moves past the records returned.
+        """
+        frame = pd.DataFrame(self._rows(table)) if frame is None else frame
+        if frame.empty:
+            return frame
+        mask = pd.Series(True, index=frame.index) if cutoff is None else frame["created_at"] <= cutoff
+        checkpoint = self.checkpoint[table]
+        if checkpoint is not None:
+            created_at, record_id = checkpoint
+            mask &= (frame["created_at"] > created_at) | ((frame["created_at"] == created_at) & (frame[key] > record_id))
+        frame = frame[mask]
+        if advance and not frame.empty:
+            last = frame.sort_values(["created_at", key]).iloc[-1]
+            self.checkpoint[table] = [last["created_at"], last[key]]
+        return frame
+
+    @staticmethod
+    def _fold(bookings: pd.DataFrame, cancellations: pd.DataFrame, riders: Dict[str, dict],
+              drivers: Dict[str, dict]) -> None:
+        def add(target: Dict[str, dict], counts: pd.Series, field: str) -> None:
+            for entity_id, count in counts.items():
+                target.setdefault(entity_id, _tally())[field] += int(count)
+
+        def add_decisions(target: Dict[str, dict], counts: pd.Series) -> None:
+            for (entity_id, decision), count in counts.items():
+                decisions = target.setdefault(entity_id, _tally())["decisions"]
+                decisions[decision] = decisions.get(decision, 0) + int(count)
+
+        if not bookings.empty:
+            add(riders, bookings.groupby("rider_id").size(), "rides")
+            add(drivers, bookings.groupby("driver_id").size(), "rides")
+        if not cancellations.empty:
+            by_rider = cancellations[cancellations["cancelled_by"] == "rider"]
+            by_driver = cancellations[cancellations["cancelled_by"] == "driver"]
+            add(riders, by_rider.groupby("rider_id").size(), "cancellations")
+            add(drivers, by_driver.groupby("driver_id").size(), "cancellations")
+            add_decisions(riders, cancellations.groupby(["rider_id", "decision"]).size())
+            add_decisions(drivers, cancellations.groupby(["driver_id", "decision"]).size())
+
+    def _redecide(self, cancellations: pd.DataFrame) -> int:
+        """Move folded-in cancellations whose decision has changed since to their new decision."""
+        if cancellations.empty or not self.decisions:
+            return 0
+        folded = cancellations.join(pd.Series(self.decisions, name="folded"), on="cancellation_id", how="inner")
+        changed = folded[folded["decision"] != folded["folded"]]
+        for cancellation in changed.itertuples():
+            for target, entity_id in ((self.riders, cancellation.rider_id), (self.drivers, cancellation.driver_id)):
+                decisions = target.setdefault(entity_id, _tally())["decisions"]
+                decisions[cancellation.folded] -= 1
+                if not decisions[cancellation.folded]:
+                    del decisions[cancellation.folded]
+                decisions[cancellation.decision] = decisions.get(cancellation.decision, 0) + 1
+            self.decisions[cancellation.cancellation_id] = cancellation.decision
+        return len(changed)
+
+    def update(self) -> int:
+        """Fold in records created since the checkpoint and changed decisions; returns how many records changed."""
+        cutoff = (datetime.now() - timedelta(seconds=self.settle_seconds)).isoformat()
+        bookings = self._pending("bookings", "booking_id", cutoff)
+        all_cancellations = pd.DataFrame(self._rows("cancellations"))
+        redecided = self._redecide(all_cancellations)
+        cancellations = self._pending("cancellations", "cancellation_id", cutoff, frame=all_cancellations)
+        self._fold(bookings, cancellations, self.riders, self.drivers)
+        if not cancellations.empty:
+            self.decisions.update(zip(cancellations["cancellation_id"], cancellations["decision"]))
+        self._save()
+        return len(bookings) + len(cancellations) + redecided
+
+    def rebuild(self) -> int:
+        """Recompute every statistic from scratch, keeping the baselines; returns how many records were read."""
+        self.riders, self.drivers = {}, {}
+        self.checkpoint = {"bookings": None, "cancellations": None}
+        self.decisions = {}
+        return self.update()
+
+    @staticmethod
+    def _stats(tally: Optional[dict]) -> dict:
+        tally = tally or _tally()
+        rides, cancellations = tally["rides"], tally["cancellations"]
+        return {
+            "rides": rides,
+            "cancellations": cancellations,
+            "cancellation_rate": cancellations / rides * 100 if rides else 0.0,
+            "decisions": dict(tally["decisions"]),
+        }
+
+    def rider_stats(self, rider_id: str) -> dict:
+        """Projected rides booked, cancellations, cancellation rate and fee decisions for a rider."""
+        return self._stats(self.riders.get(rider_id))
+
+    def driver_stats(self, driver_id: str) -> dict:
+        """Projected rides accepted, cancellations, cancellation rate and fee decisions for a driver."""
+        return self._stats(self.drivers.get(driver_id))
+
+    def _unfolded(self) -> Dict[str, Dict[str, dict]]:
+        """Tallies of the records not folded in yet, however young."""
+        riders: Dict[str, dict] = {}
+        drivers: Dict[str, dict] = {}
+        self._fold(self._pending("bookings", "booking_id", None, advance=False),
+                   self._pending("cancellations", "cancellation_id", None, advance=False), riders, drivers)
+        return {"riders": riders, "drivers": drivers}
+
+    def _counts(self, user_manager) -> Dict[str, Dict[str, tuple]]:
+        """The stored and the record-backed (rides, cancellations) of every rider and driver with records."""
+        counts: Dict[str, Dict[str, tuple]] = {"riders": {}, "drivers": {}}
+        # Records too young to fold in are already in the counters, so they count here too
+        unfolded = self._unfolded()
+        for table, tallies, get, rides_field in (("riders", self.riders, user_manager.get_rider, "total_rides_booked"),
+                                                 ("drivers", self.drivers, user_manager.get_driver, "total_rides_accepted")):
+            for entity_id in set(tallies) | set(unfolded[table]):
+                entity = get(entity_id)
+                if entity is None:
+                    continue
+                stats, pending = self._stats(tallies.get(entity_id)), self._stats(unfolded[table].get(entity_id))
+                counted = (stats["rides"] + pending["rides"], stats["cancellations"] + pending["cancellations"])
+                counts[table][entity_id] = (entity, (getattr(entity, rides_field), entity.prior_cancellations), counted)
+        return counts
+
+    def init_baselines(self, user_manager) -> int:
+        """Keep the counts not backed by records as the baseline of every rider and driver that has none yet;
+        returns how many baselines were added. Drift that exists now becomes part of the baseline."""
+        added = 0
+        for table, entities in self._counts(user_manager).items():
+            baselines = self.baselines[table]
+            for entity_id, (_, stored, counted) in entities.items():
+                if entity_id not in baselines:
+                    baselines[entity_id] = {"rides": stored[0] - counted[0], "cancellations": stored[1] - counted[1]}
+                    added += 1
+        self._save()
+        return added
+
+    def _differences(self, user_manager, overwrite: bool = False) -> Dict[str, List[dict]]:
+        differences: Dict[str, List[dict]] = {"riders": [], "drivers": []}
+        rides_fields = {"riders": "total_rides_booked", "drivers": "total_rides_accepted"}
+        for table, entities in self._counts(user_manager).items():
+            for entity_id, (entity, stored, counted) in entities.items():
+                baseline = _tally() if overwrite else self.baselines[table].get(entity_id)
+                if baseline is None:
+                    continue
+                rides = counted[0] + baseline["rides"]
+                cancellations = counted[1] + baseline["cancellations"]
+                if (rides, cancellations) != stored:
+                    differences[table].append({**entity.model_dump(), rides_fields[table]: rides,
+                                               "prior_cancellations": cancellations,
+                                               "cancelation_rate": cancellations / rides * 100 if rides else 0.0})
+        return differences
+
+    def audit(self, user_manager, overwrite: bool = False) -> Dict[str, List[dict]]:
+        """Riders and drivers whose stored counters disagree with their baseline plus the projection,
+        as corrected records; changes nothing. With `overwrite` the counters are compared with the
+        projection alone, baseline or not."""
+        return self._differences(user_manager, overwrite)
+
+    def apply(self, user_manager, overwrite: bool = False) -> int:
+        """Correct stored counters that disagree with their baseline plus the projection; returns how many changed.
+
+        With `overwrite` the counters are rebuilt from the records alone, dropping any
+        history the records do not cover.
+        """
+        differences = self._differences(user_manager, overwrite)
+        user_manager.bulk_upsert_riders(differences["riders"])
+        user_manager.bulk_upsert_drivers(differences["drivers"])
+        if overwrite:
+            # The counters now hold the records alone
+            for table, tallies in (("riders", self.riders), ("drivers", self.drivers)):
+                self.baselines[table].update((entity_id, {"rides": 0, "cancellations": 0}) for entity_id in tallies)
+            self._save()
+        return len(differences["riders"]) + len(differences["drivers"])
+
+def main() -> None:
+    from utils.user_manager import UserManager
+
+    parser = argparse.ArgumentParser(description="Project rider and driver statistics from bookings and cancellations.")
+    parser.add_argument("--storage-dir", default="data")
+    parser.add_argument("--rebuild", action="store_true", help="recompute from scratch instead of from the checkpoint")
+    parser.add_argument("--init-baselines", action="store_true",
+                        help="keep the counts records do not cover as the baseline of riders and drivers without one")
+    parser.add_argument("--apply", action="store_true", help="write corrected counters back to riders and drivers")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="with --apply, set counters from the records alone, dropping history they do not cover")
+    args = parser.parse_args()
+
+    projector = StatsProjector(args.storage_dir)
+    processed = projector.rebuild() if args.rebuild else projector.update()
+    print(f"Processed {processed} records")
+    if args.init_baselines:
+        print(f"Added {projector.init_baselines(UserManager(args.storage_dir))} baselines")
+    if args.apply:
+        print(f"Corrected {projector.apply(UserManager(args.storage_dir), args.overwrite)} riders and drivers")
+
+if __name__ == "__main__":
+    main()
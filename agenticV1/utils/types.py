@@ -90,6 +90,10 @@ class RiderCancels(BaseModel):
     rider_rating: float
     rider_cancelation_rate: float
     cancelation_time: int | None = None
+    # Rolling-window rates, None when the rider booked no rides in that window
+    rider_cancelation_rate_7d: float | None = None
+    rider_cancelation_rate_30d: float | None = None
+    rider_cancelation_rate_90d: float | None = None
 
 class output(BaseModel):
     tool_call: Literal['book_ride', 'cancel_ride', 'list_bookings', 'answer_query', 'logout']
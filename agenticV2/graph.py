@@ -3,6 +3,7 @@ from dotenv import load_dotenv
 from langchain_core.messages import BaseMessage, ToolMessage, SystemMessage, HumanMessage
 from langchain_groq import ChatGroq
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph.message import add_messages
 from langgraph.graph import StateGraph, END, START
 from langgraph.prebuilt import ToolNode
@@ -11,17 +12,18 @@ from tools.cancellation_tool import cancel_ride
 from tools.chatbot_tool import answer_query
 from tools.list_booking_tool import list_bookings
 from utils.types import Rider, AgentState, BookingRecord, CancellationEvent, output
-from utils.booking_manager import BookingManager
+from utils.registry import get_booking_manager
+from utils.graph_cache import get_graph
+from utils.history import HistoryPolicy
 from utils.input_handlers import get_wait_time, get_cancellation_time
 from langchain_core.output_parsers.pydantic import PydanticOutputParser
-# from langgraph.checkpoint.filesystem import FileSystemSaver
 
 import json
 
 load_dotenv()
 
 # Initialize tools and managers
-booking_manager = BookingManager()
+booking_manager = get_booking_manager()
 
 # Initialize the model with Groq
 model = ChatGroq(
@@ -31,6 +33,9 @@ model = ChatGroq(
 
 parser = PydanticOutputParser(pydantic_object=output)
 
+# Recent turns verbatim, older ones summarized, so the prompt stays bounded
+history = HistoryPolicy()
+
 system_prompt = SystemMessage(content=f"""
 You are a helpful Uber assistant. Respond with one of the following tools based on the user's intent:
 
@@ -45,21 +50,30 @@ Respond ONLY with the correct JSON structure as follows:
 """)
 
 def chatbot(state: AgentState)->AgentState:
-    response = model.invoke([system_prompt] + state["messages"])
+    response = model.invoke([system_prompt] + history.messages(state, model))
     state["messages"].append(response)
     return state
 
-def build_graph():
+async def achatbot(state: AgentState)->AgentState:
+    response = await model.ainvoke([system_prompt] + await history.amessages(state, model))
+    state["messages"].append(response)
+    return state
+
+def build_graph(checkpointer=None):
     builder = StateGraph(AgentState)
-    builder.add_node("chatbot",chatbot)
+    # Sync and async implementations, so one compiled graph serves both invoke and ainvoke
+    builder.add_node("chatbot", RunnableLambda(chatbot, afunc=achatbot, name="chatbot"))
 
     builder.add_edge(START, "chatbot")
     builder.add_edge("chatbot", END)
 
-    # memory = FileSystemSaver("chatbot_memory_dir")  # Directory to store state files
-    graph = builder.compile()
+    # With a checkpointer, each thread's state is kept between invocations
+    graph = builder.compile(checkpointer=checkpointer)
     return graph
 
+# Compiled once per process; main.py and LangGraph Studio share this instance
+agent = get_graph(build_graph)
+
 
 
 
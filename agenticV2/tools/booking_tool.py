@@ -1,8 +1,6 @@
 from langchain.tools import tool
 from typing import Optional
-import random
-from utils.user_manager import UserManager
-from utils.booking_manager import BookingManager
+from utils.registry import get_user_manager, get_booking_manager, aget_user_manager, aget_booking_manager
 from utils.types import BookingRecord, AgentState
 
 @tool
@@ -18,8 +16,8 @@ def book_ride(pickup: str, drop: str, state: AgentState) -> Optional[BookingReco
         Will return a BookingRecord if successful otherwise None. Append this BookingRecord to state under booking_info
     """
     # Initialize managers
-    user_manager = UserManager()
-    booking_manager = BookingManager()
+    user_manager = get_user_manager()
+    booking_manager = get_booking_manager()
 
     # Extract rider_id from state
     rider = state.get('rider')
@@ -27,14 +25,11 @@ def book_ride(pickup: str, drop: str, state: AgentState) -> Optional[BookingReco
         return None
     rider_id = rider.rider_id
 
-    # Get all available drivers
-    available_drivers = list(user_manager.drivers.values())
-    if not available_drivers:
+    # Randomly select one of the available drivers
+    selected_driver = user_manager.random_driver()
+    if selected_driver is None:
         return None
 
-    # Randomly select a driver
-    selected_driver = random.choice(available_drivers)
-
     # Create booking record
     booking = booking_manager.create_booking(
         rider_id=rider_id,
@@ -47,4 +42,31 @@ def book_ride(pickup: str, drop: str, state: AgentState) -> Optional[BookingReco
     user_manager.update_rider_stats(rider_id, add_booking=True)
     user_manager.update_driver_stats(selected_driver.driver_id, add_ride=True)
 
-    return booking 
\ No newline at end of file
+    return booking
+
+async def abook_ride(pickup: str, drop: str, state: AgentState) -> Optional[BookingRecord]:
+    """Awaitable `book_ride`, with manager calls on the storage executor."""
+    user_manager = await aget_user_manager()
+    booking_manager = await aget_booking_manager()
+
+    rider = state.get('rider')
+    if not rider or not hasattr(rider, 'rider_id'):
+        return None
+    rider_id = rider.rider_id
+
+    selected_driver = await user_manager.arandom_driver()
+    if selected_driver is None:
+        return None
+
+    booking = await booking_manager.acreate_booking(
+        rider_id=rider_id,
+        driver_id=selected_driver.driver_id,
+        pickup=pickup,
+        drop=drop
+    )
+    await user_manager.aupdate_rider_stats(rider_id, add_booking=True)
+    await user_manager.aupdate_driver_stats(selected_driver.driver_id, add_ride=True)
+    return booking
+
+# Run by `book_ride.ainvoke`, so async graphs and sessions await it natively
+book_ride.coroutine = abook_ride
@@ -1,30 +1,19 @@
+import asyncio
 from langchain.tools import tool
-from typing import Optional
+from typing import Optional, Tuple
 from langchain_core.messages import ToolMessage
-from utils.user_manager import UserManager
-from utils.booking_manager import BookingManager
-from utils.cancellation_manager import CancellationManager
-from utils.types import CancellationRecord, DriverCancels, RiderCancels
+from utils.registry import get_user_manager, get_booking_manager, get_cancellation_manager, get_rolling_features
+from utils.unit_of_work import UnitOfWork
+from utils.booking_manager import BookingNotActive
+from utils.async_storage import run_storage
+from utils.types import BookingRecord, CancellationRecord, DriverCancels, Rider, RiderCancels
 from cancelation_models.driver_function import predict_driver_cancellation_decision
 from cancelation_models.rider_function import predict_rider_cancellation_decision
 
-@tool
-def cancel_ride(
-    booking_id: str,
-    state: dict
-) -> Optional[CancellationRecord]:
-    """Use this tool to cancel a ride/booking/trip. Only booking_id is required as input; all other details are collected interactively as needed.
-
-    Args:
-        booking_id: Booking ID to cancel
-        state: Conversation state dict with a 'messages' list
-
-    Returns:
-        Cancellation details if successful, None if booking not found or invalid input
-    """
-    user_manager = UserManager()
-    booking_manager = BookingManager()
-    cancellation_manager = CancellationManager()
+def _lookup(booking_id: str, state: dict) -> Optional[Tuple[BookingRecord, Rider]]:
+    """The active booking and its rider, None if either or the driver is missing."""
+    user_manager = get_user_manager()
+    booking_manager = get_booking_manager()
 
     # Get and validate booking
     booking = booking_manager.get_booking(booking_id)
@@ -44,6 +33,14 @@ def cancel_ride(
         # state["messages"].append(ToolMessage(content=f"Error: Rider with ID {booking.rider_id} not found in the system. Please contact support."))
         return None
 
+    return booking, rider
+
+def _interview(booking: BookingRecord, rider: Rider, state: dict) -> Optional[dict]:
+    """Ask on the console how the ride was cancelled and decide the fee; the fields of the
+    cancellation record, None if the input was invalid."""
+    booking_id = booking.booking_id
+    rolling_features = get_rolling_features()
+
     # Prompt for who cancelled
     while True:
         who_cancelled = input("Who is cancelling? [driver/rider]: ").strip().lower()
@@ -64,23 +61,9 @@ def cancel_ride(
         if not arrived:
             decision = "fee waived"
             # state["messages"].append(ToolMessage(content="Fee Waived, since driver did not arrive."))
-            cancellation_record = cancellation_manager.create_cancellation(
-                booking_id=booking_id,
-                rider_id=booking.rider_id,
-                driver_id=booking.driver_id,
-                cancelled_by=who_cancelled,
-                arrived=arrived,
-                distance_from_pin=None,
-                wait_time=None,
-                rider_rating=rider.rider_rating,
-                rider_cancellation_rate=rider.cancelation_rate,
-                cancellation_time=None,
-                decision=decision
-            )
-            booking_manager.cancel_booking(booking_id)
             # state["messages"].append(ToolMessage(content=f"Cancellation processed for booking {booking_id}."))
-            user_manager.update_driver_stats(booking.driver_id, add_cancellation=True)
-            return cancellation_record
+            return dict(cancelled_by=who_cancelled, arrived=arrived, distance_from_pin=None,
+                        wait_time=None, cancellation_time=None, decision=decision)
         # 2. Ask distance from pin
         while True:
             try:
@@ -96,23 +79,9 @@ def cancel_ride(
         if distance_from_pin > 100:
             decision = "fee waived"
             # state["messages"].append(ToolMessage(content="Fee Waived, since distance from pin is greater than 100 meters."))
-            cancellation_record = cancellation_manager.create_cancellation(
-                booking_id=booking_id,
-                rider_id=booking.rider_id,
-                driver_id=booking.driver_id,
-                cancelled_by=who_cancelled,
-                arrived=arrived,
-                distance_from_pin=distance_from_pin,
-                wait_time=None,
-                rider_rating=rider.rider_rating,
-                rider_cancellation_rate=rider.cancelation_rate,
-                cancellation_time=None,
-                decision=decision
-            )
-            booking_manager.cancel_booking(booking_id)
             # state["messages"].append(ToolMessage(content=f"Cancellation processed for booking {booking_id}."))
-            user_manager.update_driver_stats(booking.driver_id, add_cancellation=True)
-            return cancellation_record
+            return dict(cancelled_by=who_cancelled, arrived=arrived, distance_from_pin=distance_from_pin,
+                        wait_time=None, cancellation_time=None, decision=decision)
         # 3. Ask wait time
         while True:
             try:
@@ -128,23 +97,9 @@ def cancel_ride(
         if wait_time <= 2:
             decision = "fee waived"
             # state["messages"].append(ToolMessage(content="Fee Waived, since wait time is less than or equal to 2 minutes."))
-            cancellation_record = cancellation_manager.create_cancellation(
-                booking_id=booking_id,
-                rider_id=booking.rider_id,
-                driver_id=booking.driver_id,
-                cancelled_by=who_cancelled,
-                arrived=arrived,
-                distance_from_pin=distance_from_pin,
-                wait_time=wait_time,
-                rider_rating=rider.rider_rating,
-                rider_cancellation_rate=rider.cancelation_rate,
-                cancellation_time=None,
-                decision=decision
-            )
-            booking_manager.cancel_booking(booking_id)
             # state["messages"].append(ToolMessage(content=f"Cancellation processed for booking {booking_id}."))
-            user_manager.update_driver_stats(booking.driver_id, add_cancellation=True)
-            return cancellation_record
+            return dict(cancelled_by=who_cancelled, arrived=arrived, distance_from_pin=distance_from_pin,
+                        wait_time=wait_time, cancellation_time=None, decision=decision)
         # Otherwise, use ML model
         cancel = DriverCancels(
             cancelation_id=booking_id,
@@ -156,23 +111,9 @@ def cancel_ride(
             rider_rating=rider.rider_rating
         )
         decision = predict_driver_cancellation_decision(cancel)
-        user_manager.update_driver_stats(booking.driver_id, add_cancellation=True)
-        cancellation_record = cancellation_manager.create_cancellation(
-            booking_id=booking_id,
-            rider_id=booking.rider_id,
-            driver_id=booking.driver_id,
-            cancelled_by=who_cancelled,
-            arrived=arrived,
-            distance_from_pin=distance_from_pin,
-            wait_time=wait_time,
-            rider_rating=rider.rider_rating,
-            rider_cancellation_rate=rider.cancelation_rate,
-            cancellation_time=None,
-            decision=decision
-        )
-        booking_manager.cancel_booking(booking_id)
         # state["messages"].append(ToolMessage(content=f"Cancellation processed for booking {booking_id}. Fee applied: {decision}"))
-        return cancellation_record
+        return dict(cancelled_by=who_cancelled, arrived=arrived, distance_from_pin=distance_from_pin,
+                    wait_time=wait_time, cancellation_time=None, decision=decision)
 
     # --- RIDER CANCELS ---
     if who_cancelled == "rider":
@@ -208,6 +149,7 @@ def cancel_ride(
                     wait_time=None,
                     rider_rating=rider.rider_rating,
                     rider_cancelation_rate=rider.cancelation_rate,
+                    **rolling_features.rider_cancelation_rates(booking.rider_id),
                     cancelation_time=cancellation_time
                 )
             else:
@@ -221,26 +163,13 @@ def cancel_ride(
                     wait_time=None,
                     rider_rating=rider.rider_rating,
                     rider_cancelation_rate=rider.cancelation_rate,
+                    **rolling_features.rider_cancelation_rates(booking.rider_id),
                     cancelation_time=cancellation_time
                 )
             decision = predict_rider_cancellation_decision(cancel)
-            user_manager.update_rider_stats(booking.rider_id, add_cancellation=True)
-            cancellation_record = cancellation_manager.create_cancellation(
-                booking_id=booking_id,
-                rider_id=booking.rider_id,
-                driver_id=booking.driver_id,
-                cancelled_by=who_cancelled,
-                arrived=arrived,
-                distance_from_pin=None,
-                wait_time=None,
-                rider_rating=rider.rider_rating,
-                rider_cancellation_rate=rider.cancelation_rate,
-                cancellation_time=cancellation_time,
-                decision=decision
-            )
-            booking_manager.cancel_booking(booking_id)
             # state["messages"].append(ToolMessage(content=f"Cancellation processed for booking {booking_id}."))
-            return cancellation_record
+            return dict(cancelled_by=who_cancelled, arrived=arrived, distance_from_pin=None,
+                        wait_time=None, cancellation_time=cancellation_time, decision=decision)
         # If arrived, ask wait_time and distance_from_pin
         while True:
             try:
@@ -272,27 +201,81 @@ def cancel_ride(
             wait_time=wait_time,
             rider_rating=rider.rider_rating,
             rider_cancelation_rate=rider.cancelation_rate,
+            **rolling_features.rider_cancelation_rates(booking.rider_id),
             cancelation_time=None
         )
         decision = predict_rider_cancellation_decision(cancel)
-        user_manager.update_rider_stats(booking.rider_id, add_cancellation=True)
-        cancellation_record = cancellation_manager.create_cancellation(
-            booking_id=booking_id,
-            rider_id=booking.rider_id,
-            driver_id=booking.driver_id,
-            cancelled_by=who_cancelled,
-            arrived=arrived,
-            distance_from_pin=distance_from_pin,
-            wait_time=wait_time,
-            rider_rating=rider.rider_rating,
-            rider_cancellation_rate=rider.cancelation_rate,
-            cancellation_time=None,
-            decision=decision
-        )
-        booking_manager.cancel_booking(booking_id)
         # state["messages"].append(ToolMessage(content=f"Cancellation processed for booking {booking_id}."))
-        return cancellation_record
+        return dict(cancelled_by=who_cancelled, arrived=arrived, distance_from_pin=distance_from_pin,
+                    wait_time=wait_time, cancellation_time=None, decision=decision)
 
     # Should not reach here, but return None for safety
     # state["messages"].append(ToolMessage(content="Unexpected error in cancellation flow."))
-    return None
\ No newline at end of file
+    return None
+
+def _commit(booking: BookingRecord, rider: Rider, cancelled_by: str, **fields) -> Optional[CancellationRecord]:
+    """Record the cancellation, cancel the booking and count it against whoever cancelled, as one unit;
+    None if the booking stopped being active since the lookup."""
+    user_manager = get_user_manager()
+    booking_manager = get_booking_manager()
+    cancellation_manager = get_cancellation_manager()
+    # The rate the fee model saw, read before the update below changes the stored rider
+    # (which on the dict table is this very object, and on the columnar table a copy)
+    rider_cancellation_rate = rider.cancelation_rate
+    try:
+        with UnitOfWork(user_manager, booking_manager, cancellation_manager):
+            # A concurrent cancel of the same booking may have committed since the lookup
+            booking_manager.require_active(booking.booking_id)
+            if cancelled_by == "driver":
+                user_manager.update_driver_stats(booking.driver_id, add_cancellation=True)
+            else:
+                user_manager.update_rider_stats(booking.rider_id, add_cancellation=True)
+            cancellation_record = cancellation_manager.create_cancellation(
+                booking_id=booking.booking_id,
+                rider_id=booking.rider_id,
+                driver_id=booking.driver_id,
+                cancelled_by=cancelled_by,
+                rider_rating=rider.rider_rating,
+                rider_cancellation_rate=rider_cancellation_rate,
+                **fields
+            )
+            booking_manager.cancel_booking(booking.booking_id)
+    except BookingNotActive:
+        return None
+    return cancellation_record
+
+@tool
+def cancel_ride(
+    booking_id: str,
+    state: dict
+) -> Optional[CancellationRecord]:
+    """Use this tool to cancel a ride/booking/trip. Only booking_id is required as input; all other details are collected interactively as needed.
+
+    Args:
+        booking_id: Booking ID to cancel
+        state: Conversation state dict with a 'messages' list
+
+    Returns:
+        Cancellation details if successful, None if booking not found or invalid input
+    """
+    found = _lookup(booking_id, state)
+    if found is None:
+        return None
+    fields = _interview(*found, state)
+    if fields is None:
+        return None
+    return _commit(*found, **fields)
+
+async def acancel_ride(booking_id: str, state: dict) -> Optional[CancellationRecord]:
+    """Awaitable `cancel_ride`. Lookups and the commit run on the storage executor and the
+    console questions on a thread of their own, so a rider slow to answer holds no storage worker."""
+    found = await run_storage(_lookup, booking_id, state)
+    if found is None:
+        return None
+    fields = await asyncio.to_thread(_interview, *found, state)
+    if fields is None:
+        return None
+    return await run_storage(_commit, *found, **fields)
+
+# Run by `cancel_ride.ainvoke`, so async graphs and sessions await it without blocking the loop
+cancel_ride.coroutine = acancel_ride
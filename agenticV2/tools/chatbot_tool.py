@@ -1,3 +1,4 @@
+from typing import Iterator
 from langchain.tools import tool
 from RAG.RAG import chain
 
@@ -15,6 +16,27 @@ def answer_query(query: str) -> str:
         result = chain.invoke(query)
         return result.content
     except:
-        return "I don't know the answer to that question." 
+        return "I don't know the answer to that question."
 
- 
\ No newline at end of file
+async def aanswer_query(query: str) -> str:
+    """Awaitable `answer_query`; the retrieval and the completion are awaited on the RAG chain."""
+    try:
+        result = await chain.ainvoke(query)
+        return result.content
+    except Exception:
+        return "I don't know the answer to that question."
+
+# Run by `answer_query.ainvoke`, so async graphs and sessions await it natively
+answer_query.coroutine = aanswer_query
+
+def stream_answer(query: str) -> Iterator[str]:
+    """Answer a question about Uber like `answer_query`, yielding the text as the model writes it."""
+    answered = False
+    try:
+        for chunk in chain.stream(query):
+            if chunk.content:
+                answered = True
+                yield chunk.content
+    except Exception:
+        if not answered:
+            yield "I don't know the answer to that question."
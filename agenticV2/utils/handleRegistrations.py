@@ -1,6 +1,6 @@
-from utils.user_manager import UserManager
+from utils.registry import get_user_manager
 
-user_manager = UserManager()
+user_manager = get_user_manager()
 
 def get_float_input(prompt: str, min_val: float, max_val: float) -> float:
     while True:
@@ -0,0 +1,82 @@
+import os
+import threading
+from typing import Dict, Tuple
+from utils.user_manager import UserManager
+from utils.booking_manager import BookingManager
+from utils.cancellation_manager import CancellationManager
+from utils.async_storage import run_storage
+from utils.rolling_features import RollingFeatures
+from utils.checkpointer import SQLiteCheckpointer, open_checkpointer
+
+# Long-lived managers shared by every tool call and node in the process, one per
+# (manager class, storage dir). Each is reloaded only when its files change on disk.
+_managers: Dict[Tuple[type, str], object] = {}
+_features: Dict[str, RollingFeatures] = {}
+_checkpointers: Dict[str, SQLiteCheckpointer] = {}
+_lock = threading.Lock()
+
+def _get_manager(manager_cls, storage_dir: str):
+    key = (manager_cls, os.path.abspath(storage_dir))
+    with _lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = manager_cls(storage_dir)
+            return manager
+    manager.refresh()
+    return manager
+
+def get_user_manager(storage_dir: str = "data") -> UserManager:
+    """Shared UserManager for `storage_dir`."""
+    return _get_manager(UserManager, storage_dir)
+
+def get_booking_manager(storage_dir: str = "data") -> BookingManager:
+    """Shared BookingManager for `storage_dir`."""
+    return _get_manager(BookingManager, storage_dir)
+
+def get_cancellation_manager(storage_dir: str = "data") -> CancellationManager:
+    """Shared CancellationManager for `storage_dir`."""
+    return _get_manager(CancellationManager, storage_dir)
+
+def get_rolling_features(storage_dir: str = "data") -> RollingFeatures:
+    """Shared RollingFeatures over the shared booking and cancellation managers for `storage_dir`."""
+    # Refreshing the managers feeds the features anything other processes wrote
+    booking_manager = get_booking_manager(storage_dir)
+    cancellation_manager = get_cancellation_manager(storage_dir)
+    key = os.path.abspath(storage_dir)
+    with _lock:
+        features = _features.get(key)
+        if features is None:
+            features = _features[key] = RollingFeatures(booking_manager, cancellation_manager)
+    return features
+
+def get_checkpointer(storage_dir: str = "data") -> SQLiteCheckpointer:
+    """Shared conversation checkpointer over `storage_dir/checkpoints.db`."""
+    key = os.path.abspath(storage_dir)
+    with _lock:
+        checkpointer = _checkpointers.get(key)
+        if checkpointer is None:
+            checkpointer = _checkpointers[key] = open_checkpointer(storage_dir)
+    return checkpointer
+
+async def aget_user_manager(storage_dir: str = "data") -> UserManager:
+    """Shared UserManager for `storage_dir`, built or refreshed off the event loop."""
+    return await run_storage(get_user_manager, storage_dir)
+
+async def aget_booking_manager(storage_dir: str = "data") -> BookingManager:
+    """Shared BookingManager for `storage_dir`, built or refreshed off the event loop."""
+    return await run_storage(get_booking_manager, storage_dir)
+
+async def aget_cancellation_manager(storage_dir: str = "data") -> CancellationManager:
+    """Shared CancellationManager for `storage_dir`, built or refreshed off the event loop."""
+    return await run_storage(get_cancellation_manager, storage_dir)
+
+async def aget_rolling_features(storage_dir: str = "data") -> RollingFeatures:
+    """Shared RollingFeatures for `storage_dir`, built or refreshed off the event loop."""
+    return await run_storage(get_rolling_features, storage_dir)
+
+def reset_managers() -> None:
+    """Forget every shared manager so the next call builds fresh ones."""
+    with _lock:
+        _managers.clear()
+        _features.clear()
+        _checkpointers.clear()
@@ -0,0 +1,55 @@
+import json
+import re
+import threading
+from typing import Any, Iterable, Optional
+
+class PartialJson:
+    """A flat JSON object read while the model is still writing it.
+
+    A field is available as soon as its value is complete, so the caller can
+    act on `tool_call` before the rest of the object arrives. Text around the
+    object, such as a ```json fence, is ignored.
+    """
+
+    def __init__(self):
+        self.text = ""
+
+    def feed(self, chunk: str) -> None:
+        self.text += chunk
+
+    def final(self, key: str) -> Optional[Any]:
+        """The value of `key` once it can no longer change, otherwise None."""
+        # A value is complete once the separator or closing brace after it has arrived
+        match = re.search(rf'"{re.escape(key)}"\s*:\s*("(?:[^"\\]|\\.)*"|null|true|false|-?[\d.eE+-]+)\s*[,}}]',
+                          self.text)
+        return json.loads(match.group(1)) if match else None
+
+def print_stream(chunks: Iterable[str], prefix: str = "\nAssistant: ") -> str:
+    """Print text chunks as they arrive, after `prefix`; returns the whole text."""
+    parts = []
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if not parts:
+            print(prefix, end="")
+        print(chunk, end="", flush=True)
+        parts.append(chunk)
+    if parts:
+        print()
+    return "".join(parts)
+
+class BackgroundPrint:
+    """`print_stream` on a daemon thread, so text prints while the caller carries on."""
+
+    def __init__(self, chunks: Iterable[str], prefix: str = "\nAssistant: "):
+        self._text = ""
+        self._thread = threading.Thread(target=self._run, args=(chunks, prefix), daemon=True)
+        self._thread.start()
+
+    def _run(self, chunks: Iterable[str], prefix: str) -> None:
+        self._text = print_stream(chunks, prefix)
+
+    def result(self) -> str:
+        """The whole text, once it has finished printing."""
+        self._thread.join()
+        return self._text
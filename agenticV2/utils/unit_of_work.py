@@ -0,0 +1,140 @@
+import glob
+import json
+import os
+import uuid
+from contextlib import ExitStack
+from typing import Dict, List
+from utils.storage import file_lock
+
+JOURNAL_PATTERN = "transaction-*.journal"
+
+def _journal_lock(storage_dir: str):
+    # Serializes journal rewrites across processes; always taken last, after any store lock
+    return file_lock(os.path.join(storage_dir, "transaction.journal"))
+
+def _journal_paths(storage_dir: str) -> List[str]:
+    """Journals of every commit still pending, oldest first."""
+    paths = []
+    for path in glob.glob(os.path.join(storage_dir, JOURNAL_PATTERN)):
+        try:
+            paths.append((os.stat(path).st_mtime_ns, path))
+        except FileNotFoundError:
+            continue
+    return [path for _, path in sorted(paths)]
+
+def _read_journal(path: str) -> Dict[str, List[dict]]:
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, FileNotFoundError):
+        # A torn journal means the commit never started writing tables
+        return {}
+
+def _write_journal(path: str, staged: Dict[str, List[dict]]) -> None:
+    if not staged:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    temp_file = path + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(staged, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+
+def pending_journal(storage_dir: str, table: str) -> List[dict]:
+    """Records of `table` from commits that did not finish, later commits last.
+
+    Call while holding the table's store lock: a commit holds it until its
+    journal is gone, so only journals of commits that died are seen.
+    """
+    with _journal_lock(storage_dir):
+        return [record for path in _journal_paths(storage_dir) for record in _read_journal(path).get(table, [])]
+
+def complete_journal(storage_dir: str, table: str) -> None:
+    """Drop `table` from every pending journal once its records are persisted."""
+    with _journal_lock(storage_dir):
+        for path in _journal_paths(storage_dir):
+            staged = _read_journal(path)
+            if table in staged:
+                del staged[table]
+                _write_journal(path, staged)
+
+class UnitOfWork:
+    """Stage changes across several managers and commit them together.
+
+    Entering the block takes each manager's lock and its stores' cross-process
+    locks, then reloads anything other processes wrote, so the reads inside the
+    block and the writes at commit form one read-modify-write that no other
+    process can interleave with. Inside the block the managers keep every
+    mutation in memory. On a clean exit the staged records are journaled first,
+    then each touched table gets exactly one atomic write and the journal is
+    removed. If the process dies between those writes, the next manager to load
+    the storage dir replays its part of the journal, so a commit is never left
+    half-applied. If the block raises, the staged changes are discarded and the
+    managers reload from storage.
+
+        with UnitOfWork(user_manager, booking_manager, cancellation_manager):
+            cancellation_manager.create_cancellation(...)
+            booking_manager.cancel_booking(booking_id)
+            user_manager.update_rider_stats(rider_id, add_cancellation=True)
+    """
+
+    def __init__(self, *managers):
+        # A fixed lock order keeps two concurrent units from deadlocking
+        self.managers = sorted(managers, key=lambda manager: (type(manager).__name__, manager.storage_dir))
+        self._stack = ExitStack()
+
+    def __enter__(self) -> "UnitOfWork":
+        with ExitStack() as stack:
+            for manager in self.managers:
+                stack.enter_context(manager.locked())
+                manager._deferred += 1
+                stack.callback(self._undefer, manager)
+            self._stack = stack.pop_all()
+        return self
+
+    @staticmethod
+    def _undefer(manager) -> None:
+        manager._deferred -= 1
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        with self._stack:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        return False
+
+    def commit(self) -> None:
+        """Journal the staged records, then write each touched table once."""
+        staged_by_dir: Dict[str, Dict[str, List[dict]]] = {}
+        for manager in self.managers:
+            for table, records in manager.staged().items():
+                if records:
+                    staged_by_dir.setdefault(manager.storage_dir, {})[table] = records
+
+        # Each commit gets its own journal so concurrent commits never share a file
+        name = f"transaction-{os.getpid()}-{uuid.uuid4().hex}.journal"
+        journals = {storage_dir: os.path.join(storage_dir, name) for storage_dir in staged_by_dir}
+        for storage_dir, staged in staged_by_dir.items():
+            with _journal_lock(storage_dir):
+                _write_journal(journals[storage_dir], staged)
+
+        for manager in self.managers:
+            manager.flush()
+
+        # Anything a manager failed to write stays journaled and is replayed on next load
+        unwritten: Dict[str, Dict[str, List[dict]]] = {storage_dir: {} for storage_dir in staged_by_dir}
+        for manager in self.managers:
+            for table, records in manager.staged().items():
+                if records and manager.storage_dir in unwritten:
+                    unwritten[manager.storage_dir][table] = staged_by_dir[manager.storage_dir][table]
+        for storage_dir, staged in unwritten.items():
+            with _journal_lock(storage_dir):
+                _write_journal(journals[storage_dir], staged)
+
+    def rollback(self) -> None:
+        """Discard the staged changes."""
+        for manager in self.managers:
+            manager.discard()
@@ -1,11 +1,13 @@
 from utils.langsmith_env import setup_env
-from utils.user_manager import UserManager
+from utils.registry import get_user_manager, get_checkpointer
 from graph import build_graph
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from utils.graph_cache import get_graph
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, AIMessageChunk
 from utils.handleRegistrations import handle_user_registration
 from tools.booking_tool import book_ride
 from tools.cancellation_tool import cancel_ride
-from tools.chatbot_tool import answer_query
+from tools.chatbot_tool import stream_answer
+from utils.streaming import PartialJson, BackgroundPrint
 from tools.list_booking_tool import list_bookings
 import json
 import re
@@ -14,7 +16,16 @@ import re
 setup_env() ##Set langsmith environment if api key available
 
 # Initialize user manager as a global instance
-user_manager = UserManager()
+user_manager = get_user_manager()
+
+def save_turn(graph, config, response, seen):
+    """Store the messages and tool results added to `response` after the graph ran in the rider's thread."""
+    if len(response["messages"]) > seen:
+        graph.update_state(config, {
+            "messages": response["messages"][seen:],
+            "booking_info": response.get("booking_info"),
+            "cancellation_event": response.get("cancellation_event")
+        })
 
 def main():
     while True:
@@ -35,24 +46,20 @@ def main():
                 print("Invalid credentials. Please try again or register.")
                 continue
 
+            graph = get_graph(build_graph, checkpointer=get_checkpointer())
+            # One thread per rider, so a conversation picks up where it left off, even after a restart
+            config = {"configurable": {"thread_id": rider.rider_id}}
+
             # Start a new session
             while True:
-                state = {
-                    "rider": rider,
-                    "booking_info": None,
-                    "cancellation_event": None,
-                    "messages": [
-                        SystemMessage(content="Welcome to Uber Chatbot! How can I assist you today?")
-                    ],
-                    "memory": {}
-                }
-
-                print("\nAssistant: Welcome to Uber Chatbot! I am equiped with utilities to book or cancel a ride, list your active bookings, and general questions related to Uber. How can I assist you today? ")
+                started = bool(graph.get_state(config).values.get("messages"))
 
-                while True:
-                    # State will be expected to have cancellation_event of CancellationEvent class but if a cancellation was made previously then it will be of CancellationRecord type
-                    state['cancellation_event'] = None
+                if started:
+                    print("\nAssistant: Welcome back! How can I assist you today?")
+                else:
+                    print("\nAssistant: Welcome to Uber Chatbot! I am equiped with utilities to book or cancel a ride, list your active bookings, and general questions related to Uber. How can I assist you today? ")
 
+                while True:
                     # Get user input
                     try:
                         user_input = input("\nYou: ").strip()
@@ -62,14 +69,35 @@ def main():
                         
                     if not user_input:
                         continue
-                    
-                    # Add user message to state
-                    state["messages"].append(HumanMessage(content=user_input))
-
-                    # Process through graph
-                    graph = build_graph()
-                    # config = {"configurable": {"thread_id": rider.rider_id}}
-                    response = graph.invoke(state)
+
+                    # Only this turn's input is sent; the rest of the state comes from the checkpoint.
+                    # State will be expected to have cancellation_event of CancellationEvent class but if a cancellation was made previously then it will be of CancellationRecord type
+                    turn = {
+                        "rider": rider,
+                        "cancellation_event": None,
+                        "messages": [HumanMessage(content=user_input)]
+                    }
+                    if not started:
+                        turn["booking_info"] = None
+                        turn["memory"] = {}
+                        turn["messages"].insert(0, SystemMessage(content="Welcome to Uber Chatbot! How can I assist you today?"))
+                        started = True
+
+                    # Process through graph, reading the router's reply as it streams in
+                    response = None
+                    router_reply = PartialJson()
+                    answer = None
+                    for mode, chunk in graph.stream(turn, config, stream_mode=["messages", "values"]):
+                        if mode == "values":
+                            response = chunk
+                            continue
+                        message, metadata = chunk
+                        if isinstance(message, AIMessageChunk) and metadata.get("langgraph_node") == "chatbot":
+                            router_reply.feed(message.content)
+                            # The question is the rider's own message, so the answer can start before routing finishes
+                            if answer is None and router_reply.final("tool_call") == "answer_query":
+                                answer = BackgroundPrint(stream_answer(user_input))
+                    seen = len(response["messages"])
                     content = response['messages'][-1].content
 
                     # Remove Markdown code block if present
@@ -142,7 +170,9 @@ def main():
                             response["messages"].append(ai_message)
 
                     elif tool_call == "answer_query":
-                        queryResponse = answer_query.invoke({"query": user_input})
+                        if answer is None:
+                            answer = BackgroundPrint(stream_answer(user_input))
+                        queryResponse = answer.result()
 
                         ai_message = AIMessage(content=queryResponse)
                         response["messages"].append(ai_message)
@@ -150,17 +180,17 @@ def main():
                     elif tool_call == "logout":
                         ai_message = AIMessage(content="Logged out successfully. Returning to main menu.")
                         response["messages"].append(ai_message)
+                        save_turn(graph, config, response, seen)
                         print("\nLogged out successfully. Returning to main menu.")
                         break
 
-                    # Print only the latest AI response from the updated state
+                    save_turn(graph, config, response, seen)
+
+                    # Print only the latest AI response from the updated state; a streamed answer is already on screen
                     latest_msg = response["messages"][-1]
                     content = getattr(latest_msg, 'content', None)
-                    if content:
+                    if content and answer is None:
                         print(f"\nAssistant: {content}")
-
-                    # Update state for next iteration
-                    state = response
                 
                 # Break out of the outer loop if we're logging out
                 break
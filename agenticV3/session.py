@@ -0,0 +1,128 @@
+import asyncio
+import json
+import re
+from typing import Optional
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from graph import build_graph
+from utils.graph_cache import get_graph
+from utils.registry import aget_user_manager, get_checkpointer
+from utils.types import Rider
+from tools.booking_tool import book_ride
+from tools.cancellation_tool import cancel_ride
+from tools.chatbot_tool import answer_query
+from tools.list_booking_tool import list_bookings
+
+def parse_reply(content: str) -> dict:
+    """The router's JSON reply, without any Markdown code block around it."""
+    match = re.search(r"```(?:json)?\s*(.*?)```", content, re.DOTALL)
+    return json.loads(match.group(1) if match else content.strip())
+
+class ChatSession:
+    """One rider's conversation, driven from asyncio code.
+
+    A turn awaits the graph, the model and the tools, and storage calls run on
+    the storage executor, so one event loop can carry many sessions while each
+    waits on the model. State is kept by the shared checkpointer under the
+    rider's ID, so a session resumes where the rider left off.
+    """
+
+    def __init__(self, rider: Rider, graph=None):
+        self.rider = rider
+        self.graph = graph or get_graph(build_graph, checkpointer=get_checkpointer())
+        self.config = {"configurable": {"thread_id": rider.rider_id}}
+        self.started: Optional[bool] = None
+
+    async def _run_tool(self, reply: dict, response: dict, user_input: str) -> Optional[AIMessage]:
+        tool_call = reply.get("tool_call")
+        if tool_call == "book_ride":
+            pickup, drop = reply.get("pickup"), reply.get("drop")
+            if not (pickup and drop):
+                return AIMessage(content="Please provide both pickup and drop locations to book a ride")
+            booking = await book_ride.ainvoke({"pickup": pickup, "drop": drop, "state": response})
+            response["booking_info"] = booking
+            if not booking:
+                return AIMessage(content="Booking failed")
+            return AIMessage(content=f"Ride booked from {pickup} to {drop}. Booking ID: {booking.booking_id}")
+
+        if tool_call == "cancel_ride":
+            booking_id = reply.get("booking_id")
+            if not booking_id:
+                return AIMessage(content="Please provide booking id of the ride you want to cancel")
+            cancellation = await cancel_ride.ainvoke({"booking_id": booking_id, "state": response})
+            response["cancellation_event"] = cancellation
+            if not cancellation:
+                return AIMessage(content="Cancellation failed")
+            details = "\n".join(f"{key.replace('_', ' ').capitalize()}: {value}"
+                                for key, value in cancellation.model_dump().items())
+            return AIMessage(content=(
+                f"Ride with Booking ID {booking_id} has been cancelled.\n"
+                f"Cancellation fee decision: {cancellation.decision}.\n\n"
+                f"Details of Cancellation:\n{details}"
+            ))
+
+        if tool_call == "list_bookings":
+            bookings = await list_bookings.ainvoke({"state": response})
+            if not bookings:
+                return AIMessage(content="No active bookings")
+            return AIMessage(content=f"Here are your active bookings:\n{bookings}")
+
+        if tool_call == "answer_query":
+            return AIMessage(content=await answer_query.ainvoke({"query": user_input}))
+
+        if tool_call == "logout":
+            return AIMessage(content="Logged out successfully. Returning to main menu.")
+        return None
+
+    async def send(self, user_input: str) -> Optional[str]:
+        """Run one turn and return the assistant's reply; None once the rider logs out."""
+        if self.started is None:
+            self.started = bool((await self.graph.aget_state(self.config)).values.get("messages"))
+
+        # Only this turn's input is sent; the rest of the state comes from the checkpoint
+        turn = {
+            "rider": self.rider,
+            "cancellation_event": None,
+            "messages": [HumanMessage(content=user_input)]
+        }
+        if not self.started:
+            turn["booking_info"] = None
+            turn["memory"] = {}
+            turn["messages"].insert(0, SystemMessage(content="Welcome to Uber Chatbot! How can I assist you today?"))
+            self.started = True
+
+        response = await self.graph.ainvoke(turn, self.config)
+        reply = parse_reply(response["messages"][-1].content)
+        message = await self._run_tool(reply, response, user_input)
+        if message is None:
+            return response["messages"][-1].content
+        await self.graph.aupdate_state(self.config, {
+            "messages": [message],
+            "booking_info": response.get("booking_info"),
+            "cancellation_event": response.get("cancellation_event")
+        })
+        return None if reply.get("tool_call") == "logout" else message.content
+
+async def main():
+    """Console chat over ChatSession; the same loop can serve many riders on one event loop."""
+    user_manager = await aget_user_manager()
+    rider_id = (await asyncio.to_thread(input, "Enter User ID: ")).strip()
+    rider_password = (await asyncio.to_thread(input, "Enter password: ")).strip()
+    rider = await user_manager.aauthenticate_rider(rider_id, rider_password)
+    if not rider:
+        print("Invalid credentials.")
+        return
+
+    session = ChatSession(rider)
+    print("\nAssistant: Welcome to Uber Chatbot! How can I assist you today?")
+    while True:
+        user_input = (await asyncio.to_thread(input, "\nYou: ")).strip()
+        if not user_input:
+            continue
+        reply = await session.send(user_input)
+        if reply is None:
+            print("\nLogged out successfully.")
+            return
+        print(f"\nAssistant: {reply}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,10 @@
+import os
+import sys
+import pytest
+
+# Modules import each other as top-level packages (`from utils...`), as when run from this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def storage_dir(tmp_path):
+    return str(tmp_path / "data")
@@ -0,0 +1,28 @@
+import pandas as pd
+from utils.analytics import FleetAnalytics
+from utils.user_manager import UserManager
+
+def test_rider_export_and_ranking_leave_out_passwords(storage_dir):
+    user_manager = UserManager(storage_dir)
+    user_manager.create_rider("rider1", "password1", total_rides=10, prior_cancels=2, cancel_rate=20.0)
+    user_manager.create_rider("rider2", "password2", total_rides=10, prior_cancels=5, cancel_rate=50.0)
+
+    analytics = FleetAnalytics(storage_dir)
+    assert analytics.export()["riders"] == 2
+
+    exported = pd.read_parquet(f"{storage_dir}/analytics/riders.parquet")
+    assert "rider_password" not in exported.columns
+    top = analytics.top("riders", "cancelation_rate")
+    assert "rider_password" not in top.columns
+    assert list(top["rider_id"]) == ["rider2", "rider1"]
+
+def test_export_made_with_other_columns_is_rewritten(storage_dir):
+    UserManager(storage_dir).create_rider("rider1", "password1")
+    analytics = FleetAnalytics(storage_dir)
+    analytics.export()
+    manifest = analytics._manifest()
+    manifest["riders"] = manifest["riders"][0]
+    analytics._write_manifest(manifest)
+
+    assert analytics.export()["riders"] == 1
+    assert analytics.export()["riders"] == 0
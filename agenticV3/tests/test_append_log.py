@@ -0,0 +1,82 @@
+import os
+import threading
+from utils import append_log, codec
+from utils.append_log import AppendOnlyLog
+from utils.booking_manager import BookingManager
+
+def _records(log):
+    with open(log.snapshot_file, 'rb') as f:
+        records = {row["id"]: row for row in codec.loads(f.read())}
+    for row in log.replay():
+        records[row["id"]] = row
+    return records
+
+def _snapshot(log):
+    def snapshot():
+        records = {}
+        if os.path.exists(log.snapshot_file):
+            with open(log.snapshot_file, 'rb') as f:
+                records = {row["id"]: row for row in codec.loads(f.read())}
+        for row in log.replay():
+            records[row["id"]] = row
+        return list(records.values())
+    return snapshot
+
+def test_compaction_folds_the_log_into_the_snapshot(tmp_path):
+    log = AppendOnlyLog(str(tmp_path / "records.json"), compact_threshold=3)
+    log.append_many([{"id": str(i), "value": i} for i in range(3)])
+    log.append({"id": "0", "value": 10})
+    assert log.needs_compaction()
+
+    log.compact(_snapshot(log), background=False)
+    assert not log.exists()
+    assert _records(log) == {"0": {"id": "0", "value": 10}, "1": {"id": "1", "value": 1}, "2": {"id": "2", "value": 2}}
+
+def test_torn_line_is_skipped(tmp_path):
+    log = AppendOnlyLog(str(tmp_path / "records.json"))
+    log.append({"id": "1", "value": 1})
+    with open(log.log_file, 'ab') as f:
+        f.write(b'{"id": "2", "val')
+    assert list(log.replay()) == [{"id": "1", "value": 1}]
+
+def test_appends_proceed_while_the_snapshot_is_written(tmp_path, monkeypatch):
+    log = AppendOnlyLog(str(tmp_path / "records.json"))
+    log.append_many([{"id": str(i), "value": i} for i in range(100)])
+    writing, release = threading.Event(), threading.Event()
+
+    class SlowCodec:
+        loads = staticmethod(codec.loads)
+
+        @staticmethod
+        def dumps(obj, **kwargs):
+            if isinstance(obj, list):
+                writing.set()
+                release.wait(5)
+            return codec.dumps(obj, **kwargs)
+
+    monkeypatch.setattr(append_log, "codec", SlowCodec)
+    log.compact(_snapshot(log))
+    assert writing.wait(5)
+    appended = threading.Thread(target=log.append, args=({"id": "new", "value": -1},))
+    appended.start()
+    appended.join(2)
+    assert not appended.is_alive()
+
+    release.set()
+    log.wait()
+    records = _records(log)
+    assert len(records) == 101 and records["new"] == {"id": "new", "value": -1}
+
+def test_compaction_does_not_force_a_reload(storage_dir, monkeypatch):
+    booking_manager = BookingManager(storage_dir, append_only=True, compact_threshold=5)
+    for i in range(4):
+        booking_manager.create_booking("rider1", f"driver{i}", "A", "B")
+    booking_manager.compact()
+    assert not booking_manager.log.exists()
+    assert not booking_manager.is_stale()
+
+    reloads = []
+    monkeypatch.setattr(booking_manager, "_reload", lambda: reloads.append(1))
+    booking_manager.create_booking("rider1", "driver9", "A", "B")
+    assert reloads == []
+    assert len(BookingManager(storage_dir).bookings) == 5
@@ -0,0 +1,94 @@
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langgraph.graph import END, START, MessagesState, StateGraph
+from utils.checkpointer import SQLiteCheckpointer, open_checkpointer
+from utils.types import Rider
+
+def _graph(checkpointer):
+    def reply(state):
+        last = state["messages"][-1]
+        if last.content == "edit":
+            # Edits the previous reply in place, keeping its ID and object
+            previous = state["messages"][-2]
+            previous.content = "edited"
+            return {"messages": [previous]}
+        return {"messages": [AIMessage(content=f"echo {last.content}")]}
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("reply", reply)
+    builder.add_edge(START, "reply")
+    builder.add_edge("reply", END)
+    return builder.compile(checkpointer=checkpointer)
+
+def _contents(graph, config):
+    return [message.content for message in graph.get_state(config).values.get("messages", [])]
+
+def test_conversation_resumes_after_restart(storage_dir):
+    config = {"configurable": {"thread_id": "rider1"}}
+    graph = _graph(open_checkpointer(storage_dir))
+    graph.invoke({"messages": [HumanMessage(content="hi")]}, config)
+    graph.invoke({"messages": [HumanMessage(content="again")]}, config)
+
+    checkpointer = open_checkpointer(storage_dir)
+    assert _contents(_graph(checkpointer), config) == ["hi", "echo hi", "again", "echo again"]
+    # One row per message however many checkpoints hold it
+    assert checkpointer.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 4
+    assert _contents(_graph(checkpointer), {"configurable": {"thread_id": "rider2"}}) == []
+
+def test_message_edited_in_place_is_stored_again(storage_dir):
+    config = {"configurable": {"thread_id": "rider1"}}
+    graph = _graph(open_checkpointer(storage_dir))
+    graph.invoke({"messages": [HumanMessage(content="hi")]}, config)
+    graph.invoke({"messages": [HumanMessage(content="edit")]}, config)
+
+    assert _contents(graph, config) == ["hi", "edited", "edit"]
+    assert _contents(_graph(open_checkpointer(storage_dir)), config) == ["hi", "edited", "edit"]
+
+def test_delete_thread(storage_dir):
+    config = {"configurable": {"thread_id": "rider1"}}
+    checkpointer = open_checkpointer(storage_dir)
+    graph = _graph(checkpointer)
+    graph.invoke({"messages": [HumanMessage(content="hi")]}, config)
+    checkpointer.delete_thread("rider1")
+    assert _contents(graph, config) == []
+    assert checkpointer.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 0
+
+def test_stored_messages_are_not_serialized_again(storage_dir):
+    config = {"configurable": {"thread_id": "rider1"}}
+    checkpointer = open_checkpointer(storage_dir)
+    graph = _graph(checkpointer)
+    serialized = []
+    dumps_typed = checkpointer.serde.dumps_typed
+    def counting(obj):
+        if isinstance(obj, BaseMessage):
+            serialized.append(obj.content)
+        return dumps_typed(obj)
+    checkpointer.serde.dumps_typed = counting
+
+    per_turn = []
+    for turn in range(6):
+        serialized.clear()
+        graph.invoke({"messages": [HumanMessage(content=f"turn {turn}")]}, config)
+        per_turn.append(len(serialized))
+    # Only the new messages, however long the history grows
+    assert len(set(per_turn[1:])) == 1
+
+class RiderState(MessagesState):
+    rider: Rider
+
+def test_rider_is_stored_by_id(storage_dir):
+    config = {"configurable": {"thread_id": "rider1"}}
+    rider = Rider(rider_id="rider1", rider_password="secret-password")
+    def reply(state):
+        return {"messages": [AIMessage(content=f"hello {state['rider'].rider_id}")]}
+    builder = StateGraph(RiderState)
+    builder.add_node("reply", reply)
+    builder.add_edge(START, "reply")
+    builder.add_edge("reply", END)
+    checkpointer = SQLiteCheckpointer(f"{storage_dir}.db", load_rider={"rider1": rider}.get)
+    graph = builder.compile(checkpointer=checkpointer)
+    graph.invoke({"rider": rider, "messages": [HumanMessage(content="hi")]}, config)
+
+    assert graph.get_state(config).values["rider"] == rider
+    for table in ("checkpoints", "channel_values", "messages", "writes"):
+        for row in checkpointer.conn.execute(f"SELECT * FROM {table}"):
+            assert not any(b"secret-password" in value for value in row if isinstance(value, bytes))
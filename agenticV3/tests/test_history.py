@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from utils.history import HistoryPolicy
+
+class FakeModel:
+    """Answers each summarizing call with a numbered summary."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages, config=None):
+        self.calls += 1
+        return SimpleNamespace(content=f"summary {self.calls}")
+
+def _conversation(turns):
+    messages = []
+    for turn in range(turns):
+        messages += [HumanMessage(content=f"question {turn}"), AIMessage(content=f"answer {turn}")]
+    return messages
+
+def test_short_conversation_is_sent_verbatim():
+    state = {"messages": _conversation(3)}
+    model = FakeModel()
+    assert HistoryPolicy(max_turns=4, max_tokens=10_000, fold_turns=2).messages(state, model) == state["messages"]
+    assert model.calls == 0
+    assert state["memory"] == {}
+
+def test_old_turns_are_folded_a_few_at_a_time():
+    policy = HistoryPolicy(max_turns=4, max_tokens=10_000, fold_turns=2)
+    model = FakeModel()
+    state = {"messages": _conversation(5)}
+    policy.messages(state, model)
+    assert model.calls == 0
+
+    state["messages"] += _conversation(1)
+    history = policy.messages(state, model)
+    assert model.calls == 1
+    assert state["memory"] == {"summary": "summary 1", "summarized": 4}
+    assert isinstance(history[0], SystemMessage) and "summary 1" in history[0].content
+    assert history[1:] == state["messages"][4:]
+
+def test_token_budget_folds_turns_but_keeps_the_current_one():
+    state = {"messages": _conversation(3) + [HumanMessage(content="x" * 4000)]}
+    history = HistoryPolicy(max_turns=6, max_tokens=100, fold_turns=4).messages(state, FakeModel())
+    assert history[-1] is state["messages"][-1]
+    assert state["memory"]["summarized"] == 6
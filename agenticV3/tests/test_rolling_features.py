@@ -0,0 +1,64 @@
+from datetime import date, timedelta
+from types import SimpleNamespace
+from utils import rolling_features
+from utils.rolling_features import HORIZON, RollingFeatures
+
+class FakeManager:
+    def __init__(self):
+        self.listeners = []
+        self.archive = SimpleNamespace(scan=lambda start=None: [])
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def put(self, record):
+        for listener in self.listeners:
+            listener(record)
+
+def _days_ago(days):
+    return (date.today() - timedelta(days=days)).isoformat() + "T12:00:00"
+
+def _booking(booking_id, days_ago=0):
+    return SimpleNamespace(booking_id=booking_id, rider_id="rider1", driver_id="driver1", created_at=_days_ago(days_ago))
+
+def _cancellation(cancellation_id, days_ago=0):
+    return SimpleNamespace(cancellation_id=cancellation_id, rider_id="rider1", driver_id="driver1",
+                           cancelled_by="rider", created_at=_days_ago(days_ago))
+
+def _features():
+    bookings, cancellations = FakeManager(), FakeManager()
+    return RollingFeatures(bookings, cancellations), bookings, cancellations
+
+def test_counts_per_window():
+    features, bookings, cancellations = _features()
+    for index, days_ago in enumerate((1, 10, 40, 40, 100)):
+        bookings.put(_booking(f"b{index}", days_ago))
+    cancellations.put(_cancellation("c1", 10))
+
+    rider = features.rider("rider1")
+    assert (rider["rides_7d"], rider["rides_30d"], rider["rides_90d"]) == (1, 2, 4)
+    assert (rider["cancelation_rate_7d"], rider["cancelation_rate_30d"]) == (0.0, 50.0)
+    assert features.driver("driver1")["cancellations_90d"] == 0
+    assert features.rider("unknown")["cancelation_rate_90d"] is None
+
+def test_records_passed_again_count_once():
+    features, bookings, cancellations = _features()
+    for _ in range(3):
+        bookings.put(_booking("b1"))
+        cancellations.put(_cancellation("c1"))
+    rider = features.rider("rider1")
+    assert (rider["rides_7d"], rider["cancellations_7d"]) == (1, 1)
+
+def test_ids_are_dropped_as_they_leave_the_horizon(monkeypatch):
+    features, bookings, cancellations = _features()
+    bookings.put(_booking("old", HORIZON - 1))
+    bookings.put(_booking("new"))
+    cancellations.put(_cancellation("c1", HORIZON - 1))
+    bookings.put(_booking("ancient", HORIZON))
+    assert sum(map(len, features._bookings.values())) == 2
+
+    monkeypatch.setattr(rolling_features, "_today", lambda: date.today().toordinal() + 1)
+    bookings.put(_booking("old", HORIZON - 1))
+    assert sum(map(len, features._bookings.values())) == 1
+    assert features._cancellations == {}
+    assert features.rider("rider1")["rides_90d"] == 1
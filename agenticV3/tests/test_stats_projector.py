@@ -0,0 +1,111 @@
+import pytest
+from utils.booking_manager import BookingManager
+from utils.cancellation_manager import CancellationManager
+from utils.stats_projector import StatsProjector
+from utils.user_manager import UserManager
+
+def _cancel(cancellation_manager, booking, decision="fee waived"):
+    return cancellation_manager.create_cancellation(
+        booking_id=booking.booking_id, rider_id=booking.rider_id, driver_id=booking.driver_id,
+        cancelled_by="rider", arrived=False, distance_from_pin=None, wait_time=None, rider_rating=5.0,
+        decision=decision
+    )
+
+@pytest.fixture
+def history(storage_dir):
+    """A rider seeded with 33 rides and 8 cancellations, 12 and 3 of them backed by records."""
+    user_manager = UserManager(storage_dir)
+    user_manager.create_rider("test0001", "password1", total_rides=33, prior_cancels=8)
+    user_manager.create_driver("driver1", total_rides=40)
+    booking_manager = BookingManager(storage_dir)
+    cancellation_manager = CancellationManager(storage_dir)
+    bookings = [booking_manager.create_booking("test0001", "driver1", "A", "B") for _ in range(12)]
+    for booking in bookings[:3]:
+        _cancel(cancellation_manager, booking)
+    return storage_dir
+
+def test_projection_counts_records(history):
+    projector = StatsProjector(history, settle_seconds=0)
+    assert projector.update() == 15
+    stats = projector.rider_stats("test0001")
+    assert (stats["rides"], stats["cancellations"], stats["decisions"]) == (12, 3, {"fee waived": 3})
+    assert projector.update() == 0
+    assert StatsProjector(history).rider_stats("test0001") == stats
+
+def test_apply_keeps_history_not_backed_by_records(history):
+    projector = StatsProjector(history, settle_seconds=0)
+    projector.update()
+    user_manager = UserManager(history)
+    assert projector.init_baselines(user_manager) == 2
+    assert projector.apply(user_manager) == 0
+    rider = UserManager(history).get_rider("test0001")
+    assert (rider.total_rides_booked, rider.prior_cancellations) == (33, 8)
+
+def test_apply_corrects_drift_on_top_of_the_baseline(history):
+    projector = StatsProjector(history, settle_seconds=0)
+    projector.update()
+    projector.init_baselines(UserManager(history))
+    # A booking whose counter update was lost
+    BookingManager(history).create_booking("test0001", "driver1", "A", "B")
+    projector.update()
+    assert projector.apply(UserManager(history)) == 2
+    rider = UserManager(history).get_rider("test0001")
+    assert (rider.total_rides_booked, rider.prior_cancellations) == (34, 8)
+    assert UserManager(history).get_driver("driver1").total_rides_accepted == 41
+
+def test_baseline_ignores_records_not_folded_in_yet(history):
+    projector = StatsProjector(history, settle_seconds=0)
+    projector.update()
+    projector.init_baselines(UserManager(history))
+    BookingManager(history).create_booking("test0001", "driver1", "A", "B")
+    UserManager(history).update_rider_stats("test0001", add_booking=True)
+    assert projector.audit(UserManager(history))["riders"] == []
+    projector.update()
+    assert projector.audit(UserManager(history))["riders"] == []
+
+def test_audit_reports_drift_and_changes_nothing(history):
+    projector = StatsProjector(history, settle_seconds=0)
+    projector.update()
+    projector.init_baselines(UserManager(history))
+    with open(projector.projection_file, 'rb') as f:
+        saved = f.read()
+    # A cancellation counted twice
+    UserManager(history).update_rider_stats("test0001", add_cancellation=True)
+
+    differences = projector.audit(UserManager(history))["riders"]
+    assert [(rider["rider_id"], rider["prior_cancellations"]) for rider in differences] == [("test0001", 8)]
+    with open(projector.projection_file, 'rb') as f:
+        assert f.read() == saved
+    # Initializing again keeps the existing baseline, so the drift stays visible
+    assert projector.init_baselines(UserManager(history)) == 0
+    assert len(projector.audit(UserManager(history))["riders"]) == 1
+
+def test_riders_without_a_baseline_are_left_alone(history):
+    projector = StatsProjector(history, settle_seconds=0)
+    projector.update()
+    assert projector.audit(UserManager(history)) == {"riders": [], "drivers": []}
+    assert projector.apply(UserManager(history)) == 0
+    assert projector.baselines == {"riders": {}, "drivers": {}}
+
+def test_overwrite_is_opt_in(history):
+    projector = StatsProjector(history, settle_seconds=0)
+    projector.update()
+    assert projector.apply(UserManager(history), overwrite=True) == 2
+    rider = UserManager(history).get_rider("test0001")
+    assert (rider.total_rides_booked, rider.prior_cancellations) == (12, 3)
+    assert projector.apply(UserManager(history)) == 0
+
+def test_changed_decision_is_reprojected(history):
+    projector = StatsProjector(history, settle_seconds=0)
+    projector.update()
+    cancellation_manager = CancellationManager(history)
+    cancellation = next(iter(cancellation_manager.cancellations.values()))
+    cancellation_manager.update_cancellation_decision(cancellation.cancellation_id, "fee charged")
+
+    assert projector.update() == 1
+    expected = {"fee waived": 2, "fee charged": 1}
+    assert projector.rider_stats("test0001")["decisions"] == expected
+    assert projector.driver_stats("driver1")["decisions"] == expected
+    assert projector.update() == 0
+    projector.rebuild()
+    assert projector.rider_stats("test0001")["decisions"] == expected
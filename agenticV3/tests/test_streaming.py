@@ -0,0 +1,26 @@
+from utils.streaming import BackgroundPrint, PartialJson, print_stream
+
+def test_partial_json_exposes_a_field_once_its_value_is_complete():
+    reply = PartialJson()
+    reply.feed('```json\n{"tool_call": "answer_')
+    assert reply.final("tool_call") is None
+
+    reply.feed('query"')
+    assert reply.final("tool_call") is None
+
+    reply.feed(', "pickup": null, "count": 3}')
+    assert reply.final("tool_call") == "answer_query"
+    assert reply.final("pickup") is None
+    assert reply.final("count") == 3
+
+def test_print_stream_prints_chunks_after_the_prefix(capsys):
+    assert print_stream(["Refunds ", "", "take 5 days."], prefix="> ") == "Refunds take 5 days."
+    assert capsys.readouterr().out == "> Refunds take 5 days.\n"
+
+def test_print_stream_prints_nothing_for_an_empty_answer(capsys):
+    assert print_stream(iter([])) == ""
+    assert capsys.readouterr().out == ""
+
+def test_background_print_returns_the_whole_text(capsys):
+    assert BackgroundPrint(iter(["a", "b"]), prefix="").result() == "ab"
+    assert capsys.readouterr().out == "ab\n"
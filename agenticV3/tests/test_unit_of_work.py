@@ -0,0 +1,115 @@
+import json
+import multiprocessing
+import os
+import pytest
+from utils.booking_manager import BookingManager, BookingNotActive
+from utils.cancellation_manager import CancellationManager
+from utils.user_manager import UserManager
+from utils.unit_of_work import UnitOfWork, pending_journal
+
+PROCESSES = 4
+CANCELS = 25
+
+def _managers(storage_dir):
+    return UserManager(storage_dir), BookingManager(storage_dir), CancellationManager(storage_dir)
+
+def _book_and_cancel(storage_dir, count):
+    user_manager, booking_manager, cancellation_manager = _managers(storage_dir)
+    for _ in range(count):
+        booking = booking_manager.create_booking("rider1", "driver1", "A", "B")
+        user_manager.update_rider_stats("rider1", add_booking=True)
+        with UnitOfWork(user_manager, booking_manager, cancellation_manager):
+            user_manager.update_rider_stats("rider1", add_cancellation=True)
+            cancellation_manager.create_cancellation(
+                booking_id=booking.booking_id, rider_id="rider1", driver_id="driver1", cancelled_by="rider",
+                arrived=False, distance_from_pin=None, wait_time=None, rider_rating=5.0, decision="fee waived"
+            )
+            booking_manager.cancel_booking(booking.booking_id)
+
+def _seed(storage_dir):
+    user_manager = UserManager(storage_dir)
+    user_manager.create_rider("rider1", "password1", total_rides=11, prior_cancels=5)
+    user_manager.create_driver("driver1")
+    return storage_dir
+
+@pytest.fixture
+def seeded(storage_dir):
+    return _seed(storage_dir)
+
+def test_commit_writes_every_manager(seeded):
+    _book_and_cancel(seeded, 3)
+    user_manager, booking_manager, cancellation_manager = _managers(seeded)
+    rider = user_manager.get_rider("rider1")
+    assert (rider.total_rides_booked, rider.prior_cancellations) == (14, 8)
+    assert [booking.status for booking in booking_manager.bookings.values()] == ["cancelled"] * 3
+    assert len(cancellation_manager.cancellations) == 3
+    assert not [name for name in os.listdir(seeded) if name.endswith(".journal")]
+
+def test_rollback_discards_staged_changes(seeded):
+    user_manager, booking_manager, cancellation_manager = _managers(seeded)
+    with pytest.raises(RuntimeError):
+        with UnitOfWork(user_manager, booking_manager, cancellation_manager):
+            user_manager.update_rider_stats("rider1", add_cancellation=True)
+            raise RuntimeError
+    assert user_manager.get_rider("rider1").prior_cancellations == 5
+    assert UserManager(seeded).get_rider("rider1").prior_cancellations == 5
+
+def test_second_cancel_of_a_booking_rolls_back(seeded):
+    booking_id = BookingManager(seeded).create_booking("rider1", "driver1", "A", "B").booking_id
+    # Both sessions saw the booking active before either committed
+    first, second = _managers(seeded), _managers(seeded)
+    for user_manager, booking_manager, cancellation_manager in (first, second):
+        assert booking_manager.get_booking(booking_id).status == "active"
+
+    outcomes = []
+    for user_manager, booking_manager, cancellation_manager in (first, second):
+        try:
+            with UnitOfWork(user_manager, booking_manager, cancellation_manager):
+                booking_manager.require_active(booking_id)
+                user_manager.update_rider_stats("rider1", add_cancellation=True)
+                cancellation_manager.create_cancellation(
+                    booking_id=booking_id, rider_id="rider1", driver_id="driver1", cancelled_by="rider",
+                    arrived=False, distance_from_pin=None, wait_time=None, rider_rating=5.0, decision="fee waived"
+                )
+                booking_manager.cancel_booking(booking_id)
+            outcomes.append("cancelled")
+        except BookingNotActive:
+            outcomes.append("rolled back")
+
+    assert outcomes == ["cancelled", "rolled back"]
+    user_manager, booking_manager, cancellation_manager = _managers(seeded)
+    assert user_manager.get_rider("rider1").prior_cancellations == 6
+    assert len(cancellation_manager.get_rider_cancellations("rider1")) == 1
+
+def test_interrupted_commit_is_replayed_on_load(seeded):
+    rider = UserManager(seeded).get_rider("rider1").model_dump()
+    # Journals of two commits that died before writing any table
+    for name, cancellations in (("transaction-1-a.journal", 6), ("transaction-2-b.journal", 7)):
+        with open(os.path.join(seeded, name), "w") as f:
+            json.dump({"riders": [{**rider, "prior_cancellations": cancellations}]}, f)
+        os.utime(os.path.join(seeded, name), ns=(cancellations, cancellations))
+
+    assert UserManager(seeded).get_rider("rider1").prior_cancellations == 7
+    assert pending_journal(seeded, "riders") == []
+    assert not [name for name in os.listdir(seeded) if name.endswith(".journal")]
+
+@pytest.mark.parametrize("backend", ["json", "sharded", "sqlite"])
+def test_concurrent_processes_keep_every_update(storage_dir, backend, monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", backend)
+    seeded = _seed(storage_dir)
+
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_book_and_cancel, args=(seeded, CANCELS)) for _ in range(PROCESSES)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert [worker.exitcode for worker in workers] == [0] * PROCESSES
+
+    user_manager, booking_manager, cancellation_manager = _managers(seeded)
+    rider = user_manager.get_rider("rider1")
+    assert rider.total_rides_booked == 11 + PROCESSES * CANCELS
+    assert rider.prior_cancellations == 5 + PROCESSES * CANCELS
+    assert len(booking_manager.bookings) == PROCESSES * CANCELS
+    assert all(booking.status == "cancelled" for booking in booking_manager.bookings.values())
+    assert len(cancellation_manager.cancellations) == PROCESSES * CANCELS
@@ -0,0 +1,22 @@
+import asyncio
+from utils.user_manager import UserManager
+
+def test_random_driver_is_none_without_drivers(storage_dir):
+    assert UserManager(storage_dir).random_driver() is None
+
+def test_random_driver_sees_drivers_added_after_the_first_pick(storage_dir):
+    user_manager = UserManager(storage_dir)
+    user_manager.create_driver("driver1")
+    assert user_manager.random_driver().driver_id == "driver1"
+
+    user_manager.create_driver("driver2")
+    picked = {user_manager.random_driver().driver_id for _ in range(200)}
+    assert picked == {"driver1", "driver2"}
+
+def test_random_driver_sees_drivers_written_by_another_manager(storage_dir):
+    user_manager = UserManager(storage_dir)
+    assert user_manager.random_driver() is None
+
+    UserManager(storage_dir).create_driver("driver1")
+    user_manager.refresh()
+    assert asyncio.run(user_manager.arandom_driver()).driver_id == "driver1"
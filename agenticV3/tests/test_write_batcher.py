@@ -0,0 +1,51 @@
+import multiprocessing
+import pytest
+from utils.user_manager import UserManager
+
+PROCESSES = 4
+UPDATES = 25
+
+def _update_batched(storage_dir):
+    user_manager = UserManager(storage_dir, batch_writes=True, batch_size=10, batch_interval=0.05)
+    for _ in range(UPDATES):
+        user_manager.update_rider_stats("rider1", add_booking=True)
+    user_manager.close()
+
+def _update_in_block(storage_dir):
+    user_manager = UserManager(storage_dir)
+    for _ in range(UPDATES // 5):
+        with user_manager.batched():
+            for _ in range(5):
+                user_manager.update_rider_stats("rider1", add_booking=True)
+
+@pytest.fixture
+def seeded(storage_dir):
+    UserManager(storage_dir).create_rider("rider1", "password1", total_rides=3)
+    return storage_dir
+
+def test_batch_writes_are_coalesced(seeded):
+    user_manager = UserManager(seeded, batch_writes=True, batch_size=1000, batch_interval=60)
+    for _ in range(3):
+        user_manager.update_rider_stats("rider1", add_booking=True)
+    assert UserManager(seeded).get_rider("rider1").total_rides_booked == 3
+    user_manager.close()
+    assert UserManager(seeded).get_rider("rider1").total_rides_booked == 6
+
+def test_batched_block_writes_once_on_exit(seeded):
+    user_manager = UserManager(seeded)
+    with user_manager.batched():
+        user_manager.update_rider_stats("rider1", add_booking=True)
+        assert user_manager._dirty_riders == {"rider1"}
+    assert not user_manager._dirty_riders
+    assert UserManager(seeded).get_rider("rider1").total_rides_booked == 4
+
+@pytest.mark.parametrize("worker", [_update_batched, _update_in_block])
+def test_concurrent_processes_keep_every_update(seeded, worker):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=worker, args=(seeded,)) for _ in range(PROCESSES)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+    assert [process.exitcode for process in workers] == [0] * PROCESSES
+    assert UserManager(seeded).get_rider("rider1").total_rides_booked == 3 + PROCESSES * UPDATES
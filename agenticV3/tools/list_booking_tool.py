@@ -1,6 +1,6 @@
 from langchain.tools import tool
 from typing import List, Optional
-from utils.booking_manager import BookingManager
+from utils.registry import get_booking_manager, aget_booking_manager
 from utils.types import BookingRecord
 
 @tool
@@ -16,8 +16,18 @@ def list_bookings(state: dict) -> Optional[List[BookingRecord]]:
     rider = state.get('rider')
     if not rider or not hasattr(rider, 'rider_id'):
         return None
-    booking_manager = BookingManager()
+    booking_manager = get_booking_manager()
     active_bookings = booking_manager.get_rider_bookings(rider.rider_id)
-    return active_bookings if active_bookings else [] 
+    return active_bookings if active_bookings else []
 
- 
\ No newline at end of file
+async def alist_bookings(state: dict) -> Optional[List[BookingRecord]]:
+    """Awaitable `list_bookings`, with the lookup on the storage executor."""
+    rider = state.get('rider')
+    if not rider or not hasattr(rider, 'rider_id'):
+        return None
+    booking_manager = await aget_booking_manager()
+    active_bookings = await booking_manager.aget_rider_bookings(rider.rider_id)
+    return active_bookings if active_bookings else []
+
+# Run by `list_bookings.ainvoke`, so async graphs and sessions await it natively
+list_bookings.coroutine = alist_bookings
@@ -1,42 +1,159 @@
-import json
 import os
-from datetime import datetime
-from typing import Optional, Dict, List
+import threading
+from typing import Callable, Optional, Dict, List, Set
 from utils.types import CancellationRecord
+from utils.storage import open_store, synchronized, mutation
+from utils.indexes import SortedIndex
+from utils.write_batcher import BatchedWritesMixin
+from utils.async_storage import async_variant
+from utils.unit_of_work import pending_journal, complete_journal
+from utils.codec import load_records, rows_of, validate_records
+from utils.ids import cancellation_ids
 
-class CancellationManager:
-    def __init__(self, storage_dir: str = "data"):
+class CancellationManager(BatchedWritesMixin):
+    _stores = ("store",)
+
+    def __init__(self, storage_dir: str = "data", backend: Optional[str] = None, batch_writes: bool = False,
+                 batch_size: int = 100, batch_interval: float = 1.0):
         self.storage_dir = storage_dir
         self.cancellations_file = os.path.join(storage_dir, "cancellations.json")
+        self.store = open_store("cancellations", storage_dir, backend)
         self.cancellations: Dict[str, CancellationRecord] = {}
+        # Hash indexes over the cancellation log, each bucket oldest first
+        self.booking_index = self._index(lambda cancel: cancel.booking_id)
+        self.rider_index = self._index(lambda cancel: cancel.rider_id)
+        self.driver_index = self._index(lambda cancel: cancel.driver_id)
+        self._lock = threading.RLock()
+        self._signature = None
+        # Cancellations changed in memory but not yet written
+        self._dirty: Set[str] = set()
+        # Called with every cancellation put in memory, see subscribe()
+        self._listeners: List[Callable[[CancellationRecord], None]] = []
+        self._init_writes(batch_writes, batch_size, batch_interval)
         self._load_cancellations()
         
     def _load_cancellations(self) -> None:
         """Load cancellations from storage file."""
         os.makedirs(self.storage_dir, exist_ok=True)
         
-        try:
-            with open(self.cancellations_file, 'r') as f:
-                cancellations_data = json.load(f)
-                for cancel_data in cancellations_data:
-                    cancellation = CancellationRecord.model_validate(cancel_data)
-                    self.cancellations[cancellation.cancellation_id] = cancellation
-        except (json.JSONDecodeError, FileNotFoundError):
-            pass
+        # Taken before reading so a concurrent write shows up as stale rather than lost
+        self._signature = self.store.signature()
+        for cancellation in load_records(CancellationRecord, self.store.load()):
+            self._put(cancellation)
+        self._recover_journal()
+
+    def _recover_journal(self) -> None:
+        """Finish writing cancellations from a unit of work that was interrupted mid-commit."""
+        with self.store.lock():
+            for cancel_data in pending_journal(self.storage_dir, "cancellations"):
+                cancellation = CancellationRecord.model_validate(cancel_data)
+                self._put(cancellation)
+                self._dirty.add(cancellation.cancellation_id)
+            if self._dirty:
+                self.flush()
+                complete_journal(self.storage_dir, "cancellations")
             
-    def _save_cancellations(self) -> None:
-        """Save cancellations to storage file."""
+    def _save_cancellations(self, cancellation: Optional[CancellationRecord] = None) -> None:
+        """Queue `cancellation` for saving, or rewrite every cancellation when none is given."""
+        if cancellation is not None:
+            self._dirty.add(cancellation.cancellation_id)
+            self._request_flush()
+            return
+
+        os.makedirs(self.storage_dir, exist_ok=True)
+        self.store.save(self.cancellations)
+        self._dirty.clear()
+        self._signature = self.store.signature()
+
+    @synchronized
+    def flush(self) -> None:
+        """Write the cancellations changed since the last flush."""
+        if not self._dirty:
+            return
         os.makedirs(self.storage_dir, exist_ok=True)
         
-        with open(self.cancellations_file, 'w') as f:
-            json.dump([cancel.model_dump() for cancel in self.cancellations.values()], f)
-            
+        stale = self.is_stale()
+        merged = self.store.save(self.cancellations, changed=list(self._dirty))
+        self._dirty.clear()
+        self._signature = self.store.signature()
+        if stale or merged:
+            # Another process wrote too; pick up its cancellations alongside ours
+            self._reload()
+
+    def is_stale(self) -> bool:
+        """Check whether another writer changed the storage files since we last read or wrote them."""
+        return self.store.signature() != self._signature
+
+    @synchronized
+    def refresh(self) -> bool:
+        """Reload cancellations if the storage files changed on disk; returns whether it reloaded."""
+        self.flush()
+        if not self.is_stale():
+            return False
+        self._reload()
+        return True
+
+    @synchronized
+    def staged(self) -> Dict[str, List[dict]]:
+        """Cancellations changed but not yet written."""
+        return {"cancellations": [self.cancellations[cancel_id].model_dump() for cancel_id in self._dirty]}
+
+    @synchronized
+    def discard(self) -> None:
+        """Drop unwritten cancellation changes and reload from storage."""
+        self._dirty.clear()
+        self._reload()
+
+    def _reload(self) -> None:
+        pending = [self.cancellations[cancel_id] for cancel_id in self._dirty]
+        self._dirty.clear()
+        self.cancellations = {}
+        for index in (self.booking_index, self.rider_index, self.driver_index):
+            index.clear()
+        self._load_cancellations()
+        # Unwritten changes are newer than anything on disk
+        for cancellation in pending:
+            self._put(cancellation)
+            self._dirty.add(cancellation.cancellation_id)
+
+    def _cache(self, cancel_data: Optional[dict]) -> Optional[CancellationRecord]:
+        """Validate a record read from an indexed store and refresh the in-memory copy."""
+        if cancel_data is None:
+            return None
+        if cancel_data["cancellation_id"] in self._dirty:
+            # Our unflushed copy is newer than what the store holds
+            return self.cancellations[cancel_data["cancellation_id"]]
+        cancellation = CancellationRecord.model_validate(cancel_data)
+        self._put(cancellation)
+        return cancellation
+
+    @staticmethod
+    def _index(key) -> SortedIndex:
+        return SortedIndex(key, lambda cancel: cancel.created_at)
+
+    def _put(self, cancellation: CancellationRecord) -> None:
+        """Store a cancellation in memory and keep the indexes current."""
+        self.cancellations[cancellation.cancellation_id] = cancellation
+        for index in (self.booking_index, self.rider_index, self.driver_index):
+            index.add(cancellation.cancellation_id, cancellation)
+        for listener in self._listeners:
+            listener(cancellation)
+
+    @synchronized
+    def subscribe(self, listener: Callable[[CancellationRecord], None]) -> None:
+        """Call `listener` with every cancellation held now and each one stored or reloaded from here on.
+
+        The same cancellation can be passed more than once, so listeners must be idempotent.
+        """
+        self._listeners.append(listener)
+        for cancellation in list(self.cancellations.values()):
+            listener(cancellation)
+
     def generate_cancellation_id(self) -> str:
         """Generate a unique cancellation ID."""
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        count = len(self.cancellations) + 1
-        return f"C{timestamp}{count:04d}"
+        return cancellation_ids()
         
+    @mutation("store")
     def create_cancellation(self,
                           booking_id: str,
                           rider_id: str,
@@ -67,36 +184,73 @@ class CancellationManager:
             decision=decision
         )
         
-        self.cancellations[cancellation_id] = cancellation
-        self._save_cancellations()
+        self._put(cancellation)
+        self._save_cancellations(cancellation)
         return cancellation
         
+    @mutation("store")
+    def bulk_upsert_cancellations(self, cancellations) -> int:
+        """Insert or replace many cancellations from dicts or a DataFrame with a single save.
+
+        All rows are validated in one pass before anything changes; a bad row
+        raises and nothing is written.
+        """
+        records = validate_records(CancellationRecord, rows_of(cancellations))
+        for cancellation in records:
+            self._put(cancellation)
+            self._dirty.add(cancellation.cancellation_id)
+        self._request_flush()
+        return len(records)
+
+    @synchronized
     def get_cancellation(self, cancellation_id: str) -> Optional[CancellationRecord]:
         """Get a cancellation by ID."""
+        if self.store.indexed:
+            return self._cache(self.store.get(cancellation_id))
         return self.cancellations.get(cancellation_id)
         
+    @synchronized
     def get_booking_cancellation(self, booking_id: str) -> Optional[CancellationRecord]:
         """Get cancellation record for a specific booking."""
-        for cancellation in self.cancellations.values():
-            if cancellation.booking_id == booking_id:
-                return cancellation
-        return None
+        if self.store.indexed:
+            self.flush()
+            matches = self.store.find(booking_id=booking_id)
+            return self._cache(matches[0]) if matches else None
+        cancellation_ids = self.booking_index.ids(booking_id, limit=1)
+        return self.cancellations[cancellation_ids[0]] if cancellation_ids else None
         
+    @synchronized
     def get_rider_cancellations(self, rider_id: str) -> List[CancellationRecord]:
         """Get all cancellations for a rider."""
-        return [cancel for cancel in self.cancellations.values() 
-                if cancel.rider_id == rider_id]
+        if self.store.indexed:
+            self.flush()
+            return [self._cache(data) for data in self.store.find(rider_id=rider_id)]
+        return [self.cancellations[cancel_id] for cancel_id in self.rider_index.ids(rider_id)]
         
+    @synchronized
     def get_driver_cancellations(self, driver_id: str) -> List[CancellationRecord]:
         """Get all cancellations for a driver."""
-        return [cancel for cancel in self.cancellations.values() 
-                if cancel.driver_id == driver_id]
+        if self.store.indexed:
+            self.flush()
+            return [self._cache(data) for data in self.store.find(driver_id=driver_id)]
+        return [self.cancellations[cancel_id] for cancel_id in self.driver_index.ids(driver_id)]
         
+    @mutation("store")
     def update_cancellation_decision(self, cancellation_id: str, decision: str) -> Optional[CancellationRecord]:
         """Update the decision for a cancellation."""
         cancellation = self.get_cancellation(cancellation_id)
         if cancellation:
             cancellation.decision = decision
-            self._save_cancellations()
+            self._put(cancellation)
+            self._save_cancellations(cancellation)
             return cancellation
-        return None 
\ No newline at end of file
+        return None 
+
+    # Awaitable variants for asyncio callers; disk work runs on the storage executor
+    acreate_cancellation = async_variant("create_cancellation")
+    abulk_upsert_cancellations = async_variant("bulk_upsert_cancellations")
+    aget_cancellation = async_variant("get_cancellation")
+    aget_booking_cancellation = async_variant("get_booking_cancellation")
+    aget_rider_cancellations = async_variant("get_rider_cancellations")
+    aget_driver_cancellations = async_variant("get_driver_cancellations")
+    aupdate_cancellation_decision = async_variant("update_cancellation_decision")
@@ -0,0 +1,353 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from utils import codec
+from utils.async_storage import run_storage
+from utils.types import Rider
+
+# Channel values of this type are lists of rows in the messages table, not serialized values
+MESSAGE_REFS = "message_refs"
+# Values of this type are a rider ID; the rider is loaded from the user manager
+RIDER_REF = "rider_ref"
+# Stands in for a rider inside a dict value, such as a graph's input
+RIDER_KEY = "__rider_ref__"
+
+class _RiderRefSerializer:
+    """Serializer that writes a Rider as its ID and loads it back from storage, so
+    credentials never reach the checkpoint database and a resumed session sees the
+    rider's current record."""
+
+    def __init__(self, serde, load_rider: Callable[[str], Optional[Rider]]):
+        self.serde = serde
+        self.load_rider = load_rider
+
+    def dumps(self, obj: Any) -> bytes:
+        return self.serde.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return self.serde.loads(data)
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        if isinstance(obj, Rider):
+            return RIDER_REF, obj.rider_id.encode()
+        if isinstance(obj, dict) and any(isinstance(value, Rider) for value in obj.values()):
+            obj = {key: {RIDER_KEY: value.rider_id} if isinstance(value, Rider) else value
+                   for key, value in obj.items()}
+        return self.serde.dumps_typed(obj)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        if data[0] == RIDER_REF:
+            return self.load_rider(data[1].decode())
+        obj = self.serde.loads_typed(data)
+        if isinstance(obj, dict):
+            for key, value in obj.items():
+                if isinstance(value, dict) and value.keys() == {RIDER_KEY}:
+                    obj[key] = self.load_rider(value[RIDER_KEY])
+        return obj
+
+def _registry_rider(storage_dir: str) -> Callable[[str], Optional[Rider]]:
+    def load_rider(rider_id: str) -> Optional[Rider]:
+        # Imported here, as the registry itself builds checkpointers
+        from utils.registry import get_user_manager
+        return get_user_manager(storage_dir).get_rider(rider_id)
+    return load_rider
+
+class SQLiteCheckpointer(BaseCheckpointSaver[int]):
+    """LangGraph checkpointer backed by a local SQLite database in WAL mode.
+
+    Checkpoints are keyed by thread ID, so a conversation compiled with it can be
+    resumed after a restart by invoking the graph with the same thread ID and
+    only the new input. Like the LangGraph savers, a checkpoint only writes the
+    channels that changed. Message lists are stored as deltas: each message is
+    written once to a messages table, and a checkpoint of the `messages`
+    channel only records which rows it holds, so a long conversation costs one
+    row per new message instead of a full copy of the history every step.
+
+    Riders are stored by ID and loaded back with `load_rider` (by default from
+    the shared user manager of the database's directory), so passwords are
+    never written to the checkpoints.
+    """
+
+    def __init__(self, db_file: str, cached_threads: int = 256,
+                 load_rider: Optional[Callable[[str], Optional[Rider]]] = None):
+        super().__init__()
+        self.serde = _RiderRefSerializer(self.serde, load_rider or _registry_rider(os.path.dirname(db_file)))
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.RLock()
+        # Messages of recently used threads, message ID -> (row, digest of the stored
+        # serialization, message object, its content object), to recognise the ones
+        # already stored without writing them again
+        self._stored: "OrderedDict[Tuple[str, str], Dict[str, tuple]]" = OrderedDict()
+        self.cached_threads = cached_threads
+        self._create_tables()
+
+    def _create_tables(self) -> None:
+        with self._lock:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL,
+                    parent_id TEXT, type TEXT, checkpoint BLOB, metadata BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id));
+                CREATE TABLE IF NOT EXISTS channel_values (
+                    thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, channel TEXT NOT NULL,
+                    version TEXT NOT NULL, type TEXT NOT NULL, value BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, channel, version));
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL, type TEXT NOT NULL, message BLOB);
+                CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages (thread_id, checkpoint_ns);
+                CREATE TABLE IF NOT EXISTS writes (
+                    thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL, idx INTEGER NOT NULL, channel TEXT NOT NULL,
+                    type TEXT, value BLOB, task_path TEXT NOT NULL DEFAULT '',
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx));
+            """)
+
+    @staticmethod
+    def _digest(type_: str, blob: bytes) -> bytes:
+        return hashlib.blake2b(type_.encode() + b"\0" + blob, digest_size=16).digest()
+
+    def _remember(self, thread: Tuple[str, str]) -> Dict[str, tuple]:
+        stored = self._stored.get(thread)
+        if stored is None:
+            stored = self._stored[thread] = {}
+            while len(self._stored) > self.cached_threads:
+                self._stored.popitem(last=False)
+        else:
+            self._stored.move_to_end(thread)
+        return stored
+
+    def _store_messages(self, thread: Tuple[str, str], messages: List[Any]) -> Optional[List[int]]:
+        """Rows holding `messages`, inserting only those not stored already; None if
+        the list holds anything other than messages with IDs."""
+        if not all(isinstance(message, BaseMessage) and message.id for message in messages):
+            return None
+        stored = self._remember(thread)
+        rows = []
+        for message in messages:
+            known = stored.get(message.id)
+            # The object stored before with its content untouched: nothing to serialize
+            if known is not None and known[2] is message and known[3] is message.content:
+                rows.append(known[0])
+                continue
+            # Same ID on another object, or edited in place: compare what would be stored
+            type_, blob = self.serde.dumps_typed(message)
+            digest = self._digest(type_, blob)
+            if known is not None and known[1] == digest:
+                stored[message.id] = (known[0], digest, message, message.content)
+                rows.append(known[0])
+                continue
+            # New, or edited under the same ID; earlier checkpoints keep the old row
+            row = self.conn.execute(
+                "INSERT INTO messages (thread_id, checkpoint_ns, type, message) VALUES (?, ?, ?, ?)",
+                (*thread, type_, blob),
+            ).lastrowid
+            stored[message.id] = (row, digest, message, message.content)
+            rows.append(row)
+        return rows
+
+    def _load_messages(self, thread: Tuple[str, str], rows: List[int]) -> List[BaseMessage]:
+        messages: Dict[int, BaseMessage] = {}
+        digests: Dict[int, bytes] = {}
+        # Chunked to stay under SQLite's bound-parameter limit
+        for start in range(0, len(rows), 900):
+            chunk = rows[start:start + 900]
+            cursor = self.conn.execute(
+                f"SELECT id, type, message FROM messages WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+            for row, type_, blob in cursor:
+                messages[row] = self.serde.loads_typed((type_, blob))
+                digests[row] = self._digest(type_, blob)
+        stored = self._remember(thread)
+        for row, message in messages.items():
+            stored[message.id] = (row, digests[row], message, message.content)
+        return [messages[row] for row in rows]
+
+    def _channel_values(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> Dict[str, Any]:
+        values: Dict[str, Any] = {}
+        for channel, version in versions.items():
+            row = self.conn.execute(
+                "SELECT type, value FROM channel_values "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+            if row is None or row[0] == "empty":
+                continue
+            if row[0] == MESSAGE_REFS:
+                values[channel] = self._load_messages((thread_id, checkpoint_ns), codec.loads(row[1]))
+            else:
+                values[channel] = self.serde.loads_typed(row)
+        return values
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str, parent_id: Optional[str],
+               type_: str, checkpoint: bytes, metadata: bytes) -> CheckpointTuple:
+        saved: Checkpoint = self.serde.loads_typed((type_, checkpoint))
+        writes = self.conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                     "checkpoint_id": checkpoint_id}},
+            checkpoint={**saved, "channel_values": self._channel_values(
+                thread_id, checkpoint_ns, saved["channel_versions"])},
+            metadata=self.serde.loads(metadata),
+            parent_config=({"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                             "checkpoint_id": parent_id}} if parent_id else None),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((value_type, value)))
+                            for task_id, channel, value_type, value in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """The checkpoint named in `config`, or the thread's latest one."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = ("SELECT checkpoint_id, parent_id, type, checkpoint, metadata FROM checkpoints "
+                 "WHERE thread_id = ? AND checkpoint_ns = ?")
+        params: Tuple = (thread_id, checkpoint_ns)
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = ?"
+            params += (checkpoint_id,)
+        else:
+            query += " ORDER BY checkpoint_id DESC LIMIT 1"
+        with self._lock:
+            row = self.conn.execute(query, params).fetchone()
+            return self._tuple(thread_id, checkpoint_ns, *row) if row else None
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        """Checkpoints matching the arguments, newest first."""
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata "
+                f"FROM checkpoints{where} ORDER BY checkpoint_id DESC", params).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            if filter:
+                metadata = self.serde.loads(row[-1])
+                if not all(metadata.get(key) == value for key, value in filter.items()):
+                    continue
+            with self._lock:
+                result = self._tuple(*row)
+            if limit is not None:
+                limit -= 1
+            yield result
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        """Store a checkpoint, writing only the channels in `new_versions`."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        saved = checkpoint.copy()
+        values = saved.pop("channel_values")
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for channel, version in new_versions.items():
+                    if channel not in values:
+                        type_, value = "empty", None
+                    elif isinstance(values[channel], list) and (
+                            rows := self._store_messages((thread_id, checkpoint_ns), values[channel])) is not None:
+                        type_, value = MESSAGE_REFS, codec.dumps(rows)
+                    else:
+                        type_, value = self.serde.dumps_typed(values[channel])
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO channel_values VALUES (?, ?, ?, ?, ?, ?)",
+                        (thread_id, checkpoint_ns, channel, str(version), type_, value),
+                    )
+                type_, blob = self.serde.dumps_typed(saved)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                     type_, blob, self.serde.dumps(get_checkpoint_metadata(config, metadata))),
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                # Rows remembered during the failed transaction were never stored
+                self._stored.pop((thread_id, checkpoint_ns), None)
+                raise
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        """Store the writes a task made before its step completed."""
+        # Special channels (errors, interrupts) overwrite; regular writes are kept once
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = [(thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel,
+                 *self.serde.dumps_typed(value), task_path) for idx, (channel, value) in enumerate(writes)]
+        with self._lock:
+            self.conn.executemany(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Forget every checkpoint, message and write of a thread."""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            for table in ("checkpoints", "channel_values", "messages", "writes"):
+                self.conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            self.conn.execute("COMMIT")
+            for thread in [thread for thread in self._stored if thread[0] == thread_id]:
+                del self._stored[thread]
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await run_storage(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None
+                    ) -> AsyncIterator[CheckpointTuple]:
+        results = await run_storage(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for result in results:
+            yield result
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await run_storage(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await run_storage(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await run_storage(self.delete_thread, thread_id)
+
+def open_checkpointer(storage_dir: str = "data") -> SQLiteCheckpointer:
+    """Checkpointer over `storage_dir/checkpoints.db`."""
+    os.makedirs(storage_dir, exist_ok=True)
+    return SQLiteCheckpointer(os.path.join(storage_dir, "checkpoints.db"))
@@ -0,0 +1,135 @@
+from typing import Dict, Iterable, Iterator, List, MutableMapping, Optional, Type
+import numpy as np
+from pydantic import BaseModel
+
+# Field types stored as NumPy arrays; any other field is kept in a plain list
+_DTYPES = {int: np.int64, float: np.float64, bool: np.bool_}
+
+class ColumnarTable(MutableMapping):
+    """A mapping of key -> pydantic record stored as one column per field.
+
+    Numeric fields live in NumPy arrays and the rest in lists, with a key -> row
+    index on the side. Models are only built when a record is read through the
+    mapping interface, so a table costs a fraction of a dict of models and
+    `column()` exposes whole-table arrays for vectorized aggregates.
+
+    Records read from the table are copies: write them back with
+    `table[key] = record` after changing them.
+    """
+
+    def __init__(self, model: Type[BaseModel], key: str, capacity: int = 1024):
+        self.model = model
+        self.key = key
+        self._fields = list(model.model_fields)
+        self._dtypes = {name: _DTYPES[field.annotation] for name, field in model.model_fields.items()
+                        if field.annotation in _DTYPES}
+        self._columns = {name: np.zeros(capacity, dtype=self._dtypes[name]) if name in self._dtypes else []
+                         for name in self._fields}
+        self._index: Dict[str, int] = {}
+        self._size = 0
+
+    def _grow(self, size: int) -> None:
+        capacity = len(self._columns[next(iter(self._dtypes))]) if self._dtypes else size
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in self._dtypes:
+            column = np.zeros(capacity, dtype=self._dtypes[name])
+            column[:self._size] = self._columns[name][:self._size]
+            self._columns[name] = column
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __contains__(self, key) -> bool:
+        return key in self._index
+
+    def __getitem__(self, key: str) -> BaseModel:
+        row = self._index[key]
+        # Values were validated on the way in; like a dict of models, edits are stored as made
+        return self.model.model_construct(**{name: self._columns[name][row] if name not in self._dtypes
+                                             else self._columns[name][row].item() for name in self._fields})
+
+    def __setitem__(self, key: str, record: BaseModel) -> None:
+        row = self._index.get(key)
+        if row is None:
+            self._append([record])
+            return
+        for name in self._fields:
+            self._columns[name][row] = getattr(record, name)
+
+    def __delitem__(self, key: str) -> None:
+        row = self._index.pop(key)
+        last = self._size - 1
+        # Move the last row into the hole so rows stay contiguous
+        for name in self._fields:
+            column = self._columns[name]
+            if row != last:
+                column[row] = column[last]
+            if name not in self._dtypes:
+                column.pop()
+        if row != last:
+            self._index[self._columns[self.key][row]] = row
+        self._size = last
+
+    def _append(self, records: List[BaseModel]) -> None:
+        start = self._size
+        self._grow(start + len(records))
+        for name in self._fields:
+            values = [getattr(record, name) for record in records]
+            if name in self._dtypes:
+                self._columns[name][start:start + len(values)] = values
+            else:
+                self._columns[name].extend(values)
+        self._index.update((getattr(record, self.key), start + offset) for offset, record in enumerate(records))
+        self._size = start + len(records)
+
+    def extend(self, records: Iterable[BaseModel]) -> None:
+        """Insert or replace many records, appending the new ones column by column."""
+        fresh: Dict[str, BaseModel] = {}
+        for record in records:
+            key = getattr(record, self.key)
+            if key in self._index:
+                self[key] = record
+            else:
+                fresh[key] = record
+        if fresh:
+            self._append(list(fresh.values()))
+
+    def rows(self, keys: Optional[Iterable[str]] = None) -> List[dict]:
+        """Raw rows for `keys`, or for every record, without building models."""
+        if keys is None:
+            columns = [self._columns[name][:self._size].tolist() if name in self._dtypes else self._columns[name]
+                       for name in self._fields]
+        else:
+            positions = [self._index[key] for key in keys if key in self._index]
+            columns = [self._columns[name][positions].tolist() if name in self._dtypes
+                       else [self._columns[name][row] for row in positions] for name in self._fields]
+        return [dict(zip(self._fields, values)) for values in zip(*columns)]
+
+    def column(self, name: str) -> np.ndarray:
+        """Every record's value of a numeric field, in row order; a read-only view."""
+        column = self._columns[name][:self._size]
+        column.flags.writeable = False
+        return column
+
+    def keys_at(self, rows: Iterable[int]) -> List[str]:
+        """Keys of the records at the given row positions."""
+        keys = self._columns[self.key]
+        return [keys[row] for row in rows]
+
+    def top(self, name: str, limit: int, descending: bool = True) -> List[str]:
+        """Keys of the `limit` records with the highest (or lowest) values of a numeric field."""
+        values = self.column(name)
+        if descending:
+            values = -values
+        limit = min(limit, self._size)
+        if limit <= 0:
+            return []
+        rows = np.argpartition(values, limit - 1)[:limit] if limit < self._size else np.arange(self._size)
+        rows = np.sort(rows)
+        return self.keys_at(rows[np.argsort(values[rows], kind="stable")])
@@ -0,0 +1,28 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+# Compiled graphs shared by every session in the process, one per (builder, config).
+# Each variant's graph module has its own builder, so variants never share an entry.
+_graphs: Dict[Tuple[Callable, Hashable], Any] = {}
+_lock = threading.Lock()
+
+def get_graph(build: Callable[..., Any], **config) -> Any:
+    """The graph `build(**config)` compiles, built on first use and reused after that.
+
+    Compiled graphs hold no per-session state, so one instance serves every
+    turn and session. Config values must be hashable.
+    """
+    key = (build, tuple(sorted(config.items())))
+    graph = _graphs.get(key)
+    if graph is not None:
+        return graph
+    with _lock:
+        graph = _graphs.get(key)
+        if graph is None:
+            graph = _graphs[key] = build(**config)
+    return graph
+
+def reset_graphs() -> None:
+    """Forget every compiled graph so the next call compiles afresh."""
+    with _lock:
+        _graphs.clear()
@@ -1,90 +1,208 @@
-from typing import Dict, Optional
-import json
+from typing import Dict, List, MutableMapping, Optional, Set
+import heapq
 import os
+import random
+import threading
 from utils.types import Rider, Driver
+from utils.storage import dump_rows, open_store, synchronized, mutation
+from utils.write_batcher import BatchedWritesMixin
+from utils.async_storage import async_variant
+from utils.unit_of_work import pending_journal, complete_journal
+from utils.codec import load_records, rows_of, validate_records
+from utils.columnar import ColumnarTable
+from utils.leaderboard import Leaderboard
 
-class UserManager:
-    def __init__(self, storage_dir: str = "data"):
+# Rows validated per batch when loading into columns, bounding the models alive at once
+LOAD_CHUNK = 50_000
+
+# Live driver leaderboards: score from a driver row, and whether higher ranks first
+DRIVER_LEADERBOARDS = {
+    "rating": (lambda driver: driver["driver_rating"], True),
+    # Drivers who never accepted a ride have no meaningful rate yet
+    "cancellation_rate": (lambda driver: driver["cancelation_rate"] if driver["total_rides_accepted"] else None, False),
+    "rides": (lambda driver: driver["total_rides_accepted"], True),
+}
+
+class UserManager(BatchedWritesMixin):
+    _stores = ("rider_store", "driver_store")
+
+    def __init__(self, storage_dir: str = "data", backend: Optional[str] = None, compact: bool = False,
+                 batch_writes: bool = False, batch_size: int = 100, batch_interval: float = 1.0,
+                 columnar: Optional[bool] = None):
         self.storage_dir = storage_dir
         self.riders_file = os.path.join(storage_dir, "riders.json")
         self.drivers_file = os.path.join(storage_dir, "drivers.json")
-        self.riders: Dict[str, Rider] = {}
-        self.drivers: Dict[str, Driver] = {}
+        # Compact mode writes JSON without indentation, roughly halving file size
+        indent = None if compact else 2
+        self.rider_store = open_store("riders", storage_dir, backend, indent=indent, atomic=True)
+        self.driver_store = open_store("drivers", storage_dir, backend, indent=indent, atomic=True)
+        # Columnar mode keeps riders and drivers as NumPy columns instead of one model each
+        self.columnar = os.getenv("USER_TABLE") == "columnar" if columnar is None else columnar
+        self.riders: MutableMapping[str, Rider] = {}
+        self.drivers: MutableMapping[str, Driver] = {}
+        self.driver_leaderboards = {name: Leaderboard(score, descending)
+                                    for name, (score, descending) in DRIVER_LEADERBOARDS.items()}
+        # IDs modified since the last successful save, per table
+        self._dirty_riders: Set[str] = set()
+        self._dirty_drivers: Set[str] = set()
+        # Driver IDs for random assignment, rebuilt only when a driver is added or the table reloads
+        self._driver_ids: Optional[List[str]] = None
+        self._lock = threading.RLock()
+        self._signature = None
+        self._init_writes(batch_writes, batch_size, batch_interval)
         self._load_data()
 
     def _load_data(self) -> None:
         """Load riders and drivers from storage files."""
         os.makedirs(self.storage_dir, exist_ok=True)
         
+        # Taken before reading so a concurrent write shows up as stale rather than lost
+        self._signature = self._file_signature()
+
         # Load riders
-        self.riders = {}
         try:
-            if os.path.exists(self.riders_file):
-                with open(self.riders_file, 'r') as f:
-                    content = f.read().strip()
-                    if content:
-                        riders_data = json.loads(content)
-                        for rider_data in riders_data:
-                            try:
-                                rider = Rider.model_validate(rider_data)
-                                self.riders[rider.rider_id] = rider
-                            except Exception:
-                                continue
-        except (json.JSONDecodeError, Exception):
-            self.riders = {}
+            self.riders = self._table(Rider, "rider_id", self.rider_store.load())
+        except Exception:
+            self.riders = self._table(Rider, "rider_id", [])
 
         # Load drivers
-        self.drivers = {}
         try:
-            if os.path.exists(self.drivers_file):
-                with open(self.drivers_file, 'r') as f:
-                    content = f.read().strip()
-                    if content:
-                        drivers_data = json.loads(content)
-                        for driver_data in drivers_data:
-                            try:
-                                driver = Driver.model_validate(driver_data)
-                                self.drivers[driver.driver_id] = driver
-                            except Exception:
-                                continue
-        except (json.JSONDecodeError, Exception):
-            self.drivers = {}
+            self.drivers = self._table(Driver, "driver_id", self.driver_store.load())
+        except Exception:
+            self.drivers = self._table(Driver, "driver_id", [])
+        self._driver_ids = None
+
+        for leaderboard in self.driver_leaderboards.values():
+            leaderboard.rebuild((row["driver_id"], row) for row in dump_rows(self.drivers))
+        self._recover_journal()
+
+    def _table(self, model, key: str, rows: List[dict]) -> MutableMapping:
+        """Records keyed by `key`, as a dict of models or as columns in columnar mode."""
+        if not self.columnar:
+            return {getattr(record, key): record for record in load_records(model, rows)}
+        table = ColumnarTable(model, key)
+        for start in range(0, len(rows), LOAD_CHUNK):
+            table.extend(load_records(model, rows[start:start + LOAD_CHUNK]))
+        return table
+
+    def _recover_journal(self) -> None:
+        """Finish writing riders and drivers from a unit of work that was interrupted mid-commit."""
+        with self.rider_store.lock(), self.driver_store.lock():
+            riders = pending_journal(self.storage_dir, "riders")
+            drivers = pending_journal(self.storage_dir, "drivers")
+            for rider_data in riders:
+                rider = Rider.model_validate(rider_data)
+                self.riders[rider.rider_id] = rider
+                self._dirty_riders.add(rider.rider_id)
+            for driver_data in drivers:
+                driver = Driver.model_validate(driver_data)
+                self._put_driver(driver)
+                self._dirty_drivers.add(driver.driver_id)
+            if riders or drivers:
+                self.flush()
+                if not self._dirty_riders:
+                    complete_journal(self.storage_dir, "riders")
+                if not self._dirty_drivers:
+                    complete_journal(self.storage_dir, "drivers")
+
+    def _put_driver(self, driver: Driver) -> None:
+        """Store a driver in memory and move it on the leaderboards."""
+        if driver.driver_id not in self.drivers:
+            self._driver_ids = None
+        self.drivers[driver.driver_id] = driver
+        row = driver.model_dump()
+        for leaderboard in self.driver_leaderboards.values():
+            leaderboard.add(driver.driver_id, row)
 
     def _save_data(self) -> None:
-        """Save riders and drivers to storage files."""
+        """Save changed riders and drivers now, or hand them to the batch writer."""
+        self._request_flush()
+
+    @synchronized
+    def flush(self) -> None:
+        """Save riders and drivers that changed since the last save.
+
+        Only tables with dirty entries are written; indexed backends also only
+        write the dirty rows. Failed writes stay dirty and are retried next save.
+        """
         os.makedirs(self.storage_dir, exist_ok=True)
         
-        try:
-            # Save riders
-            riders_data = [rider.model_dump() for rider in self.riders.values()]
-            temp_riders_file = self.riders_file + '.tmp'
-            with open(temp_riders_file, 'w') as f:
-                json.dump(riders_data, f, indent=2)
-            os.replace(temp_riders_file, self.riders_file)
-
-            # Save drivers
-            drivers_data = [driver.model_dump() for driver in self.drivers.values()]
-            temp_drivers_file = self.drivers_file + '.tmp'
-            with open(temp_drivers_file, 'w') as f:
-                json.dump(drivers_data, f, indent=2)
-            os.replace(temp_drivers_file, self.drivers_file)
-            
-        except Exception:
-            # Clean up temporary files if they exist
-            temp_riders = self.riders_file + '.tmp'
-            temp_drivers = self.drivers_file + '.tmp'
-            if os.path.exists(temp_riders):
-                os.remove(temp_riders)
-            if os.path.exists(temp_drivers):
-                os.remove(temp_drivers)
+        stale = self.is_stale()
+        for store, records, dirty in ((self.rider_store, self.riders, self._dirty_riders),
+                                      (self.driver_store, self.drivers, self._dirty_drivers)):
+            if not dirty:
+                continue
+            try:
+                stale = store.save(records, changed=list(dirty)) or stale
+            except Exception:
+                # Stores clean up their own temporary files
+                continue
+            dirty.clear()
+        self._signature = self._file_signature()
+        if stale:
+            # Another process wrote too; pick up its riders and drivers alongside ours
+            self._reload()
+
+    def _mark_rider(self, rider_id: str) -> None:
+        self._dirty_riders.add(rider_id)
+
+    def _mark_driver(self, driver_id: str) -> None:
+        self._dirty_drivers.add(driver_id)
+
+    def _file_signature(self) -> tuple:
+        return self.rider_store.signature() + self.driver_store.signature()
+
+    def is_stale(self) -> bool:
+        """Check whether another writer changed the storage files since we last read or wrote them."""
+        return self._file_signature() != self._signature
+
+    @synchronized
+    def refresh(self) -> bool:
+        """Reload riders and drivers if the storage files changed on disk; returns whether it reloaded."""
+        self.flush()
+        if not self.is_stale():
+            return False
+        self._dirty_riders.clear()
+        self._dirty_drivers.clear()
+        self._reload()
+        return True
 
+    @synchronized
+    def staged(self) -> Dict[str, List[dict]]:
+        """Riders and drivers changed but not yet written."""
+        return {
+            "riders": [self.riders[rider_id].model_dump() for rider_id in self._dirty_riders],
+            "drivers": [self.drivers[driver_id].model_dump() for driver_id in self._dirty_drivers],
+        }
+
+    @synchronized
+    def discard(self) -> None:
+        """Drop unwritten rider and driver changes and reload from storage."""
+        self._dirty_riders.clear()
+        self._dirty_drivers.clear()
+        self._reload()
+
+    def _reload(self) -> None:
+        pending_riders = {rider_id: self.riders[rider_id] for rider_id in self._dirty_riders}
+        pending_drivers = {driver_id: self.drivers[driver_id] for driver_id in self._dirty_drivers}
+        self._dirty_riders.clear()
+        self._dirty_drivers.clear()
+        self._load_data()
+        # Unwritten changes are newer than anything on disk
+        self.riders.update(pending_riders)
+        for driver in pending_drivers.values():
+            self._put_driver(driver)
+        self._dirty_riders.update(pending_riders)
+        self._dirty_drivers.update(pending_drivers)
+
+    @mutation("rider_store", "driver_store")
     def create_rider(self, rider_id: str, password: str, *,
                     rating: float = 5.0,
                     total_rides: int = 0,
                     prior_cancels: int = 0,
                     cancel_rate: float = 0.0) -> Rider:
         """Create a new rider account with optional initial statistics."""
-        if rider_id in self.riders:
+        if self.get_rider(rider_id):
             raise ValueError(f"Rider with ID {rider_id} already exists")
         
         rider = Rider(
@@ -97,16 +215,18 @@ class UserManager:
         )
 
         self.riders[rider_id] = rider
+        self._mark_rider(rider_id)
         self._save_data()
         return rider
 
+    @mutation("rider_store", "driver_store")
     def create_driver(self, driver_id: str, *,
                      rating: float = 5.0,
                      total_rides: int = 0,
                      prior_cancels: int = 0,
                      cancel_rate: float = 0.0) -> Driver:
         """Create a new driver account with optional initial statistics."""
-        if driver_id in self.drivers:
+        if self.get_driver(driver_id):
             raise ValueError(f"Driver with ID {driver_id} already exists")
         
         driver = Driver(
@@ -117,22 +237,73 @@ class UserManager:
             cancelation_rate=cancel_rate
         )
 
-        self.drivers[driver_id] = driver
+        self._put_driver(driver)
+        self._mark_driver(driver_id)
         self._save_data()
         return driver
 
+    @mutation("rider_store", "driver_store")
+    def bulk_upsert_riders(self, riders) -> int:
+        """Insert or replace many riders from dicts or a DataFrame with a single save.
+
+        All rows are validated in one pass before anything changes; a bad row
+        raises and nothing is written.
+        """
+        records = validate_records(Rider, rows_of(riders))
+        for rider in records:
+            self.riders[rider.rider_id] = rider
+            self._mark_rider(rider.rider_id)
+        self._save_data()
+        return len(records)
+
+    @mutation("rider_store", "driver_store")
+    def bulk_upsert_drivers(self, drivers) -> int:
+        """Insert or replace many drivers from dicts or a DataFrame with a single save.
+
+        All rows are validated in one pass before anything changes; a bad row
+        raises and nothing is written.
+        """
+        records = validate_records(Driver, rows_of(drivers))
+        for driver in records:
+            self._put_driver(driver)
+            self._mark_driver(driver.driver_id)
+        self._save_data()
+        return len(records)
+
+    @synchronized
     def get_rider(self, rider_id: str) -> Optional[Rider]:
         """Get rider by ID."""
+        if self.rider_store.indexed and rider_id not in self._dirty_riders:
+            rider_data = self.rider_store.get(rider_id)
+            if rider_data is None:
+                return None
+            self.riders[rider_id] = Rider.model_validate(rider_data)
         return self.riders.get(rider_id)
 
+    @synchronized
     def get_driver(self, driver_id: str) -> Optional[Driver]:
         """Get driver by ID."""
+        if self.driver_store.indexed and driver_id not in self._dirty_drivers:
+            driver_data = self.driver_store.get(driver_id)
+            if driver_data is None:
+                return None
+            self._put_driver(Driver.model_validate(driver_data))
         return self.drivers.get(driver_id)
 
+    @synchronized
+    def random_driver(self) -> Optional[Driver]:
+        """A driver picked uniformly at random, None if there are no drivers."""
+        if self._driver_ids is None:
+            self._driver_ids = list(self.drivers)
+        if not self._driver_ids:
+            return None
+        return self.get_driver(random.choice(self._driver_ids))
+
+    @synchronized
     def authenticate_rider(self, rider_id: str, password: str) -> Optional[Rider]:
         """Authenticate a rider with their ID and password."""
         try:
-            rider = self.riders.get(rider_id)
+            rider = self.get_rider(rider_id)
             if not rider:
                 return None
             
@@ -144,6 +315,7 @@ class UserManager:
         except Exception:
             return None
 
+    @mutation("rider_store", "driver_store")
     def update_rider_stats(self, rider_id: str, *, 
                          new_rating: Optional[float] = None,
                          add_cancellation: bool = False,
@@ -165,9 +337,13 @@ class UserManager:
         if rider.total_rides_booked > 0:
             rider.cancelation_rate = (rider.prior_cancellations / rider.total_rides_booked) * 100
 
+        # Columnar tables hand out copies, so store the edited record back
+        self.riders[rider_id] = rider
+        self._mark_rider(rider_id)
         self._save_data()
         return rider
 
+    @mutation("rider_store", "driver_store")
     def update_driver_stats(self, driver_id: str, *,
                           new_rating: Optional[float] = None,
                           add_cancellation: bool = False,
@@ -189,5 +365,36 @@ class UserManager:
         if driver.total_rides_accepted > 0:
             driver.cancelation_rate = (driver.prior_cancellations / driver.total_rides_accepted) * 100
 
+        self._put_driver(driver)
+        self._mark_driver(driver_id)
         self._save_data()
-        return driver
\ No newline at end of file
+        return driver
+
+    @synchronized
+    def rank_drivers(self, by: str = "driver_rating", limit: int = 10, descending: bool = True) -> List[Driver]:
+        """The `limit` drivers with the highest (or lowest) value of a numeric field, best first."""
+        if isinstance(self.drivers, ColumnarTable):
+            driver_ids = self.drivers.top(by, limit, descending)
+        else:
+            select = heapq.nlargest if descending else heapq.nsmallest
+            driver_ids = select(limit, self.drivers, key=lambda driver_id: getattr(self.drivers[driver_id], by))
+        return [self.drivers[driver_id] for driver_id in driver_ids]
+
+    @synchronized
+    def top_drivers(self, leaderboard: str = "rating", k: int = 10) -> List[Driver]:
+        """The `k` best drivers on a live leaderboard: "rating", "cancellation_rate" (lowest first) or "rides"."""
+        return [self.drivers[driver_id] for driver_id in self.driver_leaderboards[leaderboard].top(k)]
+
+    # Awaitable variants for asyncio callers; disk work runs on the storage executor
+    acreate_rider = async_variant("create_rider")
+    acreate_driver = async_variant("create_driver")
+    abulk_upsert_riders = async_variant("bulk_upsert_riders")
+    abulk_upsert_drivers = async_variant("bulk_upsert_drivers")
+    aget_rider = async_variant("get_rider")
+    aget_driver = async_variant("get_driver")
+    arandom_driver = async_variant("random_driver")
+    aauthenticate_rider = async_variant("authenticate_rider")
+    aupdate_rider_stats = async_variant("update_rider_stats")
+    aupdate_driver_stats = async_variant("update_driver_stats")
+    arank_drivers = async_variant("rank_drivers")
+    atop_drivers = async_variant("top_drivers")
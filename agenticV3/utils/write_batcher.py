@@ -0,0 +1,166 @@
+import atexit
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from utils.async_storage import async_variant
+from utils.storage import hold_file_lock, release_file_lock
+
+class WriteBatcher:
+    """Background writer that coalesces many save requests into one flush.
+
+    A flush runs once `max_pending` requests have piled up or the oldest pending
+    request is `max_delay` seconds old, whichever comes first.
+    """
+
+    def __init__(self, flush: Callable[[], None], max_pending: int = 100, max_delay: float = 1.0):
+        self._flush = flush
+        self.max_pending = max_pending
+        self.max_delay = max_delay
+        self._pending = 0
+        self._oldest: Optional[float] = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        # Daemon threads die with the interpreter, so flush what is left on exit
+        atexit.register(self.close)
+
+    def notify(self) -> None:
+        """Record one pending write."""
+        with self._cond:
+            self._pending += 1
+            if self._oldest is None:
+                # Wake the writer so it starts the max_delay countdown
+                self._oldest = time.monotonic()
+                self._cond.notify()
+            elif self._pending >= self.max_pending:
+                self._cond.notify()
+
+    def close(self) -> None:
+        """Stop the writer thread after a final flush."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _due(self) -> bool:
+        if self._pending >= self.max_pending:
+            return True
+        return self._oldest is not None and time.monotonic() - self._oldest >= self.max_delay
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed and not self._due():
+                    timeout = None
+                    if self._oldest is not None:
+                        timeout = max(self.max_delay - (time.monotonic() - self._oldest), 0)
+                    self._cond.wait(timeout)
+                closed = self._closed
+                has_pending = self._pending > 0
+                self._pending = 0
+                self._oldest = None
+            if has_pending:
+                try:
+                    self._flush()
+                except Exception:
+                    # Dirty records stay dirty in the manager and go out with the next flush
+                    pass
+            if closed:
+                return
+
+class BatchedWritesMixin:
+    """Deferred-save plumbing shared by the managers.
+
+    Managers mark changed records dirty and call `_request_flush`. Writes go out
+    immediately by default, are coalesced by a WriteBatcher in batch mode, and are
+    held back entirely inside `batched()` until the block exits.
+
+    Held-back changes were computed from what the stores held when they were made,
+    so the stores stay locked against other processes until they are written: for
+    the whole `batched()` block, and in batch mode from the first queued change
+    until the batch goes out.
+    """
+
+    # Attributes holding the manager's record stores, in the order their locks are taken
+    _stores: Tuple[str, ...] = ()
+
+    def _init_writes(self, batch_writes: bool, batch_size: int, batch_interval: float) -> None:
+        self._deferred = 0
+        # Whether the stores' locks are held for a batch not yet written
+        self._holding = False
+        self._batcher = WriteBatcher(self._flush_batch, batch_size, batch_interval) if batch_writes else None
+
+    def flush(self) -> None:
+        """Write every pending change to storage."""
+        raise NotImplementedError
+
+    def staged(self) -> Dict[str, List[dict]]:
+        """Pending changes per table, as they would be written."""
+        raise NotImplementedError
+
+    def discard(self) -> None:
+        """Drop pending changes and reload from storage."""
+        raise NotImplementedError
+
+    def _sync(self) -> None:
+        """Reload before a mutation if another process wrote since we last read."""
+        if self.is_stale():
+            self._reload()
+
+    @contextmanager
+    def locked(self):
+        """Hold the manager's lock and its stores' cross-process locks for the block,
+        after picking up anything other processes wrote."""
+        with self._lock, ExitStack() as stack:
+            for store_attr in self._stores:
+                stack.enter_context(getattr(self, store_attr).lock())
+            self._sync()
+            yield self
+
+    def _request_flush(self) -> None:
+        if self._deferred:
+            return
+        if self._batcher is not None:
+            if not self._holding:
+                for store_attr in self._stores:
+                    hold_file_lock(getattr(self, store_attr).lock_path)
+                self._holding = True
+            self._batcher.notify()
+            return
+        self.flush()
+
+    def _flush_batch(self) -> None:
+        with self._lock:
+            try:
+                self.flush()
+            finally:
+                if self._holding:
+                    self._holding = False
+                    for store_attr in self._stores:
+                        release_file_lock(getattr(self, store_attr).lock_path)
+
+    @contextmanager
+    def batched(self):
+        """Hold back writes inside the block and flush them once when it exits."""
+        with self.locked():
+            self._deferred += 1
+            try:
+                yield self
+            finally:
+                self._deferred -= 1
+                if not self._deferred:
+                    self.flush()
+
+    def close(self) -> None:
+        """Stop the background writer, flushing anything still pending."""
+        if self._batcher is not None:
+            self._batcher.close()
+        self.flush()
+
+    aflush = async_variant("flush")
+    arefresh = async_variant("refresh")
+    aclose = async_variant("close")
@@ -0,0 +1,12 @@
+import pandas as pd
+from utils.user_manager import UserManager
+
+# Load the generated riders and drivers into data/ in one write per table.
+# Run from the project folder: python -m Data_Generation.seed_store
+user_manager = UserManager("data")
+
+riders = pd.read_csv("Data_Generation/users.csv", dtype={"rider_password": str})
+drivers = pd.read_csv("Data_Generation/drivers.csv")
+
+print(f"Seeded {user_manager.bulk_upsert_riders(riders)} riders")
+print(f"Seeded {user_manager.bulk_upsert_drivers(drivers)} drivers")
@@ -3,8 +3,7 @@ from langchain_core.prompts import PromptTemplate
 from langchain_groq import ChatGroq
 from utils.types import State, BookingInfo
 from langchain_core.messages import AIMessage
-from utils.user_manager import UserManager
-from utils.booking_manager import BookingManager
+from utils.registry import get_user_manager, get_booking_manager
 from utils.input_handlers import get_booking_input
 from datetime import datetime
 
@@ -26,7 +25,7 @@ def booking_node(state: State):
     state["booking_info"] = booking_info
     
     # Initialize user manager for driver validation
-    user_manager = UserManager()
+    user_manager = get_user_manager()
     
     # Get and validate driver
     print("\nAssigning driver...")
@@ -45,7 +44,7 @@ def booking_node(state: State):
         break
     
     # Create booking record
-    booking_manager = BookingManager()
+    booking_manager = get_booking_manager()
     booking = booking_manager.create_booking(
         rider_id=state["rider"].rider_id,
         driver_id=driver_id,
@@ -1,13 +1,19 @@
+import asyncio
 from utils.types import State
+from utils.streaming import print_stream
 from RAG.RAG import chain
 from langchain_core.messages import AIMessage, HumanMessage
 
-def chatbot_node(state: State) -> State:
+def chatbot_node(state: State) -> dict:
     # Get the user's actual query
     user_query = input("Please ask your question: ")
-    state["messages"].append(HumanMessage(content=user_query))
-    
-    # Process through RAG
-    response = chain.invoke(user_query)
-    state["messages"].append(AIMessage(content=response.content))
-    return state
\ No newline at end of file
+
+    # Process through RAG, printing the answer as the model writes it
+    answer = print_stream(chunk.content for chunk in chain.stream(user_query))
+
+    # Only the new messages; the reducer appends them, so a resumed checkpoint never holds them twice
+    return {"messages": [HumanMessage(content=user_query), AIMessage(content=answer)]}
+
+async def achatbot_node(state: State) -> dict:
+    # The console read and the printed answer run on a thread so the event loop stays free
+    return await asyncio.to_thread(chatbot_node, state)
@@ -1,6 +1,8 @@
+import os
 import joblib
 import pandas as pd
 from utils.types import RiderCancels
+from utils.rolling_features import WINDOWS
 
 # Load trained models
 model1 = joblib.load('cancelation_models/rider_cancels_model1.pkl')
@@ -25,16 +27,32 @@ model3_decisions = {
     2: "base fee"
 }
 
+# Trailing window (7, 30 or 90 days) whose cancellation rate the models see. The default
+# of 0 keeps the lifetime rate the models were trained on; a window changes fee decisions.
+RATE_WINDOW_DAYS = int(os.getenv("RIDER_RATE_WINDOW_DAYS", "0"))
+if RATE_WINDOW_DAYS and RATE_WINDOW_DAYS not in WINDOWS:
+    raise ValueError(f"RIDER_RATE_WINDOW_DAYS must be 0 or one of {', '.join(map(str, WINDOWS))}, "
+                     f"not {RATE_WINDOW_DAYS}")
+
+def _cancelation_rate(cancel: RiderCancels) -> float:
+    """The rider's rate over RATE_WINDOW_DAYS, or the lifetime rate when no window is set
+    or the window holds no rides."""
+    if not RATE_WINDOW_DAYS:
+        return cancel.rider_cancelation_rate
+    rate = getattr(cancel, f"rider_cancelation_rate_{RATE_WINDOW_DAYS}d", None)
+    return cancel.rider_cancelation_rate if rate is None else rate
+
 def predict_rider_cancellation_decision(cancel: RiderCancels) -> str:
     """
     Predict the fee decision based on rider cancellation data using pre-trained KMeans models.
     """
+    cancelation_rate = _cancelation_rate(cancel)
 
     if cancel.arrived:
         X = pd.DataFrame([{
             'rider_rating': cancel.rider_rating,
             'wait_time': cancel.wait_time,
-            'rider_cancelation_rate': cancel.rider_cancelation_rate,
+            'rider_cancelation_rate': cancelation_rate,
             'distance_from_pin': cancel.distance_from_pin
         }])
         cluster = model1.predict(X)[0]
@@ -42,7 +60,7 @@ def predict_rider_cancellation_decision(cancel: RiderCancels) -> str:
     
     elif not cancel.arrived and cancel.cancelation_time is not None and cancel.cancelation_time <= 1:
         X = pd.DataFrame([{
-            'rider_cancelation_rate': cancel.rider_cancelation_rate
+            'rider_cancelation_rate': cancelation_rate
         }])
         cluster = model2.predict(X)[0]
         return model2_decisions.get(cluster, "fee waived")
@@ -51,7 +69,7 @@ def predict_rider_cancellation_decision(cancel: RiderCancels) -> str:
         X = pd.DataFrame([{
             'rider_rating': cancel.rider_rating,
             'cancelation_time': cancel.cancelation_time,
-            'rider_cancelation_rate': cancel.rider_cancelation_rate
+            'rider_cancelation_rate': cancelation_rate
         }])
         cluster = model3.predict(X)[0]
         return model3_decisions.get(cluster, "fee waived")
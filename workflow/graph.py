@@ -2,9 +2,11 @@ from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import tools_condition
 from agents.booking import booking_node
 from agents.cancellations import cancel_node
-from agents.chatbot import chatbot_node
+from agents.chatbot import chatbot_node, achatbot_node
 from utils.types import State
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
+from utils.graph_cache import get_graph
 
 def greetings(state: State):
     # Add system message for context
@@ -60,14 +62,15 @@ def router_conditions(state: State):
     else:
         return "router_node"
 
-def build_graph():
+def build_graph(checkpointer=None):
     graph = StateGraph(State)
     
     # Add nodes
     graph.add_node("router_node", router_node)
     graph.add_node("booking_node", booking_node)
     graph.add_node("cancel_node", cancel_node)
-    graph.add_node("chatbot_node", chatbot_node)
+    # Off the event loop under ainvoke; the console-driven nodes run on LangGraph's executor there
+    graph.add_node("chatbot_node", RunnableLambda(chatbot_node, afunc=achatbot_node, name="chatbot_node"))
 
     # Add edges
     graph.add_edge(START, "router_node")
@@ -78,9 +81,11 @@ def build_graph():
     graph.add_edge("cancel_node", "router_node")
     graph.add_edge("chatbot_node", "router_node")
 
-    return graph.compile()
+    # With a checkpointer, each thread's state is kept between invocations
+    return graph.compile(checkpointer=checkpointer)
 
-agent = build_graph()
+# Compiled once per process; main.py and LangGraph Studio share this instance
+agent = get_graph(build_graph)
 
 
 
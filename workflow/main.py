@@ -2,14 +2,15 @@ import os
 from utils.types import State
 from utils.sample_data import get_rider_by_id_and_password, get_driver_by_id
 from utils.langsmith_env import setup_env
-from utils.user_manager import UserManager
+from utils.registry import get_user_manager, get_checkpointer
 from graph import build_graph
+from utils.graph_cache import get_graph
 from langchain_core.messages import SystemMessage
 
 setup_env() ##Set langsmith environment if api key available
 
 # Initialize user manager
-user_manager = UserManager()
+user_manager = get_user_manager()
 
 def get_float_input(prompt: str, min_val: float, max_val: float) -> float:
     while True:
@@ -137,20 +138,27 @@ def main():
                 print("Invalid credentials. Please try again or register.")
                 continue
 
+            graph = get_graph(build_graph, checkpointer=get_checkpointer())
+            # One thread per rider, so a conversation picks up where it left off, even after a restart
+            config = {"configurable": {"thread_id": rider.rider_id}}
+
             # Start a new session
             while True:
-                state = State(
-                    rider=rider,
-                    messages=[
-                        SystemMessage(content="Welcome to Uber Chatbot! How can I assist you today?")
-                    ],
-                    intent=None,
-                    booking_info=None,
-                    cancellation_event=None
-                )
+                if graph.get_state(config).values.get("messages"):
+                    # Resume the stored conversation; only the fields that start a session are sent
+                    state = {"rider": rider, "intent": None}
+                else:
+                    state = State(
+                        rider=rider,
+                        messages=[
+                            SystemMessage(content="Welcome to Uber Chatbot! How can I assist you today?")
+                        ],
+                        intent=None,
+                        booking_info=None,
+                        cancellation_event=None
+                    )
 
-                graph = build_graph()
-                response = graph.invoke(state)
+                response = graph.invoke(state, config)
                 
                 # Check if user logged out (graph returned due to logout intent)
                 if response and response["intent"] == "Logout":
@@ -0,0 +1,220 @@
+import argparse
+import os
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+import pandas as pd
+from utils import codec
+from utils.append_log import AppendOnlyLog
+from utils.archive import RecordArchive
+from utils.storage import TABLES, JsonRecordStore, file_lock, open_store
+
+# Tables exported as one Parquet file, and tables exported as one file per creation day
+SNAPSHOT_TABLES = ("riders", "drivers")
+# Columns exported for riders and drivers; anything else, such as rider passwords, stays out of the export
+SNAPSHOT_COLUMNS = {
+    "riders": ["rider_id", "rider_rating", "prior_cancellations", "total_rides_booked", "cancelation_rate"],
+    "drivers": ["driver_id", "driver_rating", "total_rides_accepted", "prior_cancellations", "cancelation_rate"],
+}
+DAILY_TABLES = ("bookings", "cancellations")
+
+class FleetAnalytics:
+    """Fleet-wide aggregate queries over Parquet exports of the stores.
+
+    `export()` brings `storage_dir/analytics` up to date. Riders and drivers are
+    rewritten only when their store changed. Bookings and cancellations are
+    split into one file per creation day, and only the days whose rows changed
+    are rewritten. Queries read only the day files in the requested range and
+    aggregate them with pandas.
+    """
+
+    def __init__(self, storage_dir: str = "data", backend: Optional[str] = None):
+        self.storage_dir = storage_dir
+        self.backend = backend
+        self.directory = os.path.join(storage_dir, "analytics")
+        self.manifest_file = os.path.join(self.directory, "manifest.json")
+
+    @staticmethod
+    def _fingerprint(value) -> list:
+        """`value` as it reads back from the JSON manifest, so the two compare equal."""
+        return codec.loads(codec.dumps(value))
+
+    def _manifest(self) -> dict:
+        try:
+            with open(self.manifest_file, 'rb') as f:
+                return codec.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_manifest(self, manifest: dict) -> None:
+        temp_file = self.manifest_file + '.tmp'
+        with open(temp_file, 'wb') as f:
+            f.write(codec.dumps(manifest, indent=2))
+        os.replace(temp_file, self.manifest_file)
+
+    @staticmethod
+    def _write_parquet(frame: pd.DataFrame, path: str) -> None:
+        temp_file = path + '.tmp'
+        frame.to_parquet(temp_file, index=False)
+        os.replace(temp_file, path)
+
+    def _hot_rows(self, table: str) -> List[dict]:
+        store = open_store(table, self.storage_dir, self.backend)
+        rows = {row[store.key]: row for row in store.load()}
+        if isinstance(store, JsonRecordStore):
+            for row in AppendOnlyLog(store.path).replay():
+                rows[row[store.key]] = row
+        return list(rows.values())
+
+    def _export_snapshot(self, table: str, manifest: dict) -> int:
+        # The columns are part of the signature, so an export made with other columns is rewritten
+        signature = self._fingerprint([open_store(table, self.storage_dir, self.backend).signature(),
+                                       SNAPSHOT_COLUMNS[table]])
+        if manifest.get(table) == signature:
+            return 0
+        frame = pd.DataFrame(self._hot_rows(table), columns=SNAPSHOT_COLUMNS[table])
+        self._write_parquet(frame, os.path.join(self.directory, f"{table}.parquet"))
+        manifest[table] = signature
+        return len(frame)
+
+    def _export_daily(self, table: str, manifest: dict) -> int:
+        key = TABLES[table][0]
+        directory = os.path.join(self.directory, table)
+        os.makedirs(directory, exist_ok=True)
+        hot = pd.DataFrame(self._hot_rows(table))
+        hot_days = dict(tuple(hot.groupby(hot["created_at"].str[:10]))) if not hot.empty else {}
+        archive = RecordArchive(self.storage_dir, table, key) if table == "bookings" else None
+        archived_days = archive.partitions() if archive else []
+
+        previous = manifest.get(table, {})
+        current: Dict[str, list] = {}
+        written = 0
+        for day in sorted(set(hot_days) | set(archived_days)):
+            hot_rows = hot_days.get(day)
+            fingerprint = self._fingerprint([
+                archive.signature(day) if day in archived_days else None,
+                str(pd.util.hash_pandas_object(hot_rows.astype(str), index=False).sum()) if hot_rows is not None else None,
+            ])
+            current[day] = fingerprint
+            if previous.get(day) == fingerprint:
+                continue
+            frames = [pd.DataFrame(list(archive.scan(start=day, end=day)))] if day in archived_days else []
+            if hot_rows is not None:
+                frames.append(hot_rows)
+            frame = pd.concat(frames, ignore_index=True).drop_duplicates(key, keep="last")
+            self._write_parquet(frame, os.path.join(directory, f"{day}.parquet"))
+            written += len(frame)
+        for day in set(previous) - set(current):
+            try:
+                os.remove(os.path.join(directory, f"{day}.parquet"))
+            except FileNotFoundError:
+                pass
+        manifest[table] = current
+        return written
+
+    def export(self) -> Dict[str, int]:
+        """Bring the Parquet export up to date; returns rows written per table."""
+        os.makedirs(self.directory, exist_ok=True)
+        with file_lock(self.manifest_file):
+            manifest = self._manifest()
+            written = {table: self._export_snapshot(table, manifest) for table in SNAPSHOT_TABLES}
+            written.update((table, self._export_daily(table, manifest)) for table in DAILY_TABLES)
+            self._write_manifest(manifest)
+        return written
+
+    def frame(self, table: str, start: Optional[str] = None, end: Optional[str] = None,
+              columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Exported rows of `table`; bookings and cancellations can be limited to
+        creation days between `start` and `end` (inclusive, YYYY-MM-DD)."""
+        if table in SNAPSHOT_TABLES:
+            columns = columns or SNAPSHOT_COLUMNS[table]
+            path = os.path.join(self.directory, f"{table}.parquet")
+            return pd.read_parquet(path, columns=columns) if os.path.exists(path) else pd.DataFrame(columns=columns)
+        directory = os.path.join(self.directory, table)
+        try:
+            days = sorted(name[:-len(".parquet")] for name in os.listdir(directory) if name.endswith(".parquet"))
+        except FileNotFoundError:
+            days = []
+        paths = [os.path.join(directory, f"{day}.parquet") for day in days
+                 if not (start and day < start) and not (end and day > end)]
+        if not paths:
+            return pd.DataFrame(columns=columns)
+        return pd.concat([pd.read_parquet(path, columns=columns) for path in paths], ignore_index=True)
+
+    def decision_mix(self, by: str = "driver_id", start: Optional[str] = None, end: Optional[str] = None,
+                     normalize: bool = False) -> pd.DataFrame:
+        """Fee decisions per rider or driver for cancellations created in the range, as counts or shares."""
+        cancellations = self.frame("cancellations", start, end, columns=[by, "decision"])
+        if cancellations.empty:
+            return pd.DataFrame()
+        return pd.crosstab(cancellations[by], cancellations["decision"], normalize="index" if normalize else False)
+
+    def cancellation_rates(self, by: str = "driver_id", start: Optional[str] = None,
+                           end: Optional[str] = None) -> pd.DataFrame:
+        """Rides, cancellations by that party and cancellation rate per rider or driver within the range."""
+        party = "driver" if by == "driver_id" else "rider"
+        bookings = self.frame("bookings", start, end, columns=[by])
+        cancellations = self.frame("cancellations", start, end, columns=[by, "cancelled_by"])
+        rides = bookings.groupby(by).size()
+        cancelled = cancellations[cancellations["cancelled_by"] == party].groupby(by).size()
+        result = pd.DataFrame({"rides": rides, "cancellations": cancelled}).fillna(0).astype(int)
+        result["cancellation_rate"] = (result["cancellations"] / result["rides"].where(result["rides"] > 0) * 100).fillna(0.0)
+        return result.sort_values("cancellation_rate", ascending=False)
+
+    def top(self, table: str, by: str, limit: int = 50, ascending: bool = False, min_rides: int = 0) -> pd.DataFrame:
+        """The `limit` riders or drivers with the highest (or lowest) `by`, among those with at least `min_rides`."""
+        frame = self.frame(table)
+        rides = "total_rides_accepted" if table == "drivers" else "total_rides_booked"
+        if min_rides and not frame.empty:
+            frame = frame[frame[rides] >= min_rides]
+        if ascending:
+            return frame.nsmallest(limit, by)
+        return frame.nlargest(limit, by)
+
+    def bookings_per_day(self, start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+        """Booking counts per creation day and status."""
+        bookings = self.frame("bookings", start, end, columns=["created_at", "status"])
+        if bookings.empty:
+            return pd.DataFrame()
+        return pd.crosstab(bookings["created_at"].str[:10].rename("day"), bookings["status"])
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fleet-wide aggregate queries over riders, drivers, bookings and cancellations.")
+    parser.add_argument("--storage-dir", default="data")
+    parser.add_argument("--no-export", action="store_true", help="query the existing export without refreshing it")
+    parser.add_argument("--days", type=int, help="only bookings and cancellations created in the last N days")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("export", help="refresh the Parquet export")
+    mix = commands.add_parser("decision-mix", help="fee decisions per rider or driver")
+    mix.add_argument("--by", choices=["driver_id", "rider_id"], default="driver_id")
+    mix.add_argument("--normalize", action="store_true", help="shares instead of counts")
+    rates = commands.add_parser("cancellation-rates", help="cancellation rate per rider or driver in the period")
+    rates.add_argument("--by", choices=["driver_id", "rider_id"], default="driver_id")
+    top = commands.add_parser("top", help="riders or drivers ranked by a column")
+    top.add_argument("table", choices=SNAPSHOT_TABLES)
+    top.add_argument("--by", default="cancelation_rate")
+    top.add_argument("--limit", type=int, default=50)
+    top.add_argument("--ascending", action="store_true")
+    top.add_argument("--min-rides", type=int, default=0)
+    commands.add_parser("bookings-per-day", help="booking counts per day and status")
+    args = parser.parse_args()
+
+    analytics = FleetAnalytics(args.storage_dir)
+    if args.command == "export" or not args.no_export:
+        written = analytics.export()
+        if args.command == "export":
+            print(", ".join(f"{table}: {rows} rows written" for table, rows in written.items()))
+            return
+    start = (date.today() - timedelta(days=args.days - 1)).isoformat() if args.days else None
+
+    if args.command == "decision-mix":
+        result = analytics.decision_mix(args.by, start, normalize=args.normalize)
+    elif args.command == "cancellation-rates":
+        result = analytics.cancellation_rates(args.by, start)
+    elif args.command == "top":
+        result = analytics.top(args.table, args.by, args.limit, args.ascending, args.min_rides)
+    else:
+        result = analytics.bookings_per_day(start)
+    print(result.to_string() if not result.empty else "No data")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import gzip
+import os
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from utils import codec
+from utils.storage import file_lock, file_signature
+
+class RecordArchive:
+    """Cold storage for records that no longer change, one gzip JSON file per day.
+
+    Records are partitioned by the date part of `date_field`. Partitions are only
+    read when a historical query reaches them, and the most recently read ones
+    are kept decoded in a small cache.
+    """
+
+    def __init__(self, storage_dir: str, table: str, key: str, date_field: str = "created_at",
+                 cache_size: int = 8):
+        self.directory = os.path.join(storage_dir, "archive", table)
+        self.key = key
+        self.date_field = date_field
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[Tuple, Dict[str, dict]]]" = OrderedDict()
+
+    def _path(self, day: str) -> str:
+        return os.path.join(self.directory, f"{day}.json.gz")
+
+    def partitions(self) -> List[str]:
+        """Archived days, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-len(".json.gz")] for name in names if name.endswith(".json.gz"))
+
+    def signature(self, day: str) -> Tuple:
+        """Signature of a day's partition file; changes whenever records are added to it."""
+        return file_signature([self._path(day)])
+
+    def _read(self, day: str) -> Dict[str, dict]:
+        path = self._path(day)
+        signature = self.signature(day)
+        cached = self._cache.get(day)
+        if cached is not None and cached[0] == signature:
+            self._cache.move_to_end(day)
+            return cached[1]
+        try:
+            with gzip.open(path, 'rb') as f:
+                rows = codec.loads(f.read())
+        except FileNotFoundError:
+            rows = []
+        records = {row[self.key]: row for row in rows}
+        self._cache[day] = (signature, records)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return records
+
+    def add(self, rows: Iterable[dict]) -> int:
+        """Merge `rows` into their day partitions; re-adding a record replaces it."""
+        by_day: Dict[str, List[dict]] = {}
+        for row in rows:
+            by_day.setdefault(row[self.date_field][:10], []).append(row)
+        if not by_day:
+            return 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        for day, day_rows in by_day.items():
+            path = self._path(day)
+            with file_lock(path):
+                records = dict(self._read(day))
+                records.update((row[self.key], row) for row in day_rows)
+                temp_file = path + '.tmp'
+                with gzip.open(temp_file, 'wb') as f:
+                    f.write(codec.dumps(list(records.values())))
+                os.replace(temp_file, path)
+        return sum(len(day_rows) for day_rows in by_day.values())
+
+    def get(self, key: str, days: Optional[Iterable[str]] = None) -> Optional[dict]:
+        """Find one archived record in `days`, or in every partition newest first."""
+        for day in (reversed(self.partitions()) if days is None else days):
+            row = self._read(day).get(key)
+            if row is not None:
+                return row
+        return None
+
+    def scan(self, start: Optional[str] = None, end: Optional[str] = None, **filters) -> Iterator[dict]:
+        """Yield archived records between the `start` and `end` days (inclusive,
+        YYYY-MM-DD) whose fields equal `filters`, oldest day first."""
+        for day in self.partitions():
+            if (start and day < start) or (end and day > end):
+                continue
+            for row in self._read(day).values():
+                if all(row.get(field) == value for field, value in filters.items()):
+                    yield row
+
+def main() -> None:
+    from utils.booking_manager import BookingManager
+
+    parser = argparse.ArgumentParser(description="Move completed and cancelled bookings into the cold archive.")
+    parser.add_argument("--storage-dir", default="data")
+    parser.add_argument("--older-than-days", type=int, default=1,
+                        help="only archive bookings created at least this many days ago")
+    args = parser.parse_args()
+
+    moved = BookingManager(args.storage_dir).archive_bookings(older_than_days=args.older_than_days)
+    print(f"Archived {moved} bookings")
+
+if __name__ == "__main__":
+    main()
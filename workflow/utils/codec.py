@@ -0,0 +1,51 @@
+from typing import Any, Iterable, List, Optional, Type, TypeVar
+import orjson
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+_adapters = {}
+
+def loads(data) -> Any:
+    """Decode JSON from bytes or str."""
+    return orjson.loads(data)
+
+def dumps(obj: Any, indent: Optional[int] = None) -> bytes:
+    """Encode `obj` as JSON bytes; any indent is written as two spaces."""
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+
+def _adapter(model: Type[ModelT]) -> TypeAdapter:
+    adapter = _adapters.get(model)
+    if adapter is None:
+        adapter = _adapters[model] = TypeAdapter(List[model])
+    return adapter
+
+def rows_of(data) -> List[dict]:
+    """Rows from an iterable of dicts or a pandas DataFrame, with missing values as None."""
+    if hasattr(data, "to_dict") and hasattr(data, "columns"):
+        return data.astype(object).where(data.notna(), None).to_dict("records")
+    return list(data)
+
+def validate_records(model: Type[ModelT], rows: Iterable[dict]) -> List[ModelT]:
+    """Strictly validate rows from an external source; raises on the first bad row."""
+    return _adapter(model).validate_python(list(rows))
+
+def load_records(model: Type[ModelT], rows: Iterable[dict]) -> List[ModelT]:
+    """Models for rows this system wrote itself.
+
+    The whole table goes through one list validator in pydantic-core, which is
+    faster than per-record model_validate or even model_construct. Only if that
+    fails are rows validated one by one, dropping the invalid ones.
+    """
+    rows = list(rows)
+    try:
+        return _adapter(model).validate_python(rows)
+    except ValidationError:
+        pass
+    records = []
+    for row in rows:
+        try:
+            records.append(model.model_validate(row))
+        except ValidationError:
+            continue
+    return records
@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+from datetime import date, datetime
+from typing import Optional
+
+# Crockford base32: no I, L, O or U, so IDs survive being read out or retyped
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_RANDOM_BITS = 80
+_RANDOM_MAX = (1 << _RANDOM_BITS) - 1
+
+def _encode(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 32)
+        chars.append(_ALPHABET[digit])
+    return "".join(reversed(chars))
+
+def _decode(text: str) -> int:
+    value = 0
+    for char in text:
+        value = value * 32 + _ALPHABET.index(char)
+    return value
+
+def id_date(record_id: str) -> Optional[date]:
+    """Local creation date encoded in an ID, or None if it carries none.
+
+    Handles both allocator IDs and the older prefix + YYYYmmddHHMMSS + counter form.
+    """
+    body = record_id[1:]
+    try:
+        if len(body) == 26:
+            return datetime.fromtimestamp(_decode(body[:10].upper()) / 1000).date()
+        if len(body) >= 14 and body.isdigit():
+            return datetime.strptime(body[:8], "%Y%m%d").date()
+    except (ValueError, OverflowError, OSError):
+        pass
+    return None
+
+class IdAllocator:
+    """ULID-style ID generator: a millisecond timestamp followed by 80 random bits.
+
+    IDs sort by creation time. Uniqueness across processes and hosts comes from
+    the random part, so no file or counter is shared. Within a process, IDs in
+    the same millisecond increment the random part instead of redrawing it,
+    which keeps them strictly increasing.
+    """
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._last_random = 0
+
+    def __call__(self) -> str:
+        """Allocate the next ID."""
+        with self._lock:
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms <= self._last_ms:
+                # Same millisecond, or the clock stepped back: stay monotonic
+                now_ms = self._last_ms
+                random = self._last_random + 1
+                if random > _RANDOM_MAX:
+                    now_ms += 1
+                    random = int.from_bytes(os.urandom(10), "big")
+            else:
+                random = int.from_bytes(os.urandom(10), "big")
+            self._last_ms = now_ms
+            self._last_random = random
+        return f"{self.prefix}{_encode(now_ms, 10)}{_encode(random, 16)}"
+
+# Process-wide allocators, shared by every manager instance
+booking_ids = IdAllocator("B")
+cancellation_ids = IdAllocator("C")
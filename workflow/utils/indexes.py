@@ -0,0 +1,58 @@
+from bisect import bisect_left, insort
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+class SortedIndex:
+    """In-memory secondary index from a derived key to record IDs.
+
+    Each bucket is kept sorted by `order` (ties broken by record ID), so counts are
+    O(1) and a page of k IDs costs O(log n + k) instead of a scan of every record.
+    """
+
+    def __init__(self, key: Callable[[Any], Hashable], order: Callable[[Any], Any]):
+        self.key = key
+        self.order = order
+        self._buckets: Dict[Hashable, List[Tuple[Any, str]]] = {}
+        self._entries: Dict[str, Tuple[Hashable, Tuple[Any, str]]] = {}
+
+    def add(self, record_id: str, record: Any) -> None:
+        """Index `record`, moving it if its key changed since it was last added."""
+        key = self.key(record)
+        entry = (self.order(record), record_id)
+        current = self._entries.get(record_id)
+        if current == (key, entry):
+            return
+        self.discard(record_id)
+        insort(self._buckets.setdefault(key, []), entry)
+        self._entries[record_id] = (key, entry)
+
+    def discard(self, record_id: str) -> None:
+        """Remove a record from the index if present."""
+        current = self._entries.pop(record_id, None)
+        if current is None:
+            return
+        key, entry = current
+        bucket = self._buckets[key]
+        position = bisect_left(bucket, entry)
+        if position < len(bucket) and bucket[position] == entry:
+            del bucket[position]
+        if not bucket:
+            del self._buckets[key]
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        self._buckets.clear()
+        self._entries.clear()
+
+    def count(self, key: Hashable) -> int:
+        """Number of records indexed under `key`."""
+        return len(self._buckets.get(key, ()))
+
+    def ids(self, key: Hashable, offset: int = 0, limit: Optional[int] = None, reverse: bool = False) -> List[str]:
+        """IDs under `key` in `order`, newest last unless `reverse` is set."""
+        bucket = self._buckets.get(key, [])
+        if reverse:
+            start = len(bucket) - 1 - offset
+            stop = -1 if limit is None else max(start - limit, -1)
+            return [bucket[i][1] for i in range(start, stop, -1)]
+        stop = None if limit is None else offset + limit
+        return [record_id for _, record_id in bucket[offset:stop]]
@@ -0,0 +1,553 @@
+import functools
+import os
+import sqlite3
+import threading
+import zlib
+from contextlib import ExitStack, contextmanager, nullcontext
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+from pydantic import BaseModel
+from utils import codec
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks on Windows; a data dir there is safe for one process only
+    fcntl = None
+
+# Primary key and indexed columns for each table. Indexed columns are stored next to
+# the JSON payload so lookups by them hit an index instead of scanning every row.
+TABLES = {
+    "bookings": ("booking_id", ("rider_id", "driver_id", "status", "created_at")),
+    "cancellations": ("cancellation_id", ("booking_id", "rider_id", "driver_id", "created_at")),
+    "riders": ("rider_id", ()),
+    "drivers": ("driver_id", ()),
+}
+
+INDEXES = {
+    "bookings": (("rider_id", "status", "created_at"), ("driver_id",), ("status",)),
+    "cancellations": (("booking_id",), ("rider_id",), ("driver_id",)),
+    "riders": (),
+    "drivers": (),
+}
+
+DEFAULT_BACKEND = "json"
+
+DEFAULT_SHARDS = 256
+
+def file_signature(paths: Iterable[str]) -> Tuple:
+    """Modification time, size and inode of each path, None for missing files."""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            signature.append(None)
+            continue
+        # Atomic replaces swap the inode, so a rewrite is caught even within one mtime tick
+        signature.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+    return tuple(signature)
+
+class _HeldLock:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.depth = 0
+        # Holds taken by hold_file_lock, released from any thread
+        self.holds = 0
+        self.file = None
+
+    def unlock(self) -> None:
+        if self.depth == 0 and not self.holds and self.file is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+
+# One entry per lock file so nested and cross-thread use within a process stays re-entrant
+_held_locks: Dict[str, _HeldLock] = {}
+_held_locks_guard = threading.Lock()
+
+@contextmanager
+def file_lock(path: str, shared: bool = False):
+    """Hold an advisory lock on `path` across processes for the duration of the block.
+
+    The lock lives on a `.lock` sidecar so it survives atomic replaces of `path`.
+    Within a process it behaves like a re-entrant lock; a nested exclusive request
+    upgrades an outer shared one.
+    """
+    path = os.path.abspath(path)
+    with _held_locks_guard:
+        held = _held_locks.setdefault(path, _HeldLock())
+    with held.lock:
+        if fcntl is not None:
+            if held.file is None:
+                held.file = open(path + '.lock', 'a')
+                fcntl.flock(held.file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            elif not shared:
+                fcntl.flock(held.file.fileno(), fcntl.LOCK_EX)
+        held.depth += 1
+        try:
+            yield
+        finally:
+            held.depth -= 1
+            held.unlock()
+
+def hold_file_lock(path: str) -> None:
+    """Take the exclusive lock on `path` and keep it after returning, until `release_file_lock`.
+
+    The hold is not tied to the calling thread, so a background writer can
+    release it. Threads of this process still take `file_lock` as usual.
+    """
+    with file_lock(path):
+        _held_locks[os.path.abspath(path)].holds += 1
+
+def release_file_lock(path: str) -> None:
+    """Give up one hold taken by `hold_file_lock`."""
+    held = _held_locks[os.path.abspath(path)]
+    with held.lock:
+        held.holds -= 1
+        held.unlock()
+
+def synchronized(method):
+    """Run a manager method while holding the manager's re-entrant lock."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def mutation(*store_attrs: str):
+    """Run a manager method that changes records in the named stores.
+
+    The method holds the manager's lock and the stores' cross-process locks, always
+    taken in the order given, and sees other processes' writes first. Its
+    read-modify-write therefore cannot interleave with theirs; writes held back
+    past the method keep the locks until they go out (see BatchedWritesMixin).
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self._lock, ExitStack() as stack:
+                for store_attr in store_attrs:
+                    stack.enter_context(getattr(self, store_attr).lock())
+                self._sync()
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def dump_rows(records: Mapping[str, BaseModel], keys: Optional[Iterable[str]] = None) -> List[dict]:
+    """Raw rows for `keys` present in `records`, or for all of them.
+
+    Mappings that keep records as columns provide `rows()` and skip building models.
+    """
+    if hasattr(records, "rows"):
+        return records.rows(keys)
+    if keys is None:
+        return [record.model_dump() for record in records.values()]
+    return [records[key].model_dump() for key in keys if key in records]
+
+class RecordStore:
+    """Persistence backend for one table of records."""
+
+    # Whether get/find are served by the backend rather than by the manager's dicts
+    indexed = False
+
+    # Path whose cross-process lock guards the table, None if writes need no lock
+    lock_path: Optional[str] = None
+
+    def __init__(self, table: str):
+        self.table = table
+        self.key, self.columns = TABLES[table]
+
+    def signature(self) -> Tuple:
+        """Value that changes whenever any writer modifies the table."""
+        raise NotImplementedError
+
+    def load(self) -> List[dict]:
+        """Return every stored record."""
+        raise NotImplementedError
+
+    def lock(self):
+        """Context manager excluding other processes' writes to the table."""
+        return nullcontext() if self.lock_path is None else file_lock(self.lock_path)
+
+    def save(self, records: Mapping[str, BaseModel], changed: Optional[Iterable[str]] = None) -> bool:
+        """Persist `records`; `changed` names the keys modified since the last save.
+
+        Returns True if records written by another process had to be merged in,
+        meaning the caller's in-memory copy is missing them.
+        """
+        raise NotImplementedError
+
+    def delete(self, keys: Iterable[str]) -> None:
+        """Remove the records with the given primary keys."""
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return a single record by primary key."""
+        raise NotImplementedError
+
+    def find(self, order_by: Optional[str] = None, descending: bool = False,
+             limit: Optional[int] = None, offset: int = 0, **filters) -> List[dict]:
+        """Return the records whose indexed columns equal `filters`, optionally sorted and paged."""
+        raise NotImplementedError
+
+    def count(self, **filters) -> int:
+        """Count the records whose indexed columns equal `filters`."""
+        raise NotImplementedError
+
+class JsonRecordStore(RecordStore):
+    """Whole-table JSON array file, rewritten on every save.
+
+    Saves hold an exclusive file lock. If another process rewrote the file since
+    this store last read or wrote it, the changed records are merged into the
+    current file instead of overwriting it with this process's copy.
+    """
+
+    def __init__(self, table: str, path: str, indent: Optional[int] = None, atomic: bool = True):
+        super().__init__(table)
+        self.path = path
+        self.indent = indent
+        self.atomic = atomic
+        self.lock_path = path
+        # Signature of the file as of our last load or save
+        self._seen = None
+
+    def signature(self) -> Tuple:
+        return file_signature([self.path])
+
+    def load(self) -> List[dict]:
+        self._seen = self.signature()
+        try:
+            with open(self.path, 'rb') as f:
+                content = f.read().strip()
+        except FileNotFoundError:
+            return []
+        if not content:
+            return []
+        try:
+            return codec.loads(content)
+        except ValueError:
+            return []
+
+    def save(self, records: Mapping[str, BaseModel], changed: Optional[Iterable[str]] = None) -> bool:
+        with self.lock():
+            merged = self.signature() != self._seen
+            if not merged:
+                rows = dump_rows(records)
+            else:
+                current = {row[self.key]: row for row in self.load()}
+                for row in dump_rows(records, changed):
+                    current[row[self.key]] = row
+                rows = list(current.values())
+            self._write(codec.dumps(rows, indent=self.indent))
+            self._seen = self.signature()
+        return merged
+
+    def delete(self, keys: Iterable[str]) -> None:
+        keys = set(keys)
+        if not keys:
+            return
+        with self.lock():
+            rows = [row for row in self.load() if row[self.key] not in keys]
+            self._write(codec.dumps(rows, indent=self.indent))
+            self._seen = self.signature()
+
+    def _write(self, data: bytes) -> None:
+        if not self.atomic:
+            with open(self.path, 'wb') as f:
+                f.write(data)
+            return
+
+        temp_file = self.path + '.tmp'
+        try:
+            with open(temp_file, 'wb') as f:
+                f.write(data)
+            os.replace(temp_file, self.path)
+        except Exception:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
+class ShardedJsonRecordStore(RecordStore):
+    """Table split across many small JSON files by a CRC32 hash of the primary key.
+
+    A record's shard is computed from its key, so there is no key-to-shard index
+    to store or keep in sync. A save rewrites only the shards holding changed
+    records, each under its own lock and merged into what is on disk. A version
+    file bumped by every save keeps change detection to a single stat however
+    many shards there are.
+    """
+
+    def __init__(self, table: str, directory: str, shards: int = DEFAULT_SHARDS, indent: Optional[int] = None):
+        super().__init__(table)
+        self.directory = directory
+        self.indent = indent
+        self.version_file = os.path.join(directory, "version")
+        self.lock_path = directory
+        os.makedirs(directory, exist_ok=True)
+        self.shards = self._shard_count(shards)
+        # Signatures of each shard and of the version file as of our last read or write
+        self._seen: Dict[int, Tuple] = {}
+        self._version_seen = None
+
+    def _shard_count(self, shards: int) -> int:
+        # The count is fixed when the directory is created; changing it would move every key
+        meta_file = os.path.join(self.directory, "shards.json")
+        with file_lock(meta_file):
+            try:
+                with open(meta_file, 'rb') as f:
+                    return codec.loads(f.read())["shards"]
+            except FileNotFoundError:
+                with open(meta_file, 'wb') as f:
+                    f.write(codec.dumps({"shards": shards}))
+                return shards
+
+    def shard_of(self, key: str) -> int:
+        """Shard number holding `key`."""
+        return zlib.crc32(key.encode()) % self.shards
+
+    def _path(self, shard: int) -> str:
+        return os.path.join(self.directory, f"{shard:04d}.json")
+
+    def signature(self) -> Tuple:
+        return file_signature([self.version_file])
+
+    def is_empty(self) -> bool:
+        """Check whether no shard has been written yet."""
+        return not any(os.path.exists(self._path(shard)) for shard in range(self.shards))
+
+    def _read(self, shard: int) -> List[dict]:
+        path = self._path(shard)
+        self._seen[shard] = file_signature([path])
+        try:
+            with open(path, 'rb') as f:
+                content = f.read().strip()
+        except FileNotFoundError:
+            return []
+        if not content:
+            return []
+        try:
+            return codec.loads(content)
+        except ValueError:
+            return []
+
+    def _write(self, shard: int, rows: List[dict]) -> None:
+        path = self._path(shard)
+        temp_file = path + '.tmp'
+        with open(temp_file, 'wb') as f:
+            f.write(codec.dumps(rows, indent=self.indent))
+        os.replace(temp_file, path)
+        self._seen[shard] = file_signature([path])
+
+    def _bump_version(self) -> bool:
+        """Record a write; returns whether another writer bumped the version since we last looked."""
+        with file_lock(self.version_file):
+            changed_elsewhere = self.signature() != self._version_seen
+            try:
+                with open(self.version_file, 'rb') as f:
+                    version = int(f.read() or 0)
+            except (FileNotFoundError, ValueError):
+                version = 0
+            temp_file = self.version_file + '.tmp'
+            with open(temp_file, 'wb') as f:
+                f.write(str(version + 1).encode())
+            os.replace(temp_file, self.version_file)
+            self._version_seen = self.signature()
+        return changed_elsewhere
+
+    def load(self) -> List[dict]:
+        self._version_seen = self.signature()
+        rows = []
+        for shard in range(self.shards):
+            rows.extend(self._read(shard))
+        return rows
+
+    def save(self, records: Mapping[str, BaseModel], changed: Optional[Iterable[str]] = None) -> bool:
+        return self.upsert(dump_rows(records, changed))
+
+    def upsert(self, rows: List[dict]) -> bool:
+        """Merge raw records into their shards; returns whether any shard had changed on disk."""
+        by_shard: Dict[int, List[dict]] = {}
+        for row in rows:
+            by_shard.setdefault(self.shard_of(row[self.key]), []).append(row)
+        return self._rewrite(by_shard, lambda current, shard_rows: current.update(
+            (row[self.key], row) for row in shard_rows))
+
+    def delete(self, keys: Iterable[str]) -> None:
+        by_shard: Dict[int, List[str]] = {}
+        for key in keys:
+            by_shard.setdefault(self.shard_of(key), []).append(key)
+        self._rewrite(by_shard, lambda current, shard_keys: [current.pop(key, None) for key in shard_keys])
+
+    def _rewrite(self, by_shard: Dict[int, list], apply) -> bool:
+        merged = False
+        for shard, items in by_shard.items():
+            path = self._path(shard)
+            with file_lock(path):
+                merged = merged or file_signature([path]) != self._seen.get(shard)
+                current = {row[self.key]: row for row in self._read(shard)}
+                apply(current, items)
+                self._write(shard, list(current.values()))
+        if by_shard and self._bump_version():
+            merged = True
+        return merged
+
+class SQLiteRecordStore(RecordStore):
+    """Table in a shared SQLite database running in WAL mode.
+
+    Several processes can open the same database file; readers never block the
+    single writer, and every save only upserts the rows that changed.
+    """
+
+    indexed = True
+
+    _connections: Dict[str, Tuple[sqlite3.Connection, threading.RLock]] = {}
+    _connections_lock = threading.Lock()
+
+    def __init__(self, table: str, db_file: str):
+        super().__init__(table)
+        self.db_file = db_file
+        # Rows are written atomically already; the lock only serializes read-modify-write cycles
+        self.lock_path = f"{db_file}.{table}"
+        self.conn, self._lock = self._connect(db_file)
+        self._create_table()
+
+    def signature(self) -> Tuple:
+        with self._lock:
+            row = self.conn.execute("SELECT version FROM table_versions WHERE name = ?", (self.table,)).fetchone()
+        return (row[0] if row else 0,)
+
+    @classmethod
+    def _connect(cls, db_file: str) -> Tuple[sqlite3.Connection, threading.RLock]:
+        # One connection per database file per process, shared by every table and
+        # guarded by one lock so transactions from different threads never interleave
+        with cls._connections_lock:
+            if db_file not in cls._connections:
+                conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None, timeout=30)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                cls._connections[db_file] = (conn, threading.RLock())
+            return cls._connections[db_file]
+
+    def _create_table(self) -> None:
+        columns = "".join(f", {column} TEXT" for column in self.columns)
+        with self._lock:
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                f"({self.key} TEXT PRIMARY KEY{columns}, data TEXT NOT NULL)"
+            )
+            for index in INDEXES[self.table]:
+                name = f"idx_{self.table}_{'_'.join(index)}"
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {self.table} ({', '.join(index)})")
+            # Bumped by every write so other processes can tell when to reload
+            self.conn.execute("CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+    def load(self) -> List[dict]:
+        with self._lock:
+            rows = self.conn.execute(f"SELECT data FROM {self.table} ORDER BY rowid").fetchall()
+        return [codec.loads(row[0]) for row in rows]
+
+    def save(self, records: Mapping[str, BaseModel], changed: Optional[Iterable[str]] = None) -> bool:
+        self.upsert(dump_rows(records, changed))
+        # Rows are upserted individually, so nothing written elsewhere is overwritten
+        return False
+
+    def upsert(self, rows: List[dict]) -> None:
+        """Insert or update raw records in one transaction."""
+        if not rows:
+            return
+
+        names = (self.key, *self.columns, "data")
+        placeholders = ", ".join("?" * len(names))
+        updates = ", ".join(f"{name} = excluded.{name}" for name in names[1:])
+        values = [(row[self.key], *(row.get(column) for column in self.columns), codec.dumps(row).decode()) for row in rows]
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    f"INSERT INTO {self.table} ({', '.join(names)}) VALUES ({placeholders}) "
+                    f"ON CONFLICT({self.key}) DO UPDATE SET {updates}",
+                    values
+                )
+                self._bump_version()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        if not keys:
+            return
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(f"DELETE FROM {self.table} WHERE {self.key} = ?", [(key,) for key in keys])
+                self._bump_version()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _bump_version(self) -> None:
+        self.conn.execute(
+            "INSERT INTO table_versions (name, version) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+            (self.table,)
+        )
+
+    def is_empty(self) -> bool:
+        """Check whether the table has no rows yet."""
+        with self._lock:
+            return self.conn.execute(f"SELECT 1 FROM {self.table} LIMIT 1").fetchone() is None
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self.conn.execute(f"SELECT data FROM {self.table} WHERE {self.key} = ?", (key,)).fetchone()
+        return codec.loads(row[0]) if row else None
+
+    def find(self, order_by: Optional[str] = None, descending: bool = False,
+             limit: Optional[int] = None, offset: int = 0, **filters) -> List[dict]:
+        where, params = self._where(filters)
+        order = "rowid"
+        if order_by is not None:
+            self._check_column(order_by)
+            order = f"{order_by} {'DESC' if descending else 'ASC'}, {self.key} {'DESC' if descending else 'ASC'}"
+        query = f"SELECT data FROM {self.table} WHERE {where} ORDER BY {order}"
+        if limit is not None or offset:
+            query += " LIMIT ? OFFSET ?"
+            params += (-1 if limit is None else limit, offset)
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [codec.loads(row[0]) for row in rows]
+
+    def count(self, **filters) -> int:
+        where, params = self._where(filters)
+        with self._lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM {self.table} WHERE {where}", params).fetchone()[0]
+
+    def _check_column(self, column: str) -> None:
+        if column != self.key and column not in self.columns:
+            raise ValueError(f"Column {column} is not indexed on {self.table}")
+
+    def _where(self, filters: Dict[str, str]) -> Tuple[str, tuple]:
+        for column in filters:
+            self._check_column(column)
+        return " AND ".join(f"{column} = ?" for column in filters) or "1", tuple(filters.values())
+
+def open_store(table: str, storage_dir: str, backend: Optional[str] = None, **json_options) -> RecordStore:
+    """Open the store for `table`; the backend defaults to the STORAGE_BACKEND env var."""
+    backend = backend or os.getenv("STORAGE_BACKEND", DEFAULT_BACKEND)
+    os.makedirs(storage_dir, exist_ok=True)
+    if backend == "json":
+        return JsonRecordStore(table, os.path.join(storage_dir, f"{table}.json"), **json_options)
+    if backend == "sqlite":
+        store = SQLiteRecordStore(table, os.path.join(storage_dir, "store.db"))
+    elif backend == "sharded":
+        store = ShardedJsonRecordStore(table, os.path.join(storage_dir, "shards", table),
+                                       indent=json_options.get("indent"))
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    if store.is_empty():
+        # First run against an existing data dir: import the JSON table once
+        store.upsert(JsonRecordStore(table, os.path.join(storage_dir, f"{table}.json")).load())
+    return store